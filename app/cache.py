@@ -0,0 +1,188 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Set, Tuple
+
+# Lookup states returned by TTLCache.lookup
+FRESH = "fresh"
+STALE = "stale"
+MISS = "miss"
+
+
+
+
+class CacheEntry:
+    """
+    A cached value, or a cached error for negative caching.
+
+    Attributes:
+        value: The cached value (None for negative entries)
+        error: Builds the exception raised on lookup (None for positive entries).
+            Every lookup raises a new exception, so that the entry does not
+            hold on to the tracebacks of earlier callers
+        expires_at: Monotonic time after which the entry is stale
+    """
+    __slots__ = ("value", "error", "expires_at")
+
+    def __init__(self, value: Any, error: Optional[Callable[[], BaseException]], expires_at: float):
+        self.value = value
+        self.error = error
+        self.expires_at = expires_at
+
+    def result(self) -> Any:
+        """
+        Return the cached value, or raise a new instance of the cached error.
+
+        Returns:
+            The cached value.
+        """
+        if self.error is not None:
+            raise self.error()
+        return self.value
+
+
+
+
+class TTLCache:
+    """
+    A bounded, thread-safe in-process cache with a TTL per entry and LRU eviction.
+
+    Entries that expired less than `grace_seconds` ago are still returned as
+    stale, so that callers can serve them while a single background refresh
+    runs (see `begin_refresh` / `end_refresh`).
+
+    Attributes:
+        max_entries: Maximum number of entries kept before evicting the least recently used
+        grace_seconds: How long an expired entry may still be served as stale
+    """
+    def __init__(self, max_entries: int = 1024, grace_seconds: float = 0.0):
+        if max_entries < 1:
+            raise ValueError("The 'max_entries' parameter must be a positive integer.")
+        self.max_entries = max_entries
+        self.grace_seconds = grace_seconds
+        self._entries: "OrderedDict[Hashable, CacheEntry]" = OrderedDict()
+        self._refreshing: Set[Hashable] = set()
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "stale_hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+    def lookup(self, key: Hashable) -> Tuple[str, Optional[CacheEntry]]:
+        """
+        Look up a key.
+
+        Args:
+            key: The cache key
+
+        Returns:
+            A (state, entry) tuple where state is FRESH, STALE or MISS,
+            and entry is None on a miss.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._counters["misses"] += 1
+                return MISS, None
+            if now < entry.expires_at:
+                self._entries.move_to_end(key)
+                self._counters["hits"] += 1
+                return FRESH, entry
+            if now < entry.expires_at + self.grace_seconds:
+                self._entries.move_to_end(key)
+                self._counters["stale_hits"] += 1
+                return STALE, entry
+            del self._entries[key]
+            self._counters["expirations"] += 1
+            self._counters["misses"] += 1
+            return MISS, None
+
+    def set(self, key: Hashable, value: Any, ttl: float, error: Optional[Callable[[], BaseException]] = None) -> None:
+        """
+        Store a value (or an error, for negative caching) under a key.
+
+        Args:
+            key: The cache key
+            value: The value to cache
+            ttl: Time to live in seconds
+            error: Optional function building the exception to raise instead of returning a value
+        """
+        entry = CacheEntry(value, error, time.monotonic() + ttl)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters["evictions"] += 1
+
+    def begin_refresh(self, key: Hashable) -> bool:
+        """
+        Claim the background refresh of a stale key.
+
+        Args:
+            key: The cache key
+
+        Returns:
+            True if the caller should refresh the key, False if a refresh is already running.
+        """
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            return True
+
+    def end_refresh(self, key: Hashable) -> None:
+        """
+        Release a refresh claimed with `begin_refresh`.
+
+        Args:
+            key: The cache key
+        """
+        with self._lock:
+            self._refreshing.discard(key)
+
+    def invalidate(self, key: Hashable) -> None:
+        """
+        Remove a key from the cache if present.
+
+        Args:
+            key: The cache key
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def invalidate_matching(self, predicate: Callable[[Hashable], bool]) -> int:
+        """
+        Remove every key matching a predicate.
+
+        Args:
+            predicate: Function returning True for the keys to remove
+
+        Returns:
+            The number of removed entries.
+        """
+        with self._lock:
+            keys = [key for key in self._entries if predicate(key)]
+            for key in keys:
+                del self._entries[key]
+        return len(keys)
+
+    def clear(self) -> None:
+        """
+        Remove every entry from the cache.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the cache counters.
+
+        Returns:
+            A dictionary with hit/miss/eviction counters, the current size and the hit ratio.
+        """
+        with self._lock:
+            stats: Dict[str, Any] = dict(self._counters)
+            stats["size"] = len(self._entries)
+        stats["max_entries"] = self.max_entries
+        lookups = stats["hits"] + stats["stale_hits"] + stats["misses"]
+        stats["hit_ratio"] = (stats["hits"] + stats["stale_hits"]) / lookups if lookups else 0.0
+        return stats
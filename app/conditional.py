@@ -0,0 +1,82 @@
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Dict, Optional, Tuple
+from fastapi import Request, Response
+
+################################################################################
+# Conditional GETs. The validators of a resource come from the change log:
+# the sequence number of the latest change of its table or location is its
+# version, so checking a poll costs one indexed lookup, and an unchanged
+# resource is answered with a 304 before its query runs or anything is
+# serialized. The version is read before the resource, so a change made in
+# between is sent again on the next poll rather than missed. Last-Modified only
+# has a one-second resolution, so it is left out while the latest change is
+# from the current second: another change in the same second would not move it.
+################################################################################
+# Clients and shared caches may store the responses, but must revalidate them
+CACHE_CONTROL = "no-cache"
+
+
+
+
+def validators(tag: str, version: Tuple[int, Optional[datetime]]) -> Dict[str, str]:
+    """
+    Build the validator headers of a resource version.
+
+    Args:
+        tag: Name of the versioned resource, e.g. 'locations' or 'location-3'
+        version: The latest change sequence number and its time (naive UTC), as
+            returned by `crud.get_version`
+
+    Returns:
+        The strong ETag, Last-Modified (when anything changed before the
+        current second) and Cache-Control headers.
+    """
+    sequence, changed_at = version
+    headers = {"ETag": f'"{tag}-{sequence}"', "Cache-Control": CACHE_CONTROL}
+    second = datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+    if changed_at is not None and changed_at < second:
+        headers["Last-Modified"] = format_datetime(changed_at.replace(tzinfo=timezone.utc), usegmt=True)
+    return headers
+
+
+def is_not_modified(request: Request, headers: Dict[str, str]) -> bool:
+    """
+    Evaluate the If-None-Match and If-Modified-Since headers of a request.
+    If-Modified-Since is ignored when If-None-Match is present.
+
+    Args:
+        request: The request
+        headers: The validator headers of the current version of the resource
+
+    Returns:
+        True when the client's copy is current and a 304 can be answered.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # Weak comparison: a W/ prefix added by an intermediary still matches
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return "*" in tags or headers["ETag"] in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is None or "Last-Modified" not in headers:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    return parsedate_to_datetime(headers["Last-Modified"]) <= since
+
+
+def not_modified(headers: Dict[str, str]) -> Response:
+    """
+    Build a 304 response.
+
+    Args:
+        headers: The validator headers of the current version of the resource
+
+    Returns:
+        Response: An empty 304 response carrying the validators.
+    """
+    return Response(status_code=304, headers=headers)
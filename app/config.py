@@ -0,0 +1,108 @@
+import os
+import threading
+from functools import lru_cache
+from typing import Any, Callable, Optional
+
+################################################################################
+# Environment settings. The .env file is read once per process, on the first
+# setting looked up, instead of by every module at import time. Modules group
+# their settings in a class of `Setting` attributes, each read on first access,
+# and build the objects configured by them with `Lazy`, so that importing the
+# app does not touch the .env file. Variables already set in the environment
+# take precedence over the .env file.
+################################################################################
+@lru_cache(maxsize=None)
+def load() -> None:
+    """
+    Load the .env file into the environment, once per process.
+    """
+    from dotenv import load_dotenv
+    load_dotenv()
+
+
+def env(name: str, default: Optional[str] = None) -> Optional[str]:
+    """
+    Read a setting from the environment or the .env file.
+
+    Args:
+        name: Name of the environment variable
+        default: Value returned when the variable is not set
+
+    Returns:
+        The value of the variable, or the default.
+    """
+    load()
+    return os.getenv(name, default)
+
+
+def flag(value: str) -> bool:
+    """
+    Parse a boolean setting.
+
+    Args:
+        value: The value of the variable
+
+    Returns:
+        True if the value is '1', 'true' or 'yes' (case-insensitive).
+    """
+    return value.lower() in ("1", "true", "yes")
+
+
+
+
+class Setting:
+    """
+    A setting of a settings class, read from the environment or the .env file
+    when first accessed and then kept by the settings instance, which may also
+    be assigned a value at runtime.
+
+    Attributes:
+        name: Name of the environment variable
+        default: Value used when the variable is not set
+        parse: Function converting the variable to the setting value
+    """
+    def __init__(self, name: str, default: Any = None, parse: Callable[[str], Any] = str):
+        self.name = name
+        self.default = default
+        self.parse = parse
+        self.attribute = name
+
+    def __set_name__(self, owner: type, attribute: str) -> None:
+        self.attribute = attribute
+
+    def __get__(self, settings: Any, owner: Optional[type] = None) -> Any:
+        if settings is None:
+            return self
+        value = env(self.name)
+        value = self.default if value is None else self.parse(value)
+        settings.__dict__[self.attribute] = value
+        return value
+
+
+
+
+class Lazy:
+    """
+    A module-level object built on first attribute access, for objects
+    configured by settings. Attribute lookups are forwarded to the object.
+    """
+    def __init__(self, factory: Callable[[], Any]):
+        self._factory = factory
+        self._target: Any = None
+        self._lock = threading.Lock()
+
+    def get(self) -> Any:
+        """
+        Get the object, building it on first use.
+
+        Returns:
+            The object returned by the factory.
+        """
+        if self._target is None:
+            with self._lock:
+                if self._target is None:
+                    self._target = self._factory()
+        return self._target
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.get(), name)
@@ -1,7 +1,70 @@
-from typing import Optional, List, Dict, Any
-from datetime import date
+from typing import Optional, List, Dict, Any, Iterator, Tuple
+from datetime import date, datetime, timedelta
+from sqlalchemy import select, insert, func, cast, null, literal_column, Date, Row, Select
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import Session
-from .database_model import WeatherLocation, WeatherInfo
+from .database_model import WeatherLocation, WeatherInfo, ChangeLog, VideoCache, ForecastSnapshot, utcnow
+from .info_cache import InfoSnapshot, info_cache, INFO_CACHE_MAX_RANGE_DAYS
+from .spatial import location_index
+
+# Columns of the plain rows returned with `as_rows=True`, in the order of the API fields
+LOCATION_COLUMNS = (
+    WeatherLocation.id, WeatherLocation.city, WeatherLocation.country,
+    WeatherLocation.lat, WeatherLocation.lon, WeatherLocation.updated_at,
+)
+INFO_COLUMNS = (
+    WeatherInfo.id, WeatherInfo.location_id, WeatherInfo.date,
+    WeatherInfo.temperature, WeatherInfo.weather_description, WeatherInfo.updated_at,
+)
+
+# Key of the PostgreSQL advisory lock taken by the writers of the change log
+CHANGE_LOG_LOCK_KEY = 0x7765617468
+
+
+def _insert(db: Session, model):
+    """
+    Build a dialect-specific INSERT statement supporting ON CONFLICT clauses.
+    
+    Args:
+        db: Database session
+        model: The mapped class to insert into
+        
+    Returns:
+        An INSERT statement for SQLite or PostgreSQL.
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert(model)
+    if dialect == "sqlite":
+        return sqlite.insert(model)
+    raise NotImplementedError(f"Bulk upserts are not supported on '{dialect}' databases.")
+
+
+def _log_changes(db: Session, table_name: str, operation: str, rows: List[Tuple[int, Optional[int]]]) -> None:
+    """
+    Append entries to the change log, in the caller's transaction.
+
+    Readers treat the latest sequence number they saw as a watermark, so the
+    sequence must follow the commit order. SQLite serializes write transactions
+    already. On PostgreSQL, a transaction could draw a lower number from the
+    sequence but commit after a higher one was read, and be skipped by
+    `list_changes` or hidden behind a 304 by `get_version`. Writers therefore
+    take a transaction-level advisory lock, held until they commit, before
+    drawing their numbers.
+    
+    Args:
+        db: Database session
+        table_name: Name of the changed table
+        operation: 'upsert' or 'delete'
+        rows: (row ID, location ID) pairs of the changed rows
+    """
+    if rows:
+        if db.get_bind().dialect.name == "postgresql":
+            db.execute(select(func.pg_advisory_xact_lock(CHANGE_LOG_LOCK_KEY)))
+        db.execute(insert(ChangeLog), [
+            {"table_name": table_name, "row_id": row_id, "location_id": location_id, "operation": operation}
+            for row_id, location_id in rows
+        ])
 
 ################################################################################
 # WeatherLocation CRUD operations
@@ -28,11 +91,45 @@ def create_location(
     """
     db_loc = WeatherLocation(city=city, country=country, lat=lat, lon=lon)
     db.add(db_loc)
+    db.flush()
+    _log_changes(db, "locations", "upsert", [(db_loc.id, db_loc.id)])
     db.commit()
     db.refresh(db_loc)
+    if lat is not None and lon is not None:
+        location_index.add(db_loc.id, lat, lon)
     return db_loc
 
 
+def create_locations(db: Session, locations: List[Dict[str, Any]]) -> List[Row]:
+    """
+    Create several WeatherLocation records with one INSERT statement and one commit.
+    
+    Args:
+        db: Database session
+        locations: Dictionaries with the keys 'city' and optionally 'country', 'lat' and 'lon'
+        
+    Returns:
+        (id, city, country, lat, lon) rows of the created locations, in no particular order.
+    """
+    if not locations:
+        return []
+    created = db.execute(
+        insert(WeatherLocation).returning(
+            WeatherLocation.id, WeatherLocation.city, WeatherLocation.country, WeatherLocation.lat, WeatherLocation.lon
+        ),
+        [
+            {"city": loc["city"], "country": loc.get("country"), "lat": loc.get("lat"), "lon": loc.get("lon")}
+            for loc in locations
+        ]
+    ).all()
+    _log_changes(db, "locations", "upsert", [(row.id, row.id) for row in created])
+    db.commit()
+    for row in created:
+        if row.lat is not None and row.lon is not None:
+            location_index.add(row.id, row.lat, row.lon)
+    return created
+
+
 def get_location(db: Session, loc_id: int) -> Optional[WeatherLocation]:
     """
     Retrieve a single location by ID.
@@ -65,28 +162,86 @@ def get_location_by_city(db: Session, city: str, country: Optional[str] = None)
     return query.first()
 
 
-def list_locations(db: Session, skip: int = 0, limit: int = -1) -> List[WeatherLocation]:
+def get_locations(db: Session, loc_ids: List[int]) -> List[WeatherLocation]:
     """
-    List stored locations with pagination.
+    Retrieve several locations by ID with a single query.
+    
+    Args:
+        db: Database session
+        loc_ids: IDs of the locations to retrieve
+        
+    Returns:
+        A list of the WeatherLocation database objects found, ordered by ID.
+    """
+    if not loc_ids:
+        return []
+    return db.scalars(
+        select(WeatherLocation).where(WeatherLocation.id.in_(loc_ids)).order_by(WeatherLocation.id)
+    ).all()
+
+
+def get_locations_by_cities(db: Session, cities: List[str]) -> List[WeatherLocation]:
+    """
+    Retrieve every location of several cities with a single IN query.
+    
+    Args:
+        db: Database session
+        cities: The names of the cities to look up
+        
+    Returns:
+        A list of WeatherLocation database objects, ordered by ID.
+    """
+    if not cities:
+        return []
+    return db.scalars(
+        select(WeatherLocation).where(WeatherLocation.city.in_(set(cities))).order_by(WeatherLocation.id)
+    ).all()
+
+
+def list_locations(db: Session, skip: int = 0, limit: int = -1, as_rows: bool = False) -> List[WeatherLocation]:
+    """
+    List stored locations with pagination, ordered by ID.
     
     Args:
         db: Database session
         skip: Number of records to skip (for pagination)
         limit: Maximum number of records to return. If -1, return all records.  
+        as_rows: Whether to return plain rows of LOCATION_COLUMNS, skipping the ORM
     
     Returns:
-        A list of WeatherLocation database objects.
+        A list of WeatherLocation database objects, or rows with `as_rows`.
     """
     if limit < -1:
         raise ValueError("The 'limit' parameter must be -1 or a non-negative integer.")
+    query = (db.query(*LOCATION_COLUMNS) if as_rows else db.query(WeatherLocation)).order_by(WeatherLocation.id)
     if limit == -1:
-        return db.query(WeatherLocation).offset(skip).all()
-    return db.query(WeatherLocation).offset(skip).limit(limit).all()
+        return query.offset(skip).all()
+    return query.offset(skip).limit(limit).all()
+
+
+def list_locations_after(db: Session, after_id: Optional[int], limit: int, as_rows: bool = False) -> List[WeatherLocation]:
+    """
+    List stored locations with keyset pagination: the cost of a page does not
+    depend on how deep it is.
+    
+    Args:
+        db: Database session
+        after_id: ID of the last location of the previous page, or None for the first page
+        limit: Maximum number of records to return
+        as_rows: Whether to return plain rows of LOCATION_COLUMNS, skipping the ORM
+    
+    Returns:
+        A list of WeatherLocation database objects (or rows with `as_rows`), ordered by ID.
+    """
+    query = db.query(*LOCATION_COLUMNS) if as_rows else db.query(WeatherLocation)
+    if after_id is not None:
+        query = query.filter(WeatherLocation.id > after_id)
+    return query.order_by(WeatherLocation.id).limit(limit).all()
 
 
 def delete_location(db: Session, loc_id: int) -> Optional[WeatherLocation]:
     """
-    Delete a location and its info.
+    Delete a location. Its infos are kept, detached from the location.
     
     Args:
         db: Database session
@@ -98,11 +253,35 @@ def delete_location(db: Session, loc_id: int) -> Optional[WeatherLocation]:
     loc = db.query(WeatherLocation).get(loc_id)
     if not loc:
         return None
+    _log_changes(db, "weather_info", "upsert", [(info.id, loc_id) for info in loc.info])
+    _log_changes(db, "locations", "delete", [(loc_id, loc_id)])
+    db.query(VideoCache).filter(VideoCache.location_id == loc_id).delete(synchronize_session=False)
+    db.query(ForecastSnapshot).filter(ForecastSnapshot.location_id == loc_id).delete(synchronize_session=False)
     db.delete(loc)
     db.commit()
+    location_index.remove(loc_id)
+    info_cache.invalidate_location(loc_id)
     return loc
 
 
+def load_location_index(db: Session) -> int:
+    """
+    Rebuild the in-memory spatial index from the stored locations with coordinates.
+    
+    Args:
+        db: Database session
+        
+    Returns:
+        The number of indexed locations.
+    """
+    rows = db.execute(
+        select(WeatherLocation.id, WeatherLocation.lat, WeatherLocation.lon)
+        .where(WeatherLocation.lat.is_not(None), WeatherLocation.lon.is_not(None))
+    ).all()
+    location_index.rebuild(rows)
+    return len(rows)
+
+
 
 
 ################################################################################
@@ -143,11 +322,98 @@ def create_info(
         location=location
     )
     db.add(db_info)
+    db.flush()
+    _log_changes(db, "weather_info", "upsert", [(db_info.id, location_id)])
     db.commit()
+    info_cache.invalidate([(location_id, info_date)])
     db.refresh(db_info)
     return db_info
 
 
+def upsert_infos(
+    db: Session,
+    location_id: int,
+    rows: List[Dict[str, Any]],
+    update_existing: bool = False
+) -> int:
+    """
+    Store weather infos of several dates for a location in one transaction.
+    By default dates already stored are left untouched; the missing ones are
+    written with a single INSERT ... ON CONFLICT DO NOTHING statement and one
+    commit. With `update_existing`, stored dates are overwritten by the same
+    statement (ON CONFLICT DO UPDATE) instead.
+    
+    Args:
+        db: Database session
+        location_id: ID of the location
+        rows: Dictionaries with the keys 'date', 'temperature' and 'weather_description'
+        update_existing: Whether to overwrite the infos of dates already stored
+        
+    Returns:
+        The number of weather infos inserted or updated.
+    """
+    return bulk_upsert_infos(db, {location_id: rows}, update_existing=update_existing)
+
+
+def bulk_upsert_infos(
+    db: Session,
+    rows_by_location: Dict[int, List[Dict[str, Any]]],
+    update_existing: bool = False
+) -> int:
+    """
+    Store weather infos of several locations and dates in one transaction,
+    with the same semantics as `upsert_infos`. The transaction also commits
+    what the caller wrote before in the session, e.g. forecast snapshots saved
+    with `commit=False`.
+    
+    Args:
+        db: Database session
+        rows_by_location: Rows to store keyed by location ID, each a dictionary
+            with the keys 'date', 'temperature' and 'weather_description'
+        update_existing: Whether to overwrite the infos of dates already stored
+        
+    Returns:
+        The number of weather infos inserted or updated.
+    """
+    # A (location, date) pair given twice is written once, with its last row
+    pending = {
+        (location_id, row["date"]): row
+        for location_id, rows in rows_by_location.items()
+        for row in rows
+    }
+    written = []
+    if pending:
+        values = [
+            {
+                "location_id": location_id,
+                "date": info_date,
+                "temperature": row["temperature"],
+                "weather_description": row.get("weather_description"),
+            }
+            for (location_id, info_date), row in pending.items()
+        ]
+        stmt = _insert(db, WeatherInfo).values(values)
+        if update_existing:
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["location_id", "date"],
+                set_={
+                    "temperature": stmt.excluded.temperature,
+                    "weather_description": stmt.excluded.weather_description,
+                    "updated_at": stmt.excluded.updated_at,
+                }
+            )
+        else:
+            stmt = stmt.on_conflict_do_nothing(index_elements=["location_id", "date"])
+        # Dates already stored are skipped by the statement itself and not returned
+        written = db.execute(stmt.returning(WeatherInfo.id, WeatherInfo.location_id, WeatherInfo.date)).all()
+        _log_changes(db, "weather_info", "upsert", [(info_id, location_id) for info_id, location_id, _ in written])
+    # Commit even when nothing was written, for the changes the caller made before
+    db.commit()
+    if written:
+        info_cache.invalidate([(location_id, info_date) for _, location_id, info_date in written])
+    return len(written)
+
+
 def get_info(db: Session, info_id: int) -> Optional[WeatherInfo]:
     """
     Retrieve a single weather info by ID.
@@ -165,33 +431,156 @@ def get_info(db: Session, info_id: int) -> Optional[WeatherInfo]:
 def list_infos(
     db: Session,
     skip: int = 0,
-    limit: int = -1
+    limit: int = -1,
+    as_rows: bool = False
 ) -> List[WeatherInfo]:
     """
-    List all weather info with pagination.
+    List all weather info with pagination, ordered by ID.
     
     Args:
         db: Database session
         skip: Number of records to skip 
         limit: Maximum number of records to return. If -1, return all records.
+        as_rows: Whether to return plain rows of INFO_COLUMNS, skipping the ORM
         
     Returns:
-        A list of WeatherInfo database objects.
+        A list of WeatherInfo database objects, or rows with `as_rows`.
     """
     if limit < -1:
         raise ValueError("The 'limit' parameter must be -1 or a non-negative integer.")
+    query = (db.query(*INFO_COLUMNS) if as_rows else db.query(WeatherInfo)).order_by(WeatherInfo.id)
     if limit == -1:
-        return db.query(WeatherInfo).offset(skip).all()
-    return db.query(WeatherInfo).offset(skip).limit(limit).all()
+        return query.offset(skip).all()
+    return query.offset(skip).limit(limit).all()
+
+
+def list_infos_after(db: Session, after_id: Optional[int], limit: int, as_rows: bool = False) -> List[WeatherInfo]:
+    """
+    List weather infos with keyset pagination on the primary key. Infos
+    detached from a deleted location have no location ID, so the ID is the
+    only key that orders every row the same way on SQLite and PostgreSQL.
+    
+    Args:
+        db: Database session
+        after_id: ID of the last weather info of the previous page, or None for the first page
+        limit: Maximum number of records to return
+        as_rows: Whether to return plain rows of INFO_COLUMNS, skipping the ORM
+    
+    Returns:
+        A list of WeatherInfo database objects (or rows with `as_rows`), ordered by ID.
+    """
+    query = db.query(*INFO_COLUMNS) if as_rows else db.query(WeatherInfo)
+    if after_id is not None:
+        query = query.filter(WeatherInfo.id > after_id)
+    return query.order_by(WeatherInfo.id).limit(limit).all()
+
+
+def _infos_with_location() -> Select:
+    """
+    Build the query selecting weather infos joined with their location.
+    
+    Returns:
+        A SELECT of the columns id, date, temperature, weather_description,
+        updated_at, location_id, city, country, lat and lon, ordered by info ID.
+        The location columns are None for infos without a location.
+    """
+    return (
+        select(
+            WeatherInfo.id,
+            WeatherInfo.date,
+            WeatherInfo.temperature,
+            WeatherInfo.weather_description,
+            WeatherInfo.updated_at,
+            WeatherLocation.id.label("location_id"),
+            WeatherLocation.city,
+            WeatherLocation.country,
+            WeatherLocation.lat,
+            WeatherLocation.lon,
+        )
+        .outerjoin(WeatherLocation, WeatherInfo.location_id == WeatherLocation.id)
+        .order_by(WeatherInfo.id)
+    )
+
+
+def iter_infos_with_location(db: Session, chunk_size: int = 1000) -> Iterator[List[Row]]:
+    """
+    Stream every weather info joined with its location, in chunks. Rows are
+    fetched through a server-side cursor where the database supports it, so
+    memory use does not grow with the table size.
+    
+    Args:
+        db: Database session
+        chunk_size: Number of rows fetched per chunk
+        
+    Returns:
+        An iterator of row lists, with the columns described in `_infos_with_location`.
+    """
+    stmt = _infos_with_location().execution_options(yield_per=chunk_size)
+    for partition in db.execute(stmt).partitions():
+        yield partition
+
+
+def get_infos_with_location(db: Session, info_ids: List[int]) -> List[Row]:
+    """
+    Retrieve weather infos joined with their location by ID.
+    
+    Args:
+        db: Database session
+        info_ids: IDs of the weather infos to retrieve
+        
+    Returns:
+        A list of rows, with the columns described in `_infos_with_location`.
+    """
+    if not info_ids:
+        return []
+    return db.execute(_infos_with_location().where(WeatherInfo.id.in_(info_ids))).all()
+
+
+def _get_cached_infos(
+    db: Session, location_id: int, start_date: date, end_date: date, min_version: int = 0
+) -> List[InfoSnapshot]:
+    """
+    Read the infos of a location within a date range through the info cache.
+    The range is queried at once unless every date of it is cached, and every
+    date of it is then cached, including those without info.
+    
+    Args:
+        db: Database session
+        location_id: ID of the location
+        start_date: Start date for the range
+        end_date: End date for the range
+        min_version: The change-log version of the location read by the caller, if any
+        
+    Returns:
+        A list of info snapshots, ordered by date.
+    """
+    keys = [(location_id, start_date + timedelta(days=i)) for i in range((end_date - start_date).days + 1)]
+    if not keys:
+        return []
+    found = info_cache.get_many(keys, min_version)
+    if found is None:
+        generation = info_cache.generation()
+        rows = (
+            db.query(*INFO_COLUMNS)
+            .filter(
+                WeatherInfo.location_id == location_id,
+                WeatherInfo.date.between(start_date, end_date)
+            )
+            .all()
+        )
+        by_date = {row.date: InfoSnapshot(*row) for row in rows}
+        found = [by_date.get(info_date) for _, info_date in keys]
+        info_cache.put_many(zip(keys, found), generation, min_version)
+    return [snapshot for snapshot in found if snapshot is not None]
 
 
 def get_info_by_loc_date(
     db: Session,
     location_id: int,
     date: date,
-) -> List[WeatherInfo]:
+) -> Optional[InfoSnapshot]:
     """
-    Retrieve info for a location of a date.
+    Retrieve info for a location of a date, through the info cache.
     
     Args:
         db: Database session
@@ -199,10 +588,14 @@ def get_info_by_loc_date(
         date: Date to look up
         
     Returns:  
-        A list of WeatherInfo database objects. 
+        An immutable snapshot of the weather info if found (a plain row of
+        INFO_COLUMNS with the cache disabled), otherwise None.
     """
+    if info_cache.enabled:
+        infos = _get_cached_infos(db, location_id, date, date)
+        return infos[0] if infos else None
     return (
-        db.query(WeatherInfo)
+        db.query(*INFO_COLUMNS)
         .filter(
             WeatherInfo.location_id == location_id,
             WeatherInfo.date == date
@@ -215,26 +608,69 @@ def get_infos_by_loc_date_range(
     db: Session,
     location_id: int,
     start_date: date,
-    end_date: date
+    end_date: date,
+    as_rows: bool = False,
+    min_version: int = 0
 ) -> List[WeatherInfo]:
     """
-    Retrieve info for a location within a date range.
+    Retrieve info for a location within a date range, ordered by date.
     
     Args:
         db: Database session
         location_id: ID of the location
         start_date: Start date for the range
         end_date: End date for the range
+        as_rows: Whether to return plain rows of INFO_COLUMNS, skipping the ORM;
+            ranges of up to INFO_CACHE_MAX_RANGE_DAYS are then read through the info
+            cache and returned as immutable snapshots with the same fields
+        min_version: The change-log version of the location (see `get_version`)
+            read before calling, so that the info cache serves at least that version
         
     Returns:  
-        A list of WeatherInfo database objects. 
+        A list of WeatherInfo database objects, or rows with `as_rows`. 
     """
+    if as_rows and info_cache.enabled and (end_date - start_date).days < INFO_CACHE_MAX_RANGE_DAYS:
+        return _get_cached_infos(db, location_id, start_date, end_date, min_version)
     return (
-        db.query(WeatherInfo)
+        (db.query(*INFO_COLUMNS) if as_rows else db.query(WeatherInfo))
         .filter(
             WeatherInfo.location_id == location_id,
             WeatherInfo.date.between(start_date, end_date)
         )
+        .order_by(WeatherInfo.date)
+        .all()
+    )
+
+
+def get_infos_by_locs_date_range(
+    db: Session,
+    location_ids: List[int],
+    start_date: date,
+    end_date: date,
+    as_rows: bool = False
+) -> List[WeatherInfo]:
+    """
+    Retrieve info for several locations within a date range with a single query.
+    
+    Args:
+        db: Database session
+        location_ids: IDs of the locations
+        start_date: Start date for the range
+        end_date: End date for the range
+        as_rows: Whether to return plain rows of INFO_COLUMNS, skipping the ORM
+        
+    Returns:  
+        A list of WeatherInfo database objects (or rows with `as_rows`), ordered by location and date. 
+    """
+    if not location_ids:
+        return []
+    return (
+        (db.query(*INFO_COLUMNS) if as_rows else db.query(WeatherInfo))
+        .filter(
+            WeatherInfo.location_id.in_(set(location_ids)),
+            WeatherInfo.date.between(start_date, end_date)
+        )
+        .order_by(WeatherInfo.location_id, WeatherInfo.date)
         .all()
     )
 
@@ -258,10 +694,17 @@ def update_info(
     info = get_info(db, info_id)
     if not info:
         return None
+    previous_key = (info.location_id, info.date)
     for field, value in updates.items():
         if hasattr(info, field):
             setattr(info, field, value)
+    # An info moved to another location also changes the one it left
+    changed = [(info.id, info.location_id)]
+    if previous_key[0] != info.location_id:
+        changed.append((info.id, previous_key[0]))
+    _log_changes(db, "weather_info", "upsert", changed)
     db.commit()
+    info_cache.invalidate([previous_key, (info.location_id, info.date)])
     db.refresh(info)
     return info
 
@@ -280,9 +723,290 @@ def delete_info(db: Session, info_id: int) -> Optional[WeatherInfo]:
     info = get_info(db, info_id)
     if not info:
         return None
+    _log_changes(db, "weather_info", "delete", [(info.id, info.location_id)])
     db.delete(info)
     db.commit()
+    info_cache.invalidate([(info.location_id, info.date)])
     return info
 
 
 
+
+################################################################################
+# VideoCache operations
+################################################################################
+def get_cached_videos(db: Session, location_id: int, max_results: int) -> Optional[VideoCache]:
+    """
+    Retrieve the cached video search of a location.
+    
+    Args:
+        db: Database session
+        location_id: ID of the location
+        max_results: The number of results of the search
+        
+    Returns:
+        A VideoCache database object if found, otherwise None.
+    """
+    return db.scalars(
+        select(VideoCache).where(VideoCache.location_id == location_id, VideoCache.max_results == max_results)
+    ).first()
+
+
+def save_cached_videos(db: Session, location_id: int, max_results: int, videos: List[Dict[str, Any]]) -> None:
+    """
+    Insert or replace the cached video search of a location.
+    
+    Args:
+        db: Database session
+        location_id: ID of the location
+        max_results: The number of results of the search
+        videos: The parsed search results
+    """
+    stmt = _insert(db, VideoCache).values(
+        location_id=location_id, max_results=max_results, videos=videos, fetched_at=utcnow()
+    )
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[VideoCache.location_id, VideoCache.max_results],
+        set_={"videos": stmt.excluded.videos, "fetched_at": stmt.excluded.fetched_at},
+    ))
+    db.commit()
+
+
+
+
+################################################################################
+# ForecastSnapshot operations
+################################################################################
+def get_forecast_snapshot(db: Session, location_id: int) -> Optional[ForecastSnapshot]:
+    """
+    Retrieve the stored forecast snapshot of a location.
+    
+    Args:
+        db: Database session
+        location_id: ID of the location
+        
+    Returns:
+        A ForecastSnapshot database object if found, otherwise None.
+    """
+    return db.scalars(select(ForecastSnapshot).where(ForecastSnapshot.location_id == location_id)).first()
+
+
+def save_forecast_snapshots(db: Session, snapshots: Dict[int, Dict[str, Any]], commit: bool = True) -> None:
+    """
+    Insert or replace the forecast snapshots of several locations in one transaction.
+    
+    Args:
+        db: Database session
+        snapshots: Packed columns keyed by location ID, each a dictionary with the
+            keys 'slots', 'timestamps', 'temperature', 'humidity', 'wind_speed' and 'pressure'
+        commit: Whether to commit, or leave the snapshots in the caller's transaction
+    """
+    if not snapshots:
+        return
+    fetched_at = utcnow()
+    stmt = _insert(db, ForecastSnapshot).values([
+        dict(columns, location_id=location_id, fetched_at=fetched_at)
+        for location_id, columns in snapshots.items()
+    ])
+    columns = ("fetched_at", "slots", "timestamps", "temperature", "humidity", "wind_speed", "pressure")
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[ForecastSnapshot.location_id],
+        set_={column: stmt.excluded[column] for column in columns},
+    ))
+    if commit:
+        db.commit()
+
+
+
+
+################################################################################
+# Temperature statistics
+################################################################################
+def _period_start(db: Session, period: str):
+    """
+    Build the SQL expression of the first day of the period of a weather info.
+    
+    Args:
+        db: Database session
+        period: 'day', 'week' (starting on Monday) or 'month'
+        
+    Returns:
+        A date column expression.
+    """
+    if period not in ("day", "week", "month"):
+        raise ValueError(f"Unsupported period '{period}'.")
+    if period == "day":
+        return WeatherInfo.date
+    if db.get_bind().dialect.name == "sqlite":
+        modifiers = ("weekday 0", "-6 days") if period == "week" else ("start of month",)
+        return func.date(WeatherInfo.date, *modifiers, type_=Date)
+    # Inline the validated unit so the SELECT and GROUP BY expressions match
+    # even with server-side parameter binding
+    return cast(func.date_trunc(literal_column(f"'{period}'"), WeatherInfo.date), Date)
+
+
+def _temperature_groups(
+    db: Session,
+    period: Optional[str],
+    by_location: bool,
+    location_ids: Optional[List[int]],
+    start_date: Optional[date],
+    end_date: Optional[date]
+) -> Tuple[List[Any], List[Any], List[Any]]:
+    """
+    Build the group columns, group-by keys and filters of a temperature statistics query.
+    
+    Args:
+        db: Database session
+        period: 'day', 'week', 'month', or None for a single period
+        by_location: Whether to group by location
+        location_ids: Optional IDs of the locations to include
+        start_date: Optional first date to include
+        end_date: Optional last date to include
+        
+    Returns:
+        The labeled (location_id, period_start) columns, the GROUP BY keys and the WHERE clauses.
+    """
+    location = WeatherInfo.location_id if by_location else None
+    period_start = _period_start(db, period) if period else None
+    columns = [
+        (location if location is not None else null()).label("location_id"),
+        (period_start if period_start is not None else null()).label("period_start"),
+    ]
+    keys = [key for key in (location, period_start) if key is not None]
+    filters = [WeatherInfo.temperature.is_not(None)]
+    if location_ids is not None:
+        filters.append(WeatherInfo.location_id.in_(set(location_ids)))
+    if start_date is not None:
+        filters.append(WeatherInfo.date >= start_date)
+    if end_date is not None:
+        filters.append(WeatherInfo.date <= end_date)
+    return columns, keys, filters
+
+
+def get_temperature_aggregates(
+    db: Session,
+    period: Optional[str] = "week",
+    by_location: bool = True,
+    location_ids: Optional[List[int]] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None
+) -> List[Row]:
+    """
+    Compute the count, min, max and mean temperature per location and period with one GROUP BY query.
+    
+    Args:
+        db: Database session
+        period: 'day', 'week', 'month', or None for a single period
+        by_location: Whether to group by location
+        location_ids: Optional IDs of the locations to include
+        start_date: Optional first date to include
+        end_date: Optional last date to include
+        
+    Returns:
+        (location_id, period_start, count, min, max, mean) rows, ordered by location and period.
+    """
+    columns, keys, filters = _temperature_groups(db, period, by_location, location_ids, start_date, end_date)
+    return db.execute(
+        select(
+            *columns,
+            func.count(WeatherInfo.temperature).label("count"),
+            func.min(WeatherInfo.temperature).label("min"),
+            func.max(WeatherInfo.temperature).label("max"),
+            func.avg(WeatherInfo.temperature).label("mean"),
+        )
+        .where(*filters)
+        .group_by(*keys)
+        .order_by(*keys)
+    ).all()
+
+
+def get_temperature_series(
+    db: Session,
+    period: Optional[str] = "week",
+    by_location: bool = True,
+    location_ids: Optional[List[int]] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None
+) -> List[Row]:
+    """
+    Retrieve the temperatures with their group keys, ordered by group, for the
+    statistics that SQL cannot aggregate portably (percentiles).
+    
+    Args:
+        db: Database session
+        period: 'day', 'week', 'month', or None for a single period
+        by_location: Whether to group by location
+        location_ids: Optional IDs of the locations to include
+        start_date: Optional first date to include
+        end_date: Optional last date to include
+        
+    Returns:
+        (location_id, period_start, temperature) rows, ordered by location and period.
+    """
+    columns, keys, filters = _temperature_groups(db, period, by_location, location_ids, start_date, end_date)
+    return db.execute(
+        select(*columns, WeatherInfo.temperature).where(*filters).order_by(*keys)
+    ).all()
+
+
+
+
+################################################################################
+# Change log operations
+################################################################################
+def get_change_token(db: Session) -> int:
+    """
+    Get the sequence number of the latest change.
+    
+    Args:
+        db: Database session
+        
+    Returns:
+        The latest change sequence number, or 0 if nothing changed yet.
+    """
+    return db.scalar(select(func.max(ChangeLog.id))) or 0
+
+
+def get_version(
+    db: Session,
+    table_name: Optional[str] = None,
+    location_id: Optional[int] = None
+) -> Tuple[int, Optional[datetime]]:
+    """
+    Get the version of a table, of a location (its row and its infos) or of
+    the whole database: the sequence number and time of its latest change.
+    One lookup at the end of an index of the change log.
+    
+    Args:
+        db: Database session
+        table_name: Optional name of the table
+        location_id: Optional ID of the location
+        
+    Returns:
+        The latest change sequence number and its time, or (0, None) if nothing changed yet.
+    """
+    query = select(ChangeLog.id, ChangeLog.changed_at)
+    if table_name is not None:
+        query = query.where(ChangeLog.table_name == table_name)
+    if location_id is not None:
+        query = query.where(ChangeLog.location_id == location_id)
+    row = db.execute(query.order_by(ChangeLog.id.desc()).limit(1)).first()
+    return (row.id, row.changed_at) if row is not None else (0, None)
+
+
+def list_changes(db: Session, since: int, limit: int = 1000) -> List[ChangeLog]:
+    """
+    List the changes made after a sequence number, oldest first.
+    
+    Args:
+        db: Database session
+        since: Sequence number of the last change already seen
+        limit: Maximum number of changes to return
+        
+    Returns:
+        A list of ChangeLog database objects.
+    """
+    return db.scalars(
+        select(ChangeLog).where(ChangeLog.id > since).order_by(ChangeLog.id).limit(limit)
+    ).all()
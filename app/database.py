@@ -1,22 +1,168 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-import os
-from dotenv import load_dotenv
-
-# Load database URL or default to current directory SQLite database
-load_dotenv()
-DATABASE_URL = os.getenv("DATABASE_URL", default="sqlite:///./weather.db")
-
-# Create engine, session maker and base class 
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
-)
+from sqlalchemy.orm import Session, sessionmaker
+import asyncio
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, TypeVar
+from .config import Setting, flag
+from . import metrics, profiling
+
+class _Settings:
+    # Load database URL or default to current directory SQLite database
+    DATABASE_URL = Setting("DATABASE_URL", "sqlite:///./weather.db")
+
+    # Connection pool profile (per worker process)
+    DB_POOL_SIZE = Setting("DB_POOL_SIZE", 5, int)
+    DB_MAX_OVERFLOW = Setting("DB_MAX_OVERFLOW", 10, int)
+    DB_POOL_TIMEOUT = Setting("DB_POOL_TIMEOUT", 30.0, float)
+    DB_POOL_RECYCLE = Setting("DB_POOL_RECYCLE", 1800, int)
+    DB_POOL_PRE_PING = Setting("DB_POOL_PRE_PING", True, flag)
+
+    # SQLite pragmas applied to every new connection. WAL lets readers run
+    # alongside a writer, NORMAL synchronous only fsyncs at checkpoints in WAL
+    # mode, and busy_timeout makes writers of other workers wait for the lock
+    # instead of failing with "database is locked".
+    SQLITE_JOURNAL_MODE = Setting("SQLITE_JOURNAL_MODE", "WAL")
+    SQLITE_SYNCHRONOUS = Setting("SQLITE_SYNCHRONOUS", "NORMAL")
+    SQLITE_BUSY_TIMEOUT_MS = Setting("SQLITE_BUSY_TIMEOUT_MS", 5000, int)
+    SQLITE_MMAP_SIZE = Setting("SQLITE_MMAP_SIZE", 256 * 1024 * 1024, int)
+    SQLITE_CACHE_SIZE = Setting("SQLITE_CACHE_SIZE", -65536, int)
+    SQLITE_TEMP_STORE = Setting("SQLITE_TEMP_STORE", "MEMORY")
+
+    @property
+    def SQLITE_PRAGMAS(self) -> Dict[str, Any]:
+        """
+        The pragmas by name.
+        """
+        return {
+            "journal_mode": self.SQLITE_JOURNAL_MODE,
+            "synchronous": self.SQLITE_SYNCHRONOUS,
+            "busy_timeout": self.SQLITE_BUSY_TIMEOUT_MS,
+            "mmap_size": self.SQLITE_MMAP_SIZE,
+            "cache_size": self.SQLITE_CACHE_SIZE,
+            "temp_store": self.SQLITE_TEMP_STORE,
+        }
+
+
+settings = _Settings()
+
+
+def _engine_options(url: str) -> Dict[str, Any]:
+    """
+    Build the create_engine options of the configured profile.
+
+    Args:
+        url: The database URL
+
+    Returns:
+        A dictionary of keyword arguments for create_engine.
+    """
+    parsed = make_url(url)
+    options: Dict[str, Any] = {"pool_pre_ping": settings.DB_POOL_PRE_PING}
+    if parsed.get_backend_name() == "sqlite":
+        options["connect_args"] = {"check_same_thread": False}
+        if parsed.database in (None, "", ":memory:"):
+            # In-memory databases live in a single connection
+            return options
+    options.update(
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+    )
+    return options
+
+
+_engine: Optional[Engine] = None
+_engine_lock = threading.Lock()
+# Number of SQL statements executed by this worker process
+_queries = {"statements": 0}
+_queries_lock = threading.Lock()
+
+
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    Apply SQLITE_PRAGMAS to a new SQLite connection.
+
+    Args:
+        dbapi_connection: The DBAPI connection
+        connection_record: The pool record of the connection
+    """
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+
+def _start_statement(conn, cursor, statement, parameters, context, executemany):
+    """
+    Note the start time of a SQL statement about to be executed.
+    """
+    conn.info["statement_started"] = time.perf_counter()
+
+
+def _end_statement(conn, cursor, statement, parameters, context, executemany):
+    """
+    Count an executed SQL statement and record its execution time.
+    """
+    elapsed = time.perf_counter() - conn.info.pop("statement_started", time.perf_counter())
+    with _queries_lock:
+        _queries["statements"] += 1
+    metrics.observe_statement(elapsed)
+    profiling.record_statement(statement, elapsed, executemany)
+
+
+def get_engine() -> Engine:
+    """
+    Get the database engine, creating it on first use.
+
+    Returns:
+        The SQLAlchemy engine of DATABASE_URL.
+    """
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                engine = create_engine(settings.DATABASE_URL, **_engine_options(settings.DATABASE_URL))
+                if engine.dialect.name == "sqlite":
+                    event.listen(engine, "connect", _set_sqlite_pragmas)
+                event.listen(engine, "before_cursor_execute", _start_statement)
+                event.listen(engine, "after_cursor_execute", _end_statement)
+                _engine = engine
+    return _engine
+
+
+def __getattr__(name: str) -> Any:
+    """
+    Create the engine when the `engine` module attribute is first accessed.
+    """
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+class LazySession(Session):
+    """
+    A session bound to the engine on first use, so that creating the session
+    factory does not create the engine.
+    """
+    def get_bind(self, *args: Any, **kwargs: Any):
+        if self.bind is None:
+            self.bind = get_engine()
+        return super().get_bind(*args, **kwargs)
+
+
+# Create session maker and base class 
 SessionLocal = sessionmaker(
+    class_=LazySession,
     autocommit=False,
-    autoflush=False,
-    bind=engine
+    autoflush=False
 )
 Base = declarative_base()
 
@@ -33,7 +179,54 @@ def get_db():
         yield db
     finally:
         db.close()
-        
-        
-        
-        
\ No newline at end of file
+
+
+T = TypeVar("T")
+
+
+async def run_in_session(fn: Callable[..., T], *args: Any) -> T:
+    """
+    Run blocking database work in a worker thread, with a session opened for
+    that work only. Async endpoints use it around their database phases, so
+    that neither the event loop nor a pooled connection is held while they
+    await upstream calls.
+
+    Args:
+        fn: A function taking the session followed by `args`
+        *args: The other arguments of `fn`
+
+    Returns:
+        The result of `fn`.
+    """
+    def work() -> T:
+        db = SessionLocal()
+        try:
+            return fn(db, *args)
+        finally:
+            db.close()
+
+    return await asyncio.to_thread(work)
+
+
+def pool_stats() -> Dict[str, Any]:
+    """
+    Get the connection pool state of this worker process.
+
+    Returns:
+        A dictionary with the pool class, its configured size and overflow, the
+        connections currently checked in, checked out and in overflow, and the
+        number of SQL statements executed.
+    """
+    pool = get_engine().pool
+    stats: Dict[str, Any] = {"pool": type(pool).__name__, "status": pool.status()}
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        method = getattr(pool, name, None)
+        if callable(method):
+            stats[name] = method()
+    with _queries_lock:
+        stats["statements"] = _queries["statements"]
+    return stats
+
+
+
+
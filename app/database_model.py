@@ -1,7 +1,18 @@
-from sqlalchemy import Column, Integer, String, Float, Date, ForeignKey
+from datetime import datetime, timezone
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, ForeignKey, Index, JSON, LargeBinary
 from sqlalchemy.orm import relationship
 from .database import Base
 
+
+def utcnow() -> datetime:
+    """
+    Get the current UTC time as a naive datetime, as stored in DateTime columns.
+    
+    Returns:
+        The current UTC time.
+    """
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
 class WeatherLocation(Base):
     __tablename__ = "locations"
     # Attributes of the WeatherLocation class
@@ -10,10 +21,16 @@ class WeatherLocation(Base):
     country = Column(String, index=True, nullable=True)        
     lat = Column(Float, nullable=True)                        
     lon = Column(Float, nullable=True)         
+    updated_at = Column(DateTime, index=True, nullable=True, default=utcnow, onupdate=utcnow)
     info = relationship("WeatherInfo", back_populates="location")
 
 class WeatherInfo(Base):
     __tablename__ = "weather_info"
+    # One info per location and date; the index also serves lookups and
+    # date-ordered range scans of a location
+    __table_args__ = (
+        Index("ix_weather_info_location_date", "location_id", "date", unique=True),
+    )
     # Attributes of the WeatherInfo class
     id = Column(Integer, primary_key=True, index=True)         
     location_id = Column(Integer, ForeignKey("locations.id")) 
@@ -21,9 +38,50 @@ class WeatherInfo(Base):
     temperature = Column(Float, nullable=False)   
     weather_description = Column(String, nullable=True)    
     # raw_data = Column(String, nullable=True)          
+    updated_at = Column(DateTime, index=True, nullable=True, default=utcnow, onupdate=utcnow)
     location = relationship("WeatherLocation", back_populates="info")
-    
-    
-    
-    
-    
\ No newline at end of file
+
+class ChangeLog(Base):
+    __tablename__ = "change_log"
+    # AUTOINCREMENT keeps the sequence monotonic on SQLite, and
+    # crud._log_changes keeps it in commit order on PostgreSQL; the indexes
+    # serve the latest change of a table or of a location (conditional GETs)
+    __table_args__ = (
+        Index("ix_change_log_table_name_id", "table_name", "id"),
+        Index("ix_change_log_location_id_id", "location_id", "id"),
+        {"sqlite_autoincrement": True},
+    )
+    # Attributes of the ChangeLog class; `id` is the change sequence number
+    id = Column(Integer, primary_key=True)
+    table_name = Column(String, nullable=False)
+    row_id = Column(Integer, nullable=False)
+    location_id = Column(Integer, index=True, nullable=True)
+    operation = Column(String, nullable=False)
+    changed_at = Column(DateTime, nullable=False, default=utcnow)
+
+class VideoCache(Base):
+    __tablename__ = "video_cache"
+    # One cached search per location and result count
+    __table_args__ = (
+        Index("ix_video_cache_location_max_results", "location_id", "max_results", unique=True),
+    )
+    # Attributes of the VideoCache class; `videos` holds the parsed search results
+    id = Column(Integer, primary_key=True)
+    location_id = Column(Integer, ForeignKey("locations.id"), nullable=False)
+    max_results = Column(Integer, nullable=False)
+    videos = Column(JSON, nullable=False)
+    fetched_at = Column(DateTime, nullable=False, default=utcnow)
+
+class ForecastSnapshot(Base):
+    __tablename__ = "forecast_snapshots"
+    # Attributes of the ForecastSnapshot class; the latest forecast of a location,
+    # its 3-hour slots packed column by column (see app/forecast_series.py)
+    id = Column(Integer, primary_key=True)
+    location_id = Column(Integer, ForeignKey("locations.id"), unique=True, nullable=False)
+    fetched_at = Column(DateTime, nullable=False, default=utcnow)
+    slots = Column(Integer, nullable=False)
+    timestamps = Column(LargeBinary, nullable=False)
+    temperature = Column(LargeBinary, nullable=False)
+    humidity = Column(LargeBinary, nullable=False)
+    wind_speed = Column(LargeBinary, nullable=False)
+    pressure = Column(LargeBinary, nullable=False)
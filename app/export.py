@@ -0,0 +1,277 @@
+import csv
+import io
+import json
+import zlib
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+from .config import Setting
+from sqlalchemy import Row
+from sqlalchemy.orm import Session
+from . import crud
+from .database import SessionLocal
+from .database_model import WeatherLocation
+
+class _Settings:
+    # Load export settings
+    EXPORT_CHUNK_SIZE = Setting("EXPORT_CHUNK_SIZE", 1000, int)
+
+
+settings = _Settings()
+
+# Supported export formats and their media types
+MEDIA_TYPES = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+CSV_COLUMNS = ["id", "date", "temperature", "description", "updated_at", "location_id", "city", "country", "lat", "lon"]
+
+
+
+
+def _record(row: Row) -> Dict[str, Any]:
+    """
+    Convert an exported row to the JSON record of a weather info and its location.
+
+    Args:
+        row: A row returned by crud.iter_infos_with_location
+
+    Returns:
+        A JSON-serializable dictionary.
+    """
+    return {
+        "id": row.id,
+        "date": row.date.isoformat(),
+        "temperature": row.temperature,
+        "description": row.weather_description,
+        "updated_at": row.updated_at.isoformat() if row.updated_at else None,
+        "location": None if row.location_id is None else {
+            "id": row.location_id,
+            "city": row.city,
+            "country": row.country,
+            "lat": row.lat,
+            "lon": row.lon
+        }
+    }
+
+
+def _location_record(loc: WeatherLocation) -> Dict[str, Any]:
+    """
+    Convert a location to its JSON record.
+
+    Args:
+        loc: A WeatherLocation database object
+
+    Returns:
+        A JSON-serializable dictionary.
+    """
+    return {
+        "id": loc.id,
+        "city": loc.city,
+        "country": loc.country,
+        "lat": loc.lat,
+        "lon": loc.lon,
+        "updated_at": loc.updated_at.isoformat() if loc.updated_at else None
+    }
+
+
+def _iter_rows() -> Iterator[List[Row]]:
+    """
+    Stream the exported rows in chunks from a session owned by the stream,
+    since the request session is closed before the response body is sent.
+
+    Returns:
+        An iterator of row lists.
+    """
+    db = SessionLocal()
+    try:
+        yield from crud.iter_infos_with_location(db, chunk_size=settings.EXPORT_CHUNK_SIZE)
+    finally:
+        db.close()
+
+
+
+
+def _encode_json(chunks: Iterable[List[Row]]) -> Iterator[bytes]:
+    """
+    Encode chunks of rows as a single JSON array.
+
+    Args:
+        chunks: An iterable of row lists
+
+    Returns:
+        An iterator of encoded bytes.
+    """
+    yield b"["
+    first = True
+    for chunk in chunks:
+        body = ",".join(json.dumps(_record(row), separators=(",", ":")) for row in chunk)
+        yield (body if first else "," + body).encode()
+        first = False
+    yield b"]"
+
+
+def _encode_ndjson(chunks: Iterable[List[Row]]) -> Iterator[bytes]:
+    """
+    Encode chunks of rows as newline-delimited JSON, one record per line.
+
+    Args:
+        chunks: An iterable of row lists
+
+    Returns:
+        An iterator of encoded bytes.
+    """
+    for chunk in chunks:
+        yield "".join(json.dumps(_record(row), separators=(",", ":")) + "\n" for row in chunk).encode()
+
+
+def _encode_csv(chunks: Iterable[List[Row]]) -> Iterator[bytes]:
+    """
+    Encode chunks of rows as CSV with a header line.
+
+    Args:
+        chunks: An iterable of row lists
+
+    Returns:
+        An iterator of encoded bytes.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_COLUMNS)
+    for chunk in chunks:
+        writer.writerows(
+            (row.id, row.date.isoformat(), row.temperature, row.weather_description,
+             row.updated_at.isoformat() if row.updated_at else None, row.location_id, row.city, row.country, row.lat, row.lon)
+            for row in chunk
+        )
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def _gzip(parts: Iterable[bytes]) -> Iterator[bytes]:
+    """
+    Compress a byte stream with gzip on the fly.
+
+    Args:
+        parts: An iterable of bytes
+
+    Returns:
+        An iterator of gzip-compressed bytes.
+    """
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    for part in parts:
+        compressed = compressor.compress(part)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+ENCODERS = {
+    "json": _encode_json,
+    "ndjson": _encode_ndjson,
+    "csv": _encode_csv,
+}
+
+
+
+
+def stream_export(format: str = "json", gzip: bool = False) -> Iterator[bytes]:
+    """
+    Stream every weather info and its location in the requested format.
+
+    Args:
+        format: One of 'json', 'ndjson' or 'csv'
+        gzip: Whether to gzip-compress the stream
+
+    Raises:
+        ValueError: If the format is not supported.
+
+    Returns:
+        An iterator of bytes.
+    """
+    if format not in ENCODERS:
+        raise ValueError(f"Unsupported export format '{format}'. Use one of: {', '.join(ENCODERS)}")
+    stream = ENCODERS[format](_iter_rows())
+    return _gzip(stream) if gzip else stream
+
+
+
+
+def _decode_token(token: Optional[str]) -> int:
+    """
+    Decode a change resume token.
+
+    Args:
+        token: The token returned by a previous export, or None to start from the beginning
+
+    Raises:
+        ValueError: If the token is malformed.
+
+    Returns:
+        The change sequence number encoded by the token.
+    """
+    if not token:
+        return 0
+    if not token.isdigit():
+        raise ValueError(f"Invalid change token '{token}'")
+    return int(token)
+
+
+def change_token(db: Session) -> str:
+    """
+    Get the resume token of the latest change, to pass to `changes_since`
+    after a full export.
+
+    Args:
+        db: Database session
+
+    Returns:
+        An opaque resume token.
+    """
+    return str(crud.get_change_token(db))
+
+
+def changes_since(db: Session, since: Optional[str] = None, limit: int = 1000) -> Dict[str, Any]:
+    """
+    Collect the weather infos and locations changed or deleted after a resume token.
+    Several changes of the same row are collapsed into its current state.
+
+    Args:
+        db: Database session
+        since: The resume token of a previous export, or None for every logged change
+        limit: Maximum number of change log entries consumed by this call
+
+    Raises:
+        ValueError: If the token is malformed.
+
+    Returns:
+        A dictionary with the changed records, the deleted IDs per table, the
+        resume token of the next call and whether more changes are pending.
+    """
+    since_seq = _decode_token(since)
+    changes = crud.list_changes(db, since_seq, limit=limit)
+    latest: Dict[str, Dict[int, str]] = {"weather_info": {}, "locations": {}}
+    for change in changes:
+        latest[change.table_name][change.row_id] = change.operation
+
+    def upserted(table: str) -> List[int]:
+        return [row_id for row_id, operation in latest[table].items() if operation == "upsert"]
+
+    infos = crud.get_infos_with_location(db, upserted("weather_info"))
+    locs = crud.get_locations(db, upserted("locations"))
+    # Rows changed then deleted after this page are reported as deleted
+    found = {"weather_info": {row.id for row in infos}, "locations": {loc.id for loc in locs}}
+    return {
+        "changed": {
+            "weather_info": [_record(row) for row in infos],
+            "locations": [_location_record(loc) for loc in locs],
+        },
+        "deleted": {
+            table: sorted(row_id for row_id in rows if row_id not in found[table])
+            for table, rows in latest.items()
+        },
+        "next_token": str(changes[-1].id if changes else since_seq),
+        "has_more": len(changes) == limit,
+    }
@@ -0,0 +1,253 @@
+import array
+import logging
+import sys
+import zlib
+from datetime import date, datetime, timezone
+from typing import Any, Dict, List, Optional
+from sqlalchemy.orm import Session
+from .config import Setting, flag
+from . import crud
+from .database_model import ForecastSnapshot
+
+################################################################################
+# Full 3-hour forecast series of the stored locations. The latest forecast of
+# a location is stored as one row of packed little-endian arrays, a column per
+# field, so that any day or hour of it can be served, and daily statistics
+# computed with NumPy, without another upstream call. Each column is deflated
+# when FORECAST_SERIES_COMPRESS is set and that makes it smaller.
+################################################################################
+class _Settings:
+    FORECAST_SERIES_COMPRESS = Setting("FORECAST_SERIES_COMPRESS", True, flag)
+
+
+settings = _Settings()
+
+# Stored fields: column, array type code and fixed-point scale. Temperature and
+# wind speed are kept to the hundredth; timestamps (UTC seconds) are stored as
+# the first one followed by the gaps between slots, which deflate well.
+FIELDS = (
+    ("timestamps", "I", 1),
+    ("temperature", "h", 100),
+    ("humidity", "B", 1),
+    ("wind_speed", "h", 100),
+    ("pressure", "H", 1),
+)
+SLOT_SECONDS = 3 * 3600
+
+# NumPy types of the array type codes, and the first byte of a packed column
+_DTYPES = {"I": "<u4", "h": "<i2", "B": "u1", "H": "<u2"}
+_RAW, _DEFLATE = 0, 1
+
+# Array item sizes depend on the platform, the stored column widths do not
+for _typecode, _dtype in _DTYPES.items():
+    if array.array(_typecode).itemsize != int(_dtype[-1]):
+        raise RuntimeError(f"Array type code '{_typecode}' is not {_dtype[-1]} bytes wide on this platform")
+
+logger = logging.getLogger(__name__)
+
+
+
+
+def _encode(values: array.array) -> bytes:
+    """
+    Serialize an array as a packed column.
+
+    Args:
+        values: The array
+
+    Returns:
+        A marker byte followed by the little-endian array bytes, deflated if that is smaller.
+    """
+    if sys.byteorder == "big":
+        values.byteswap()
+    raw = values.tobytes()
+    if settings.FORECAST_SERIES_COMPRESS:
+        compressor = zlib.compressobj(9, zlib.DEFLATED, -15)
+        deflated = compressor.compress(raw) + compressor.flush()
+        if len(deflated) < len(raw):
+            return bytes([_DEFLATE]) + deflated
+    return bytes([_RAW]) + raw
+
+
+def _decode(column: bytes, typecode: str):
+    """
+    Read a packed column.
+
+    Args:
+        column: The packed column
+        typecode: Array type code of the column
+
+    Returns:
+        np.ndarray: The values.
+    """
+    import numpy as np
+    data = zlib.decompress(column[1:], -15) if column[0] == _DEFLATE else column[1:]
+    return np.frombuffer(data, dtype=_DTYPES[typecode])
+
+
+def pack(forecast: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Pack the 3-hour slots of a forecast payload into columns.
+
+    Args:
+        forecast: The raw forecast payload returned by the OpenWeather API
+
+    Raises:
+        KeyError: If a slot misses a stored field.
+        OverflowError: If a value does not fit its column.
+
+    Returns:
+        A dictionary with the number of slots and a packed column per field,
+        or None if the forecast has no slot.
+    """
+    slots = sorted(forecast.get("list", []), key=lambda slot: slot["dt"])
+    if not slots:
+        return None
+    times = [slot["dt"] for slot in slots]
+    fields = {
+        "timestamps": times[:1] + [b - a for a, b in zip(times, times[1:])],
+        "temperature": [slot["main"]["temp"] for slot in slots],
+        "humidity": [slot["main"]["humidity"] for slot in slots],
+        "wind_speed": [slot["wind"]["speed"] for slot in slots],
+        "pressure": [slot["main"]["pressure"] for slot in slots],
+    }
+    packed: Dict[str, Any] = {"slots": len(slots)}
+    for name, typecode, scale in FIELDS:
+        packed[name] = _encode(array.array(typecode, (round(value * scale) for value in fields[name])))
+    return packed
+
+
+def store(db: Session, forecasts: Dict[int, Dict[str, Any]], commit: bool = True) -> int:
+    """
+    Store the forecasts of several locations, replacing their previous snapshots.
+    Forecasts that cannot be packed are logged and skipped.
+
+    Args:
+        db: Database session
+        forecasts: Raw forecast payloads keyed by location ID
+        commit: Whether to commit, or leave the snapshots in the caller's transaction
+
+    Returns:
+        The number of snapshots stored.
+    """
+    snapshots = {}
+    for location_id, forecast in forecasts.items():
+        try:
+            packed = pack(forecast)
+        except (KeyError, TypeError, ValueError, OverflowError):
+            logger.warning("Could not pack the forecast of location %s", location_id, exc_info=True)
+            continue
+        if packed is not None:
+            snapshots[location_id] = packed
+    crud.save_forecast_snapshots(db, snapshots, commit=commit)
+    return len(snapshots)
+
+
+
+
+class ForecastSeries:
+    """
+    The unpacked forecast snapshot of a location.
+
+    Attributes:
+        location_id: ID of the location
+        fetched_at: When the snapshot was stored (UTC)
+        timestamps: Start of each 3-hour slot, in UTC seconds
+        values: The values of every slot, by field
+    """
+    def __init__(self, snapshot: ForecastSnapshot):
+        import numpy as np
+        self.location_id = snapshot.location_id
+        self.fetched_at = snapshot.fetched_at
+        self.timestamps = np.cumsum(_decode(snapshot.timestamps, "I"), dtype=np.int64)
+        self.values = {}
+        for name, typecode, scale in FIELDS[1:]:
+            values = _decode(getattr(snapshot, name), typecode)
+            self.values[name] = values.astype(np.int64) if scale == 1 else values / scale
+
+    def _slots(self, index) -> List[Dict[str, Any]]:
+        """
+        Build the slot dictionaries of an index or mask.
+
+        Args:
+            index: A NumPy index, slice or boolean mask of the slots
+
+        Returns:
+            One dictionary per slot with its start time (UTC) and every field.
+        """
+        columns = {"time": self.timestamps[index].astype("datetime64[s]").tolist()}
+        columns.update((name, values[index].tolist()) for name, values in self.values.items())
+        return [dict(zip(columns, slot)) for slot in zip(*columns.values())]
+
+    def slots(self, day: Optional[date] = None) -> List[Dict[str, Any]]:
+        """
+        Get the 3-hour slots of a date, or all of them.
+
+        Args:
+            day: The date (UTC) to look up, or None for the whole forecast
+
+        Returns:
+            A list of slot dictionaries, in chronological order.
+        """
+        if day is None:
+            return self._slots(slice(None))
+        start = int(datetime(day.year, day.month, day.day, tzinfo=timezone.utc).timestamp())
+        return self._slots((self.timestamps >= start) & (self.timestamps < start + 86400))
+
+    def at(self, moment: datetime) -> Optional[Dict[str, Any]]:
+        """
+        Get the 3-hour slot covering a moment.
+
+        Args:
+            moment: The moment, in UTC when naive
+
+        Returns:
+            The slot dictionary, or None if the forecast does not cover the moment.
+        """
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=timezone.utc)
+        seconds = moment.timestamp()
+        index = int(self.timestamps.searchsorted(seconds, side="right")) - 1
+        if index < 0 or seconds >= self.timestamps[index] + SLOT_SECONDS:
+            return None
+        return self._slots(slice(index, index + 1))[0]
+
+    def daily(self) -> List[Dict[str, Any]]:
+        """
+        Compute the min, max and mean of every field per date (UTC), vectorized
+        over the slots of each date.
+
+        Returns:
+            One dictionary per date with the date, the number of slots and the
+            min, max and mean of every field, in chronological order.
+        """
+        import numpy as np
+        days = self.timestamps // 86400
+        starts = np.flatnonzero(np.r_[True, days[1:] != days[:-1]])
+        counts = np.diff(np.r_[starts, len(days)])
+        result = [
+            {"date": date.fromordinal(date(1970, 1, 1).toordinal() + int(day)), "slots": int(count)}
+            for day, count in zip(days[starts], counts)
+        ]
+        for name, values in self.values.items():
+            lows = np.minimum.reduceat(values, starts).tolist()
+            highs = np.maximum.reduceat(values, starts).tolist()
+            means = (np.add.reduceat(values, starts) / counts).tolist()
+            for group, low, high, mean in zip(result, lows, highs, means):
+                group[name] = {"min": low, "max": high, "mean": mean}
+        return result
+
+
+def get_series(db: Session, location_id: int) -> Optional[ForecastSeries]:
+    """
+    Load the stored forecast series of a location.
+
+    Args:
+        db: Database session
+        location_id: ID of the location
+
+    Returns:
+        The forecast series, or None if no forecast of the location is stored.
+    """
+    snapshot = crud.get_forecast_snapshot(db, location_id)
+    return ForecastSeries(snapshot) if snapshot is not None else None
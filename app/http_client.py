@@ -0,0 +1,136 @@
+import importlib.util
+import httpx
+from typing import Optional
+from .config import Setting, flag
+
+class _Settings:
+    # Load connection pool settings shared by every upstream API client
+    HTTP_TIMEOUT = Setting("HTTP_TIMEOUT", 10.0, float)
+    HTTP_MAX_CONNECTIONS = Setting("HTTP_MAX_CONNECTIONS", 200, int)
+    HTTP_MAX_KEEPALIVE_CONNECTIONS = Setting("HTTP_MAX_KEEPALIVE_CONNECTIONS", 50, int)
+    HTTP_KEEPALIVE_EXPIRY = Setting("HTTP_KEEPALIVE_EXPIRY", 30.0, float)
+    # HTTP/2 uses the `h2` package from requirements.txt; without it the clients fall back to HTTP/1.1
+    HTTP2_ENABLED = Setting("HTTP2_ENABLED", True, flag)
+
+
+settings = _Settings()
+
+_client: Optional[httpx.Client] = None
+_async_client: Optional[httpx.AsyncClient] = None
+
+
+
+
+def _limits() -> httpx.Limits:
+    """
+    Build the connection pool limits from the environment.
+
+    Returns:
+        An httpx.Limits object.
+    """
+    return httpx.Limits(
+        max_connections=settings.HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+    )
+
+
+def _http2() -> bool:
+    """
+    Check whether HTTP/2 is enabled and supported.
+
+    Returns:
+        True if HTTP/2 should be negotiated with upstream servers.
+    """
+    return settings.HTTP2_ENABLED and importlib.util.find_spec("h2") is not None
+
+
+
+
+def get_client() -> httpx.Client:
+    """
+    Get the shared, pooled synchronous HTTP client, creating it on first use.
+
+    Returns:
+        An httpx.Client keeping connections alive between calls.
+    """
+    global _client
+    if _client is None:
+        _client = httpx.Client(timeout=settings.HTTP_TIMEOUT, limits=_limits(), http2=_http2())
+    return _client
+
+
+def open_client(transport: Optional[httpx.BaseTransport] = None) -> httpx.Client:
+    """
+    Open the shared synchronous HTTP client, replacing any previous one.
+
+    Args:
+        transport: Optional transport to use instead of the network (e.g. httpx.MockTransport)
+
+    Returns:
+        The opened httpx.Client.
+    """
+    global _client
+    close_client()
+    _client = httpx.Client(
+        timeout=settings.HTTP_TIMEOUT,
+        limits=_limits(),
+        http2=_http2() if transport is None else False,
+        transport=transport,
+    )
+    return _client
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """
+    Get the shared, pooled asynchronous HTTP client. It is normally opened by
+    the application lifespan, and created on first use otherwise.
+
+    Returns:
+        An httpx.AsyncClient keeping connections alive between calls.
+    """
+    global _async_client
+    if _async_client is None:
+        _async_client = httpx.AsyncClient(timeout=settings.HTTP_TIMEOUT, limits=_limits(), http2=_http2())
+    return _async_client
+
+
+async def open_async_client(transport: Optional[httpx.AsyncBaseTransport] = None) -> httpx.AsyncClient:
+    """
+    Open the shared asynchronous HTTP client, replacing any previous one.
+
+    Args:
+        transport: Optional transport to use instead of the network (e.g. httpx.MockTransport)
+
+    Returns:
+        The opened httpx.AsyncClient.
+    """
+    global _async_client
+    await close_async_client()
+    _async_client = httpx.AsyncClient(
+        timeout=settings.HTTP_TIMEOUT,
+        limits=_limits(),
+        http2=_http2() if transport is None else False,
+        transport=transport,
+    )
+    return _async_client
+
+
+async def close_async_client() -> None:
+    """
+    Close the shared asynchronous HTTP client and its pooled connections.
+    """
+    global _async_client
+    if _async_client is not None:
+        client, _async_client = _async_client, None
+        await client.aclose()
+
+
+def close_client() -> None:
+    """
+    Close the shared synchronous HTTP client and its pooled connections.
+    """
+    global _client
+    if _client is not None:
+        client, _client = _client, None
+        client.close()
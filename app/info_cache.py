@@ -0,0 +1,230 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Tuple
+from .config import Lazy, Setting, flag
+
+################################################################################
+# Read-through cache of the stored weather infos, keyed by (location_id, date),
+# in front of the crud lookups by location and date. Entries are immutable
+# snapshots, or None for dates known to have no info, so that a date range is
+# served from memory once every date of it is cached. The crud functions
+# writing infos invalidate their keys after committing. Other workers' writes
+# are only seen once the entries expire, after INFO_CACHE_TTL seconds, except
+# by readers that know the change-log version of the location: entries are
+# tagged with the version read before their query, and such readers treat
+# older entries as misses.
+################################################################################
+class _Settings:
+    INFO_CACHE_ENABLED = Setting("INFO_CACHE_ENABLED", True, flag)
+    INFO_CACHE_MAX_BYTES = Setting("INFO_CACHE_MAX_MB", 32 * 1024 * 1024, lambda mb: int(float(mb) * 1024 * 1024))
+    INFO_CACHE_TTL = Setting("INFO_CACHE_TTL", 60.0, float)
+
+
+settings = _Settings()
+
+# Longer date ranges bypass the cache rather than fill it with a key per day
+INFO_CACHE_MAX_RANGE_DAYS = 92
+
+# Estimated memory of an entry besides its key and snapshot: the ordered dict
+# node and the (snapshot, expiry, size, version) tuple
+_ENTRY_OVERHEAD = 200
+
+
+
+
+class InfoSnapshot:
+    """
+    An immutable copy of a stored weather info. It has the attributes and the
+    `_fields` of the rows returned by crud functions with `as_rows=True`, and
+    iterates over its values like them.
+    """
+    __slots__ = ("id", "location_id", "date", "temperature", "weather_description", "updated_at")
+    _fields = __slots__
+
+    def __init__(self, *values: Any):
+        for name, value in zip(self.__slots__, values):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __iter__(self):
+        return (getattr(self, name) for name in self.__slots__)
+
+    def __repr__(self) -> str:
+        return f"InfoSnapshot({', '.join(f'{name}={getattr(self, name)!r}' for name in self.__slots__)})"
+
+
+def _size(key: Tuple[int, date], snapshot: Optional[InfoSnapshot]) -> int:
+    """
+    Estimate the memory held by an entry.
+
+    Args:
+        key: The (location_id, date) key
+        snapshot: The cached snapshot, or None
+
+    Returns:
+        The estimated size in bytes.
+    """
+    size = _ENTRY_OVERHEAD + sys.getsizeof(key) + sum(sys.getsizeof(part) for part in key)
+    if snapshot is not None:
+        size += sys.getsizeof(snapshot) + sum(sys.getsizeof(value) for value in snapshot)
+    return size
+
+
+
+
+class InfoCache:
+    """
+    A thread-safe LRU cache of info snapshots with a memory cap and a TTL.
+
+    Fills race with invalidations: a reader that queried the database before
+    a write committed must not cache what it read after the write invalidated
+    the keys. Readers take a `generation()` before querying and pass it to
+    `put_many`, which drops the fill if anything was invalidated meanwhile.
+    Invalidations only reach this worker, and only after the write committed,
+    so entries also carry the change-log version that their reader had read
+    before querying, and `get_many` can require a minimum version.
+
+    Attributes:
+        max_bytes: Estimated memory kept before evicting the least recently used entries,
+            INFO_CACHE_MAX_MB by default
+        ttl: Time to live of the entries, in seconds, INFO_CACHE_TTL by default
+        enabled: Whether the crud functions use the cache, INFO_CACHE_ENABLED by default
+    """
+    def __init__(self, max_bytes: Optional[int] = None, ttl: Optional[float] = None, enabled: Optional[bool] = None):
+        self.max_bytes = settings.INFO_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self.ttl = settings.INFO_CACHE_TTL if ttl is None else ttl
+        self.enabled = settings.INFO_CACHE_ENABLED if enabled is None else enabled
+        self._entries: "OrderedDict[Hashable, Tuple[Optional[InfoSnapshot], float, int, int]]" = OrderedDict()
+        self._bytes = 0
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def generation(self) -> int:
+        """
+        Get the invalidation generation, to pass to `put_many` after querying.
+
+        Returns:
+            The number of invalidations so far.
+        """
+        return self._generation
+
+    def get_many(self, keys: List[Tuple[int, date]], min_version: int = 0) -> Optional[List[Optional[InfoSnapshot]]]:
+        """
+        Look up every key of a lookup at once; a lookup is a hit only when all are cached.
+
+        Args:
+            keys: The (location_id, date) keys
+            min_version: The change-log version the entries must have been read at, if known
+
+        Returns:
+            The snapshot (or None for a date without info) of every key, or None on a miss.
+        """
+        now = time.monotonic()
+        with self._lock:
+            found = []
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None or now >= entry[1] or entry[3] < min_version:
+                    self._counters["misses"] += 1
+                    return None
+                found.append(entry[0])
+            for key in keys:
+                self._entries.move_to_end(key)
+            self._counters["hits"] += 1
+        return found
+
+    def put_many(
+        self, items: Iterable[Tuple[Tuple[int, date], Optional[InfoSnapshot]]], generation: int, version: int = 0
+    ) -> None:
+        """
+        Cache the result of a lookup, unless keys were invalidated since it started.
+
+        Args:
+            items: (key, snapshot or None) pairs
+            generation: The generation taken before querying
+            version: The change-log version read before querying, if known
+        """
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            if generation != self._generation:
+                return
+            for key, snapshot in items:
+                previous = self._entries.pop(key, None)
+                if previous is not None:
+                    self._bytes -= previous[2]
+                size = _size(key, snapshot)
+                self._entries[key] = (snapshot, expires_at, size, version)
+                self._bytes += size
+            while self._bytes > self.max_bytes and self._entries:
+                _, (_, _, size, _) = self._entries.popitem(last=False)
+                self._bytes -= size
+                self._counters["evictions"] += 1
+
+    def invalidate(self, keys: Iterable[Tuple[Optional[int], date]]) -> None:
+        """
+        Remove keys from the cache.
+
+        Args:
+            keys: The (location_id, date) keys of the written infos
+        """
+        with self._lock:
+            self._remove(keys)
+
+    def invalidate_location(self, location_id: int) -> None:
+        """
+        Remove every key of a location from the cache.
+
+        Args:
+            location_id: ID of the location
+        """
+        with self._lock:
+            self._remove([key for key in self._entries if key[0] == location_id])
+
+    def _remove(self, keys: Iterable[Tuple[Optional[int], date]]) -> None:
+        """
+        Remove keys and start a new generation; the caller holds the lock.
+
+        Args:
+            keys: The keys to remove
+        """
+        self._generation += 1
+        for key in keys:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._bytes -= entry[2]
+                self._counters["invalidations"] += 1
+
+    def clear(self) -> None:
+        """
+        Remove every entry from the cache.
+        """
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the cache counters.
+
+        Returns:
+            A dictionary with hit/miss/eviction/invalidation counters, the current
+            size and estimated memory, and the hit ratio.
+        """
+        with self._lock:
+            stats: Dict[str, Any] = dict(self._counters, size=len(self._entries), bytes=self._bytes)
+        lookups = stats["hits"] + stats["misses"]
+        stats.update(
+            enabled=self.enabled, max_bytes=self.max_bytes, ttl=self.ttl,
+            hit_ratio=stats["hits"] / lookups if lookups else 0.0,
+        )
+        return stats
+
+
+info_cache: InfoCache = Lazy(InfoCache)
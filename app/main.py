@@ -1,26 +1,124 @@
-from fastapi import FastAPI, Depends, HTTPException
-from fastapi.encoders import jsonable_encoder
+import asyncio
+import httpx
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from sqlalchemy.orm import Session
-from datetime import date, timedelta
-from . import crud
-from .database_model import WeatherLocation, WeatherInfo
-from .database import Base, engine, get_db
-from .weather_api import get_weather_by_city, get_forecast_by_date_and_city
-from .youtube_api import search_youtube_videos
+from datetime import date, datetime, timedelta
+from typing import Optional, List, Dict, Set, Tuple, Union
+from .config import Setting, flag
+from . import crud, export, http_client, metrics, migrations, pagination, prefetch, profiling, rate_limit, schemas
+from . import conditional, forecast_series, spatial, stats, videos
+from .database_model import WeatherLocation
+from .database import Base, SessionLocal, get_engine, get_db, pool_stats, run_in_session
+from .info_cache import info_cache
+from . import weather_api, youtube_api
+from .weather_api import get_weather_by_city_async, get_weather_by_coords_async, get_forecast_window_async
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Create or upgrade the database schema (unless AUTO_CREATE_SCHEMA is
+    disabled), load the spatial index of the stored locations and start the
+    optional forecast prefetcher on startup. The shared upstream HTTP clients
+    are created on first use, as building their TLS context is slow; they are
+    closed on shutdown.
+
+    Args:
+        app (FastAPI): The application instance.
+    """
+    if settings.AUTO_CREATE_SCHEMA:
+        engine = get_engine()
+        Base.metadata.create_all(bind=engine)
+        migrations.upgrade(engine)
+    with SessionLocal() as db:
+        crud.load_location_index(db)
+    prefetch.start()
+    try:
+        yield
+    finally:
+        await prefetch.stop()
+        await http_client.close_async_client()
+        http_client.close_client()
+
+
+class _Settings:
+    # Batch endpoint limits
+    BATCH_MAX_ITEMS = Setting("BATCH_MAX_ITEMS", 500, int)
+    BATCH_CONCURRENCY = Setting("BATCH_CONCURRENCY", 16, int)
+
+    # Nearby endpoint limit
+    NEARBY_MAX_RESULTS = Setting("NEARBY_MAX_RESULTS", 100, int)
+
+    # Create and upgrade the schema on startup; disable when the schema is
+    # managed separately, e.g. by a deploy step run once for all workers
+    AUTO_CREATE_SCHEMA = Setting("AUTO_CREATE_SCHEMA", True, flag)
+
+
+settings = _Settings()
+
+# Initialize the api
+app = FastAPI(title="Weather APP Backend API", lifespan=lifespan)
+app.add_middleware(metrics.MetricsMiddleware)
+app.add_middleware(profiling.ProfilingMiddleware)
+
+
+@app.exception_handler(rate_limit.RateLimitExceeded)
+async def rate_limit_exceeded_handler(request: Request, exc: rate_limit.RateLimitExceeded):
+    """
+    Answer with 429 Too Many Requests when an upstream call budget is exhausted.
+
+    Args:
+        request (Request): The incoming request.
+        exc (RateLimitExceeded): The rate limit error.
+
+    Returns:
+        JSONResponse: A 429 response with a Retry-After header.
+    """
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(max(1, int(exc.retry_after + 0.999)))},
+    )
+
+
+
+def _decode_id_cursor(cursor: str, limit: int) -> Optional[int]:
+    """
+    Validate a keyset pagination request and decode its cursor.
+
+    Args:
+        cursor (str): The cursor of the page, empty for the first page.
+        limit (int): The page size.
+
+    Raises:
+        HTTPException: If the cursor or the limit is invalid, a 400 error is raised.
+
+    Returns:
+        Optional[int]: The ID of the last row of the previous page, or None for the first page.
+    """
+    if limit < 1:
+        raise HTTPException(status_code=400, detail="limit must be a positive integer with a cursor")
+    try:
+        after_id = pagination.decode_cursor(cursor).get("id")
+    except ValueError as err:
+        raise HTTPException(status_code=400, detail=str(err))
+    if after_id is not None and not isinstance(after_id, int):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return after_id
 
-# Initialize the database and api
-Base.metadata.create_all(bind=engine)
-app = FastAPI(title="Weather APP Backend API")
 
 
 
 ################################################################################
 # WeatherLocation API Endpoints
 ################################################################################
-@app.post("/locations/", summary="Create a new location")
-def create_location(location: dict, db: Session = Depends(get_db)):
+@app.post("/locations/", summary="Create a new location", response_model=schemas.LocationOut)
+async def create_location(location: dict):
     """
-    Create a new location in the database.
+    Create a new location in the database. The database work runs in the
+    threadpool, after the coordinates are looked up.
 
     Args:
         location (dict): A dictionary containing location data. Expected keys are:
@@ -28,7 +126,6 @@ def create_location(location: dict, db: Session = Depends(get_db)):
             - country: The country code (optional)
             - lat: Latitude (optional)
             - lon: Longitude (optional)
-        db (Session, optional): A database session. Defaults to Depends(get_db).
     
     Raises:
         HTTPException: If the city is not provided or if the location already exists, a 400 error is raised.
@@ -46,42 +143,116 @@ def create_location(location: dict, db: Session = Depends(get_db)):
         raise HTTPException(status_code=400, detail="city is required")
     if not lat or not lon:
         # Fetch lat/lon from OpenWeather API if not provided
-        data = get_weather_by_city(city, country)
+        data = await get_weather_by_city_async(city, country)
         lat = data["coord"]["lat"]
         lon = data["coord"]["lon"]
         
-    # Check if required location is present
-    db_loc = crud.get_location_by_city(db, city, country)
-    if db_loc:
-        raise HTTPException(status_code=400, detail="Location already exists")
-    
-    # Create new location  
-    db_loc = crud.create_location(db, city=city, country=country, lat=lat, lon=lon)
-    return db_loc
+    def store(db: Session) -> WeatherLocation:
+        # Check if required location is present
+        if crud.get_location_by_city(db, city, country):
+            raise HTTPException(status_code=400, detail="Location already exists")
+
+        # Create new location
+        return crud.create_location(db, city=city, country=country, lat=lat, lon=lon)
+
+    return await run_in_session(store)
 
 
 
 
-@app.get("/locations/", summary="List locations")
-def list_locations(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+@app.get("/locations/", summary="List locations", response_model=Union[List[schemas.LocationOut], schemas.LocationPage])
+def list_locations(
+    request: Request, skip: int = 0, limit: int = 100, cursor: Optional[str] = None, db: Session = Depends(get_db)
+):
     """
-    List all stored locations with pagination.
+    List all stored locations with pagination. Passing `cursor` (empty for the
+    first page, then the returned `next_cursor`) switches to keyset pagination,
+    whose cost does not grow with the page depth. Polls with the ETag or
+    Last-Modified of an unchanged list are answered with a 304.
 
     Args:
+        request (Request): The request, for its conditional headers.
         skip (int, optional): How many records to skip. Defaults to 0.
         limit (int, optional): How many records to return. Defaults to 100.
+        cursor (str, optional): Keyset pagination cursor. Defaults to None (offset pagination).
         db (Session, optional): A database session. Defaults to Depends(get_db).
         
+    Raises:
+        HTTPException: If the cursor or the limit is invalid, a 400 error is raised.
+
     Returns:
-        List[WeatherLocation]: A list of WeatherLocation objects.
+        List[WeatherLocation]: A list of WeatherLocation objects, or with a cursor a
+        dictionary with the `items` and the `next_cursor`.
+    """
+    after_id = _decode_id_cursor(cursor, limit) if cursor is not None else None
+    headers = conditional.validators("locations", crud.get_version(db, table_name="locations"))
+    if conditional.is_not_modified(request, headers):
+        return conditional.not_modified(headers)
+    if cursor is None:
+        response = schemas.json_response(schemas.records(crud.list_locations(db, skip=skip, limit=limit, as_rows=True)))
+    else:
+        page = pagination.keyset_page(crud.list_locations_after(db, after_id, limit + 1, as_rows=True), limit)
+        response = schemas.json_response(dict(page, items=schemas.records(page["items"])))
+    response.headers.update(headers)
+    return response
+
+
+
+
+@app.get("/locations/nearby", summary="Find the stored locations closest to a position")
+async def nearby_locations(
+    lat: float,
+    lon: float,
+    k: int = 5,
+    radius_km: Optional[float] = None,
+    include_weather: bool = False
+):
     """
-    return crud.list_locations(db, skip=skip, limit=limit)
+    Find the `k` stored locations closest to a position, optionally within
+    `radius_km`, using the in-memory spatial index. With `include_weather`, the
+    current weather of each location is fetched by its coordinates, so a
+    client can reuse a nearby stored location instead of creating a new one.
+    The locations are read in the threadpool.
+
+    Args:
+        lat (float): Latitude of the position.
+        lon (float): Longitude of the position.
+        k (int, optional): Maximum number of locations to return. Defaults to 5.
+        radius_km (float, optional): Maximum distance in kilometers. Defaults to None (no limit).
+        include_weather (bool, optional): Whether to add the current weather of each location. Defaults to False.
+
+    Raises:
+        HTTPException: If a parameter is out of range, a 400 error is raised.
 
+    Returns:
+        List[dict]: The locations with their `distance_km` (and `weather`), closest first.
+    """
+    if not -90 <= lat <= 90 or not -180 <= lon <= 180:
+        raise HTTPException(status_code=400, detail="lat must be in [-90, 90] and lon in [-180, 180]")
+    if not 1 <= k <= settings.NEARBY_MAX_RESULTS:
+        raise HTTPException(status_code=400, detail=f"k must be between 1 and {settings.NEARBY_MAX_RESULTS}")
+    if radius_km is not None and radius_km < 0:
+        raise HTTPException(status_code=400, detail="radius_km must be non-negative")
+
+    nearest = spatial.location_index.nearest(lat, lon, k=k, radius_km=radius_km)
+    found = await run_in_session(crud.get_locations, [loc_id for loc_id, _ in nearest])
+    locations = {loc.id: loc for loc in found}
+    results = [
+        {"location": schemas.LocationOut.model_validate(locations[loc_id]), "distance_km": round(distance, 3)}
+        for loc_id, distance in nearest if loc_id in locations
+    ]
+    if include_weather:
+        weathers = await asyncio.gather(*(
+            get_weather_by_coords_async(result["location"].lat, result["location"].lon) for result in results
+        ))
+        for result, weather in zip(results, weathers):
+            result["weather"] = weather
+    return results
 
 
 
 
-@app.delete("/locations/{location_id}", summary="Delete a location")
+@app.delete("/locations/{location_id}", summary="Delete a location", response_model=schemas.LocationOut)
 def delete_location(location_id: int, db: Session = Depends(get_db)):
     """
     Delete a location by its ID.
@@ -99,6 +270,7 @@ def delete_location(location_id: int, db: Session = Depends(get_db)):
     loc = crud.delete_location(db, location_id)
     if not loc:
         raise HTTPException(status_code=404, detail="Location not found")
+    videos.invalidate(location_id)
     return loc
 
 
@@ -107,26 +279,20 @@ def delete_location(location_id: int, db: Session = Depends(get_db)):
 ################################################################################
 # WeatherInfo API Endpoints
 ################################################################################
-@app.post("/weather_infos/", summary="Fetch and store weather info for a location and date range")
-def create_info(input: dict, db: Session = Depends(get_db)):
+def _parse_info_request(input: dict) -> Tuple[str, Optional[str], date, date]:
     """
-    Fetch and store weather information for a given location and date range.
+    Validate a request to fetch weather info for a location and date range.
 
     Args:
-        input (dict): A dictionary containing the following
-            - city: The name of the city
-            - country: The country code (optional)
-            - start_date: The start date for the weather info (expected format: YYYY-MM-DD)
-            - end_date: The end date for the weather info (expected format: YYYY-MM-DD)
-        db (Session, optional): A database session. Defaults to Depends(get_db).
+        input (dict): A dictionary containing the city, the optional country,
+            the start_date and the end_date (expected format: YYYY-MM-DD).
 
     Raises:
-        HTTPException: If the input is invalid or if the location is not found, a 400 error is raised.
+        HTTPException: If the input is invalid, a 400 error is raised.
 
     Returns:
-        WeatherInfo: The created WeatherInfo object.
+        Tuple[str, Optional[str], date, date]: The city, the country and the date range.
     """
-    # Validate input
     city = input.get("city")
     country = input.get("country")
     start_date = input.get("start_date")  
@@ -140,7 +306,7 @@ def create_info(input: dict, db: Session = Depends(get_db)):
     try:
         start = date.fromisoformat(start_date)
         end = date.fromisoformat(end_date)
-    except ValueError:
+    except (TypeError, ValueError):
         raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
     if start > end:
         raise HTTPException(status_code=400, detail="start_date must be before end_date")
@@ -153,65 +319,278 @@ def create_info(input: dict, db: Session = Depends(get_db)):
     if (start > date.today() + timedelta(days=5) or 
         end > date.today() + timedelta(days=5)):
         raise HTTPException(status_code=400, detail="Max 5 days forecast supported in free OpenWeather API")
-    
-    # Get or create location
-    loc = crud.get_location_by_city(db, city, country)
-    if not loc:
-        data = get_weather_by_city(city, country)
-        loc = crud.create_location(db, city=city, country=country,
-                                   lat=data["coord"]["lat"], lon=data["coord"]["lon"])
-    
-    # For each date in range, fetch weather data and store it
-    infos = []
+    return city, country, start, end
+
+
+async def _fetch_missing_rows(
+    city: str, country: Optional[str], start: date, end: date, stored: Set[date]
+) -> Tuple[List[dict], Optional[dict]]:
+    """
+    Fetch the weather of every date of a range that is not stored yet. The
+    forecast is fetched at most once and shared by every day of the range.
+
+    Args:
+        city (str): The name of the city.
+        country (Optional[str]): The country code.
+        start (date): The start date of the range.
+        end (date): The end date of the range.
+        stored (Set[date]): The dates already stored.
+
+    Raises:
+        HTTPException: If no forecast is available for a date, a 404 error is raised.
+
+    Returns:
+        Tuple[List[dict], Optional[dict]]: Rows with the keys 'date', 'temperature' and
+        'weather_description', and the raw forecast payload if it was fetched.
+    """
+    rows = []
+    window = None
     current = start
     while current <= end:
-        # Check if the weather info for the current date already exists
-        info = crud.get_info_by_loc_date(db, location_id=loc.id, date=current)
-        if not info:
-            # Info for current date does not exist, fetch weather data for the current date
+        if current not in stored:
             if current == date.today():
-                info_data = get_weather_by_city(city, country)
+                info_data = await get_weather_by_city_async(city, country)
             else:
-                info_data = get_forecast_by_date_and_city(current, city, country)
-            # Store the weather info in the database
-            temp = info_data["main"]["temp"]
-            desc = info_data["weather"][0]["description"]
-            raw = str(info_data)
-            info = crud.create_info(
-                db,
-                location_id=loc.id,
-                info_date=current,
-                temperature=temp,
-                weather_description=desc
-                # raw_data=raw
-            )
-        infos.append(jsonable_encoder(info))
+                if window is None:
+                    window = await get_forecast_window_async(city, country)
+                info_data = window.get(current)
+                if info_data is None:
+                    raise HTTPException(status_code=404, detail=f"No forecast available for {current.isoformat()}")
+            rows.append({
+                "date": current,
+                "temperature": info_data["main"]["temp"],
+                "weather_description": info_data["weather"][0]["description"],
+            })
         current += timedelta(days=1)
-    return infos
+    return rows, window.forecast if window is not None else None
+
+
+
+
+@app.post(
+    "/weather_infos/",
+    summary="Fetch and store weather info for a location and date range",
+    response_model=List[schemas.WeatherInfoOut]
+)
+async def create_info(input: dict):
+    """
+    Fetch and store weather information for a given location and date range.
+    The database phases run in the threadpool, each with its own session, so
+    none is held while the upstream data is fetched.
+
+    Args:
+        input (dict): A dictionary containing the following
+            - city: The name of the city
+            - country: The country code (optional)
+            - start_date: The start date for the weather info (expected format: YYYY-MM-DD)
+            - end_date: The end date for the weather info (expected format: YYYY-MM-DD)
+
+    Raises:
+        HTTPException: If the input is invalid or if the location is not found, a 400 error is raised.
+
+    Returns:
+        List[WeatherInfo]: The WeatherInfo objects of every date in the range.
+    """
+    # Validate input
+    city, country, start, end = _parse_info_request(input)
+    
+    # Get the location and the dates of the range already stored
+    def load(db: Session) -> Tuple[Optional[int], list]:
+        loc = crud.get_location_by_city(db, city, country)
+        if not loc:
+            return None, []
+        return loc.id, crud.get_infos_by_loc_date_range(db, loc.id, start, end, as_rows=True)
+
+    def create(db: Session, lat: float, lon: float) -> int:
+        return crud.create_location(db, city=city, country=country, lat=lat, lon=lon).id
+
+    location_id, infos = await run_in_session(load)
+    if location_id is None:
+        data = await get_weather_by_city_async(city, country)
+        location_id = await run_in_session(create, data["coord"]["lat"], data["coord"]["lon"])
+    
+    # Fetch the missing dates
+    rows, forecast = await _fetch_missing_rows(city, country, start, end, {info.date for info in infos})
+    
+    # Store every missing date and the whole forecast series in one transaction
+    def store(db: Session) -> list:
+        if forecast is not None:
+            forecast_series.store(db, {location_id: forecast}, commit=False)
+        crud.upsert_infos(db, location_id=location_id, rows=rows)
+        return crud.get_infos_by_loc_date_range(db, location_id, start, end, as_rows=True)
+
+    if rows:
+        infos = await run_in_session(store)
+    return schemas.json_response(schemas.records(infos))
+
+
+
+
+@app.post("/weather_infos/batch", summary="Fetch and store weather info for many locations and date ranges")
+async def create_infos_batch(inputs: List[dict]):
+    """
+    Fetch and store weather information for many locations at once. Locations
+    are resolved with one query, missing upstream data is fetched concurrently
+    (at most BATCH_CONCURRENCY items at a time) and everything is written in
+    one transaction. The database phases run in the threadpool, each with its
+    own session, so none is held while the upstream data is fetched.
+
+    Args:
+        inputs (List[dict]): A list of dictionaries with the same keys as POST /weather_infos/.
+
+    Raises:
+        HTTPException: If the batch holds more than BATCH_MAX_ITEMS items, a 400 error is raised.
+
+    Returns:
+        List[dict]: One result per input item, in order: either
+        {"index", "status": "ok", "location_id", "infos"} or
+        {"index", "status": "error", "status_code", "detail"}.
+    """
+    if len(inputs) > settings.BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {settings.BATCH_MAX_ITEMS} items per batch")
+    results: List[Optional[dict]] = [None] * len(inputs)
+    semaphore = asyncio.Semaphore(settings.BATCH_CONCURRENCY)
+
+    def fail(index: int, err: Exception) -> None:
+        if isinstance(err, HTTPException):
+            status_code, detail = err.status_code, err.detail
+        elif isinstance(err, rate_limit.RateLimitExceeded):
+            status_code, detail = 429, str(err)
+        elif isinstance(err, httpx.HTTPStatusError) and err.response.status_code == 404:
+            status_code, detail = 404, "City not found"
+        elif isinstance(err, httpx.HTTPStatusError):
+            status_code, detail = 502, f"Upstream error {err.response.status_code}"
+        elif isinstance(err, httpx.HTTPError):
+            status_code, detail = 502, "Upstream request failed"
+        else:
+            raise err
+        results[index] = {"index": index, "status": "error", "status_code": status_code, "detail": detail}
+
+    # Validate every item
+    requests = {}
+    for index, input in enumerate(inputs):
+        try:
+            requests[index] = _parse_info_request(input)
+        except HTTPException as err:
+            fail(index, err)
+
+    # Resolve every location with one query, matching like crud.get_location_by_city
+    locations = await run_in_session(crud.get_locations_by_cities, [city for city, _, _, _ in requests.values()])
+    location_ids: Dict[Tuple[str, Optional[str]], int] = {}
+    for city, country, _, _ in requests.values():
+        match = next((loc for loc in locations if loc.city == city and (not country or loc.country == country)), None)
+        if match is not None:
+            location_ids[(city, country)] = match.id
+
+    # Create the missing locations, looking up their coordinates concurrently
+    async def lookup(city: str, country: Optional[str]) -> dict:
+        async with semaphore:
+            data = await get_weather_by_city_async(city, country)
+        return {"city": city, "country": country, "lat": data["coord"]["lat"], "lon": data["coord"]["lon"]}
+
+    missing = list({(city, country) for city, country, _, _ in requests.values()} - set(location_ids))
+    lookups = await asyncio.gather(*(lookup(*key) for key in missing), return_exceptions=True)
+    new_locations = []
+    for key, found in zip(missing, lookups):
+        if isinstance(found, Exception):
+            for index, (city, country, _, _) in list(requests.items()):
+                if (city, country) == key:
+                    fail(index, found)
+                    del requests[index]
+        else:
+            new_locations.append(found)
+    if not requests:
+        return results
+
+    # Insert the new locations, then find the stored dates of every item with one query
+    first = min(start for _, _, start, _ in requests.values())
+    last = max(end for _, _, _, end in requests.values())
+
+    def prepare(db: Session) -> list:
+        for created in crud.create_locations(db, new_locations):
+            location_ids[(created.city, created.country)] = created.id
+        return crud.get_infos_by_locs_date_range(db, list(location_ids.values()), first, last, as_rows=True)
+
+    stored: Dict[int, Set[date]] = {}
+    for info in await run_in_session(prepare):
+        stored.setdefault(info.location_id, set()).add(info.date)
+
+    # Fetch the missing dates of every item concurrently
+    async def fetch(city: str, country: Optional[str], start: date, end: date) -> Tuple[List[dict], Optional[dict]]:
+        async with semaphore:
+            loc_id = location_ids[(city, country)]
+            return await _fetch_missing_rows(city, country, start, end, stored.get(loc_id, set()))
+
+    fetched = await asyncio.gather(*(fetch(*request) for request in requests.values()), return_exceptions=True)
+    rows_by_location: Dict[int, List[dict]] = {}
+    forecasts: Dict[int, dict] = {}
+    for (index, (city, country, _, _)), found in zip(list(requests.items()), fetched):
+        if isinstance(found, Exception):
+            fail(index, found)
+            del requests[index]
+        else:
+            rows, forecast = found
+            rows_by_location.setdefault(location_ids[(city, country)], []).extend(rows)
+            if forecast is not None:
+                forecasts[location_ids[(city, country)]] = forecast
+
+    # Store everything in one transaction with the forecast series, then read every item back with one query
+    def store(db: Session) -> list:
+        forecast_series.store(db, forecasts, commit=False)
+        crud.bulk_upsert_infos(db, rows_by_location)
+        return crud.get_infos_by_locs_date_range(db, list(location_ids.values()), first, last, as_rows=True)
+
+    infos_by_location: Dict[int, List[dict]] = {}
+    for info in schemas.records(await run_in_session(store)):
+        infos_by_location.setdefault(info["location_id"], []).append(info)
+    for index, (city, country, start, end) in requests.items():
+        loc_id = location_ids[(city, country)]
+        results[index] = {
+            "index": index,
+            "status": "ok",
+            "location_id": loc_id,
+            "infos": [info for info in infos_by_location.get(loc_id, []) if start <= info["date"] <= end],
+        }
+    return schemas.json_response(results)
     
 
 
 
-@app.get("/weather_infos/", summary="List stored weather infos")
-def list_infos(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+@app.get(
+    "/weather_infos/",
+    summary="List stored weather infos",
+    response_model=Union[List[schemas.WeatherInfoOut], schemas.WeatherInfoPage]
+)
+def list_infos(skip: int = 0, limit: int = 100, cursor: Optional[str] = None, db: Session = Depends(get_db)):
     """
-    List all stored weather information with pagination.
+    List all stored weather information with pagination. Passing `cursor` (empty
+    for the first page, then the returned `next_cursor`) switches to keyset
+    pagination, whose cost does not grow with the page depth.
 
     Args:
         skip (int, optional): item to skip for pagination. Defaults to 0.
         limit (int, optional): maximum number of items to return. Defaults to 100.
+        cursor (str, optional): Keyset pagination cursor. Defaults to None (offset pagination).
         db (Session, optional): A database session. Defaults to Depends(get_db).
         
+    Raises:
+        HTTPException: If the cursor or the limit is invalid, a 400 error is raised.
+
     Returns:
-        List[WeatherInfo]: A list of WeatherInfo objects.
+        List[WeatherInfo]: A list of WeatherInfo objects, or with a cursor a
+        dictionary with the `items` and the `next_cursor`.
     """
-    return crud.list_infos(db, skip=skip, limit=limit)
+    if cursor is None:
+        return schemas.json_response(schemas.records(crud.list_infos(db, skip=skip, limit=limit, as_rows=True)))
+    after_id = _decode_id_cursor(cursor, limit)
+    page = pagination.keyset_page(crud.list_infos_after(db, after_id, limit + 1, as_rows=True), limit)
+    return schemas.json_response(dict(page, items=schemas.records(page["items"])))
 
 
 
 
 
-@app.get("/weather_infos/{info_id}", summary="Get a specific weather info")
+@app.get("/weather_infos/{info_id}", summary="Get a specific weather info", response_model=schemas.WeatherInfoOut)
 def get_info(info_id: int, db: Session = Depends(get_db)):
     """
     Get a specific weather info by its ID.
@@ -234,7 +613,7 @@ def get_info(info_id: int, db: Session = Depends(get_db)):
 
 
 
-@app.put("/weather_infos/{info_id}", summary="Update weather info fields")
+@app.put("/weather_infos/{info_id}", summary="Update weather info fields", response_model=schemas.WeatherInfoOut)
 def update_info(info_id: int, updates: dict, db: Session = Depends(get_db)):
     """
     Update specific fields of a weather info.
@@ -261,7 +640,7 @@ def update_info(info_id: int, updates: dict, db: Session = Depends(get_db)):
 
 
 
-@app.delete("/weather_infos/{info_id}", summary="Delete weather info")
+@app.delete("/weather_infos/{info_id}", summary="Delete weather info", response_model=schemas.WeatherInfoOut)
 def delete_weather_info(info_id: int, db: Session = Depends(get_db)):
     """
     Delete a weather info by its ID.
@@ -284,7 +663,11 @@ def delete_weather_info(info_id: int, db: Session = Depends(get_db)):
 
 
 
-@app.get("/weather_infos/by_loc_date/{location_id}", summary="Get infos by location and specific date")
+@app.get(
+    "/weather_infos/by_loc_date/{location_id}",
+    summary="Get infos by location and specific date",
+    response_model=schemas.WeatherInfoOut
+)
 def get_info_by_loc_date(location_id: int, look_up_date: str, db: Session = Depends(get_db)):
     """
     Retrieve weather information for a specific location and date.
@@ -308,12 +691,21 @@ def get_info_by_loc_date(location_id: int, look_up_date: str, db: Session = Depe
 
 
 
-@app.get("/weather_infos/by_loc_date_range/{location_id}", summary="Get infos by location and date range")
-def get_infos_by_loc_date_range(location_id: int, start_date: str, end_date: str, db: Session = Depends(get_db)):
+@app.get(
+    "/weather_infos/by_loc_date_range/{location_id}",
+    summary="Get infos by location and date range",
+    response_model=List[schemas.WeatherInfoOut]
+)
+def get_infos_by_loc_date_range(
+    request: Request, location_id: int, start_date: str, end_date: str, db: Session = Depends(get_db)
+):
     """
     Retrieve weather information for a specific location and date range.
+    Polls with the ETag or Last-Modified of an unchanged location are
+    answered with a 304.
 
     Args:
+        request (Request): The request, for its conditional headers.
         location_id (int): The ID of the location.
         start_date (str): The start date for the range (format: YYYY-MM-DD).
         end_date (str): The end date for the range (format: YYYY-MM-DD).
@@ -327,35 +719,344 @@ def get_infos_by_loc_date_range(location_id: int, start_date: str, end_date: str
         end = date.fromisoformat(end_date)
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
-    infos = crud.get_infos_by_loc_date_range(db, location_id, start, end)
+    version = crud.get_version(db, location_id=location_id)
+    headers = conditional.validators(f"location-{location_id}", version)
+    if conditional.is_not_modified(request, headers):
+        return conditional.not_modified(headers)
+    infos = crud.get_infos_by_loc_date_range(db, location_id, start, end, as_rows=True, min_version=version[0])
     if not infos:
         raise HTTPException(status_code=404, detail="Weather info not found")
-    return infos
+    response = schemas.json_response(schemas.records(infos))
+    response.headers.update(headers)
+    return response
+
+
+################################################################################
+# Forecast Series API Endpoints
+################################################################################
+def _get_series(db: Session, location_id: int) -> forecast_series.ForecastSeries:
+    """
+    Load the stored forecast series of a location.
+
+    Args:
+        db (Session): A database session.
+        location_id (int): The ID of the location.
+
+    Raises:
+        HTTPException: If no forecast of the location is stored, a 404 error is raised.
+
+    Returns:
+        ForecastSeries: The forecast series.
+    """
+    series = forecast_series.get_series(db, location_id)
+    if series is None:
+        raise HTTPException(status_code=404, detail="Forecast not found")
+    return series
+
+
+@app.get("/forecasts/{location_id}", summary="Get the stored 3-hour forecast of a location")
+def get_forecast(location_id: int, day: Optional[str] = None, at: Optional[str] = None, db: Session = Depends(get_db)):
+    """
+    Retrieve the 3-hour slots of the latest stored forecast of a location,
+    without calling the upstream API.
+
+    Args:
+        location_id (int): The ID of the location.
+        day (str, optional): Only the slots of this date, in UTC (format: YYYY-MM-DD). Defaults to None.
+        at (str, optional): Only the slot covering this time, in UTC unless an offset is given
+            (format: YYYY-MM-DDTHH:MM). Defaults to None.
+        db (Session, optional): A database session. Defaults to Depends(get_db).
+
+    Raises:
+        HTTPException: If a parameter is invalid, a 400 error is raised. If no forecast is
+        stored or it does not cover the requested time, a 404 error is raised.
+
+    Returns:
+        dict: The location ID, when the forecast was stored and the list of slots with
+        their start time, temperature, humidity, wind speed and pressure.
+    """
+    try:
+        day_date = date.fromisoformat(day) if day else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
+    try:
+        moment = datetime.fromisoformat(at) if at else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid time format. Use YYYY-MM-DDTHH:MM")
+    series = _get_series(db, location_id)
+    if moment is not None:
+        slot = series.at(moment)
+        if slot is None:
+            raise HTTPException(status_code=404, detail=f"No forecast available for {at}")
+        slots = [slot]
+    else:
+        slots = series.slots(day_date)
+    return schemas.json_response({"location_id": location_id, "fetched_at": series.fetched_at, "slots": slots})
+
+
+@app.get("/forecasts/{location_id}/daily", summary="Get daily statistics of the stored forecast of a location")
+def get_forecast_daily(location_id: int, db: Session = Depends(get_db)):
+    """
+    Compute the min, max and mean temperature, humidity, wind speed and pressure
+    per date of the latest stored forecast of a location.
+
+    Args:
+        location_id (int): The ID of the location.
+        db (Session, optional): A database session. Defaults to Depends(get_db).
+
+    Raises:
+        HTTPException: If no forecast of the location is stored, a 404 error is raised.
+
+    Returns:
+        dict: The location ID, when the forecast was stored and one dictionary per
+        date (UTC) with the number of slots and the statistics of every field.
+    """
+    series = _get_series(db, location_id)
+    return schemas.json_response({"location_id": location_id, "fetched_at": series.fetched_at, "days": series.daily()})
+
+
+################################################################################
+# Statistics API Endpoints
+################################################################################
+@app.get("/stats", summary="Get temperature statistics per location and period")
+def temperature_stats(
+    period: str = "week",
+    by_location: bool = True,
+    location_ids: str = "",
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    percentiles: str = "",
+    db: Session = Depends(get_db)
+):
+    """
+    Aggregate the stored temperatures per location and period on the server.
+
+    Args:
+        period (str, optional): 'day', 'week' (starting on Monday), 'month' or 'all'. Defaults to 'week'.
+        by_location (bool, optional): Whether to group by location. Defaults to True.
+        location_ids (str, optional): Comma-separated IDs of the locations to include. Defaults to all.
+        start_date (str, optional): The first date to include (format: YYYY-MM-DD). Defaults to None.
+        end_date (str, optional): The last date to include (format: YYYY-MM-DD). Defaults to None.
+        percentiles (str, optional): Comma-separated percentiles to compute, e.g. '50,90'. Defaults to none.
+        db (Session, optional): A database session. Defaults to Depends(get_db).
+
+    Raises:
+        HTTPException: If a parameter is invalid, a 400 error is raised.
+
+    Returns:
+        List[dict]: One dictionary per group with the location ID, the first day of the
+        period, the count, min, max, mean and the requested percentiles.
+    """
+    try:
+        ids = [int(i) for i in location_ids.split(",") if i.strip()] if location_ids else None
+        qs = [float(q) for q in percentiles.split(",") if q.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="location_ids and percentiles must be comma-separated numbers")
+    try:
+        start = date.fromisoformat(start_date) if start_date else None
+        end = date.fromisoformat(end_date) if end_date else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
+    try:
+        return stats.temperature_stats(
+            db,
+            period=None if period == "all" else period,
+            by_location=by_location,
+            location_ids=ids,
+            start_date=start,
+            end_date=end,
+            percentiles=qs,
+        )
+    except ValueError as err:
+        raise HTTPException(status_code=400, detail=str(err))
 
 
 ################################################################################
 # Data Export API Endpoints
 ################################################################################
 @app.get("/export/json", summary="Export all weather infos and location as JSON")
-def export_json(db: Session = Depends(get_db)):
-    data = [ 
-      {
-        "id": info.id,
-        "date": info.date.isoformat(),
-        "temperature": info.temperature,
-        "description": info.weather_description,
-        # "raw_data": info.raw_data,
-        "location": {
-            "id": info.location.id,
-            "city": info.location.city,
-            "country": info.location.country,
-            "lat": info.location.lat,
-            "lon": info.location.lon
-        }
-      }
-      for info in crud.list_infos(db, skip=0, limit=-1) 
-    ]
-    return data
+def export_json(request: Request, format: str = "json", gzip: bool = False, db: Session = Depends(get_db)):
+    """
+    Stream every stored weather info together with its location. The
+    `X-Change-Token` response header holds the resume token to pass to
+    /export/changes for incremental exports. Polls with the ETag or
+    Last-Modified of an unchanged database are answered with a 304.
+
+    Args:
+        request (Request): The request, for its conditional headers.
+        format (str, optional): One of 'json' (a JSON array), 'ndjson' (one JSON record
+            per line) or 'csv'. Defaults to 'json'.
+        gzip (bool, optional): Whether to gzip-compress the response. Defaults to False.
+        db (Session, optional): A database session. Defaults to Depends(get_db).
+
+    Raises:
+        HTTPException: If the format is not supported, a 400 error is raised.
+
+    Returns:
+        StreamingResponse: The exported records, streamed in chunks.
+    """
+    try:
+        body = export.stream_export(format, gzip=gzip)
+    except ValueError as err:
+        raise HTTPException(status_code=400, detail=str(err))
+    headers = conditional.validators("export", crud.get_version(db))
+    if conditional.is_not_modified(request, headers):
+        return conditional.not_modified(headers)
+    # The token is taken before streaming, so changes made meanwhile are re-sent
+    headers["X-Change-Token"] = export.change_token(db)
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(body, media_type=export.MEDIA_TYPES[format], headers=headers)
+
+
+
+
+@app.get("/export/changes", summary="Export weather infos and locations changed since a token")
+def export_changes(since: str = "", limit: int = 1000, db: Session = Depends(get_db)):
+    """
+    Export only the weather infos and locations changed or deleted since a
+    previous export.
+
+    Args:
+        since (str, optional): The resume token of the previous export (`next_token`, or the
+            `X-Change-Token` header of /export/json). Defaults to every logged change.
+        limit (int, optional): Maximum number of changes consumed per call. Defaults to 1000.
+        db (Session, optional): A database session. Defaults to Depends(get_db).
+
+    Raises:
+        HTTPException: If the token or the limit is invalid, a 400 error is raised.
+
+    Returns:
+        dict: The changed records and deleted IDs per table, the next resume token
+        and whether more changes are pending.
+    """
+    if limit < 1:
+        raise HTTPException(status_code=400, detail="limit must be a positive integer")
+    try:
+        return export.changes_since(db, since, limit=limit)
+    except ValueError as err:
+        raise HTTPException(status_code=400, detail=str(err))
+
+
+################################################################################
+# Operations API Endpoints
+################################################################################
+@app.get("/ops/stats", summary="Get runtime statistics")
+def ops_stats():
+    """
+    Get runtime statistics of the weather, video and weather info caches, request
+    coalescing, upstream rate limiters (including the remaining daily
+    budgets), the spatial index and the database connection pool.
+
+    Returns:
+        dict: A dictionary of statistics keyed by component.
+    """
+    return {
+        "weather_cache": weather_api.cache_stats(),
+        "weather_coalescing": weather_api.coalescing_stats(),
+        "youtube_coalescing": youtube_api.coalescing_stats(),
+        "video_cache": videos.stats(),
+        "info_cache": info_cache.stats(),
+        "prefetch": prefetch.stats(),
+        "rate_limits": rate_limit.all_stats(),
+        "spatial_index": spatial.location_index.stats(),
+        "db_pool": pool_stats(),
+    }
+
+
+
+
+@app.get("/metrics", summary="Get metrics in the Prometheus text format", response_class=PlainTextResponse)
+def get_metrics():
+    """
+    Get the metrics of this worker process in the Prometheus text exposition
+    format: request latency and SQL statements per route, upstream call latency
+    and status per endpoint, SQL statement time, connection pool usage and
+    cache hit ratios.
+
+    Returns:
+        PlainTextResponse: The exposition text.
+    """
+    pool = pool_stats()
+    for state, key in (("checked_in", "checkedin"), ("checked_out", "checkedout"), ("overflow", "overflow")):
+        if key in pool:
+            metrics.DB_POOL_CONNECTIONS.set(max(0, pool[key]), (state,))
+    if "size" in pool:
+        metrics.DB_POOL_SIZE.set(pool["size"])
+    info = info_cache.stats()
+    for name, cache in (("weather", weather_api.cache_stats()), ("video", videos.stats()["memory"]), ("info", info)):
+        metrics.CACHE_ENTRIES.set(cache["size"], (name,))
+        metrics.CACHE_HIT_RATIO.set(cache["hit_ratio"], (name,))
+    metrics.CACHE_MEMORY.set(info["bytes"], ("info",))
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+
+
+def _check_profile_access(request: Request) -> None:
+    """
+    Allow the profile endpoints only to requests carrying the
+    'X-Profile: <PROFILE_TOKEN>' header.
+
+    Args:
+        request (Request): The request.
+
+    Raises:
+        HTTPException: If profiling is disabled, a 404 error is raised. If the header
+            is missing or does not match PROFILE_TOKEN, a 403 error is raised.
+    """
+    if not profiling.enabled():
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not profiling.authorized(request.headers.get("x-profile")):
+        raise HTTPException(status_code=403, detail="Missing or invalid X-Profile token")
+
+
+@app.get("/debug/profiles", summary="List the latest request profiles")
+def list_profiles(request: Request):
+    """
+    List the profiles of the latest profiled requests kept by this worker.
+    Requests are profiled when sent with the 'X-Profile: <PROFILE_TOKEN>'
+    header, or at random with the PROFILE_SAMPLE_RATE probability. Reading
+    the profiles requires the same header.
+
+    Args:
+        request (Request): The request, for its X-Profile header.
+
+    Raises:
+        HTTPException: If profiling is disabled, a 404 error is raised. Without
+            the X-Profile token, a 403 error is raised.
+
+    Returns:
+        List[dict]: One summary per profile, newest first, with its SQL statement
+        count and time and the number of N+1 patterns found.
+    """
+    _check_profile_access(request)
+    return profiling.list_reports()
+
+
+@app.get("/debug/profiles/{profile_id}", summary="Get a request profile")
+def get_profile(request: Request, profile_id: str):
+    """
+    Get the full profile of a request: its ordered SQL statements with their
+    timings, the repeated statement shapes (N+1 patterns) and the sampled stacks.
+    Requires the 'X-Profile: <PROFILE_TOKEN>' header.
+
+    Args:
+        request (Request): The request, for its X-Profile header.
+        profile_id (str): The ID returned in the X-Profile-Id response header.
+
+    Raises:
+        HTTPException: If profiling is disabled, or the profile is unknown or was dropped,
+            a 404 error is raised. Without the X-Profile token, a 403 error is raised.
+
+    Returns:
+        dict: The profile report.
+    """
+    _check_profile_access(request)
+    report = profiling.get_report(profile_id)
+    if report is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return report
 
 
 ################################################################################
@@ -365,32 +1066,35 @@ def export_json(db: Session = Depends(get_db)):
     "/videos/{location_id}",
     summary="Fetch top YouTube videos for a location"
 )
-def get_location_videos(
-    location_id: int,
-    max_results: int = 3,
-    db: Session = Depends(get_db)
-):
+async def get_location_videos(location_id: int, max_results: int = 3):
     """
     Return up to `max_results` YouTube videos related to weather in the specified location.
+    Searches are cached per location for VIDEO_CACHE_TTL seconds, and the last
+    stored search is served when the YouTube quota is used up.
     
     Args:
         location_id (int): The ID of the location.
         max_results (int, optional): The maximum number of results to return. Defaults to 3.
-        db (Session, optional): A database session. Defaults to Depends(get_db).
         
     Raises:
-        HTTPException: If the location is not found, a 404 error is raised.
+        HTTPException: If the location is not found, a 404 error is raised. If the YouTube
+            quota is used up and no search is stored yet, a 429 error is raised, as when
+            the local quota budget is used up.
         
     Returns:
         dict: A dictionary containing the location and a list of YouTube videos.
     """
-    loc = crud.get_location(db, location_id)
+    loc = await run_in_session(crud.get_location, location_id)
     if not loc:
         raise HTTPException(status_code=404, detail="Location not found")
 
-    query = f"weather in {loc.city}" + (f", {loc.country}" if loc.country else "")
-    videos = search_youtube_videos(query, max_results=max_results)
-    return {"location": loc.city, "videos": videos}
+    try:
+        found = await videos.get_location_videos(loc, max_results)
+    except httpx.HTTPStatusError as err:
+        if not youtube_api.is_quota_error(err):
+            raise
+        raise HTTPException(status_code=429, detail="YouTube quota exhausted")
+    return {"location": loc.city, "videos": found}
 
 
 
@@ -0,0 +1,372 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+from .config import Setting, flag
+
+################################################################################
+# Prometheus-style metrics of this worker process: request latency per route,
+# upstream calls, SQL statements per request, connection pool and caches.
+# Rendered in the text exposition format by GET /metrics.
+################################################################################
+class _Settings:
+    # Whether requests, upstream calls and SQL statements are measured
+    METRICS_ENABLED = Setting("METRICS_ENABLED", True, flag)
+
+
+settings = _Settings()
+
+# Histogram bucket upper bounds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 1000)
+
+# SQL statement count and time of the current request, shared with the
+# threads it runs sync code in (they get a copy of the request's context)
+_request_sql: ContextVar[Optional[List[float]]] = ContextVar("request_sql", default=None)
+
+# Every metric created, in creation order, for rendering
+_registry: List["_Metric"] = []
+
+
+
+
+def _format_labels(names: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    """
+    Format the labels of a sample.
+
+    Args:
+        names: Label names
+        values: Label values
+        extra: An additional, already formatted label
+
+    Returns:
+        The '{name="value",...}' string, empty without labels.
+    """
+    pairs = [
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in zip(names, values)
+    ]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    """
+    Format a sample value.
+
+    Args:
+        value: The value
+
+    Returns:
+        The value, without a trailing '.0' for integers.
+    """
+    if value == float("inf"):
+        return "+Inf"
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+
+
+class _Metric:
+    """
+    Base of the metric types: a name, a help text and labelled values.
+    """
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> Iterator[str]:
+        """
+        Render the metric in the text exposition format.
+
+        Returns:
+            An iterator of lines.
+        """
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.type}"
+        yield from self.samples()
+
+
+
+
+class Counter(_Metric):
+    """
+    A monotonically increasing value per label set.
+    """
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, labels: Tuple[str, ...] = (), amount: float = 1.0) -> None:
+        """
+        Increase the value of a label set.
+
+        Args:
+            labels: Label values, in the order of the label names
+            amount: Increment
+        """
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+
+
+
+class Gauge(_Metric):
+    """
+    A value per label set that is set, typically right before rendering.
+    """
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, labels: Tuple[str, ...] = ()) -> None:
+        """
+        Set the value of a label set.
+
+        Args:
+            value: The value
+            labels: Label values, in the order of the label names
+        """
+        with self._lock:
+            self._values[labels] = value
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+
+
+
+class Histogram(_Metric):
+    """
+    Counts of observed values per bucket, with their sum, per label set.
+    """
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: the count of each bucket (the last one is +Inf), then the sum
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, labels: Tuple[str, ...] = ()) -> None:
+        """
+        Record an observed value.
+
+        Args:
+            value: The value, e.g. a duration in seconds
+            labels: Label values, in the order of the label names
+        """
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(labels)
+            if counts is None:
+                counts = self._values[labels] = [0.0] * (len(self.buckets) + 2)
+            counts[index] += 1
+            counts[-1] += value
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = [(labels, list(counts)) for labels, counts in self._values.items()]
+        for labels, counts in values:
+            cumulative = 0.0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {_format_value(cumulative)}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(counts[-1])}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, labels)} {_format_value(cumulative)}"
+
+
+
+
+################################################################################
+# Metrics of the app
+################################################################################
+HTTP_REQUESTS = Counter("http_requests_total", "HTTP requests handled.", ("method", "route", "status"))
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "HTTP request latency, including the streamed body.", ("method", "route")
+)
+HTTP_REQUEST_STATEMENTS = Histogram(
+    "http_request_sql_statements", "SQL statements executed per HTTP request.", ("route",), COUNT_BUCKETS
+)
+HTTP_REQUEST_SQL_DURATION = Histogram(
+    "http_request_sql_duration_seconds", "Time spent executing SQL statements per HTTP request.", ("route",)
+)
+UPSTREAM_REQUESTS = Counter("upstream_requests_total", "Upstream API calls.", ("endpoint", "status"))
+UPSTREAM_DURATION = Histogram(
+    "upstream_request_duration_seconds", "Upstream API call latency.", ("endpoint",)
+)
+DB_STATEMENT_DURATION = Histogram(
+    "db_statement_duration_seconds", "SQL statement execution time.", (), STATEMENT_BUCKETS
+)
+DB_POOL_CONNECTIONS = Gauge("db_pool_connections", "Database connections of the pool by state.", ("state",))
+DB_POOL_SIZE = Gauge("db_pool_size", "Configured size of the database connection pool.")
+CACHE_ENTRIES = Gauge("cache_entries", "Entries of the in-memory caches.", ("cache",))
+CACHE_HIT_RATIO = Gauge("cache_hit_ratio", "Hit ratio of the in-memory caches since startup.", ("cache",))
+CACHE_MEMORY = Gauge("cache_memory_bytes", "Estimated memory of the size-capped in-memory caches.", ("cache",))
+
+
+
+
+def enabled() -> bool:
+    """
+    Tell whether requests, upstream calls and SQL statements are measured.
+
+    Returns:
+        True when measuring.
+    """
+    return settings.METRICS_ENABLED
+
+
+def set_enabled(value: bool) -> None:
+    """
+    Turn measuring on or off at runtime, e.g. to compare the overhead.
+
+    Args:
+        value: True to measure
+    """
+    settings.METRICS_ENABLED = value
+
+
+def observe_statement(seconds: float) -> None:
+    """
+    Record an executed SQL statement, also for the current request if any.
+
+    Args:
+        seconds: Execution time of the statement
+    """
+    if not settings.METRICS_ENABLED:
+        return
+    DB_STATEMENT_DURATION.observe(seconds)
+    sql = _request_sql.get()
+    if sql is not None:
+        sql[0] += 1
+        sql[1] += seconds
+
+
+@contextmanager
+def track_upstream(endpoint: str) -> Iterator[Dict[str, Any]]:
+    """
+    Measure an upstream API call. The caller sets the 'status' key of the
+    yielded dictionary to the response status; calls raising before that are
+    recorded with the 'error' status.
+
+    Args:
+        endpoint: Upstream endpoint name, e.g. 'weather', 'forecast' or 'youtube'
+
+    Returns:
+        A dictionary receiving the response status.
+    """
+    call: Dict[str, Any] = {"status": "error"}
+    started = time.perf_counter()
+    try:
+        yield call
+    finally:
+        if settings.METRICS_ENABLED:
+            UPSTREAM_DURATION.observe(time.perf_counter() - started, (endpoint,))
+            UPSTREAM_REQUESTS.inc((endpoint, str(call["status"])))
+
+
+def render() -> str:
+    """
+    Render every metric in the Prometheus text exposition format.
+
+    Returns:
+        The exposition text.
+    """
+    lines: List[str] = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+
+
+################################################################################
+# Request middleware
+################################################################################
+_route_paths: Dict[Any, str] = {}
+
+
+def route_path(scope: Dict[str, Any]) -> str:
+    """
+    Get the path template of the route that handled a request, keeping the
+    label cardinality bounded (IDs in paths are not labels).
+
+    Args:
+        scope: The ASGI scope, after routing
+
+    Returns:
+        The route path, e.g. '/weather_infos/{info_id}', or 'unmatched'.
+    """
+    endpoint = scope.get("endpoint")
+    if endpoint is None:
+        return "unmatched"
+    path = _route_paths.get(endpoint)
+    if path is None:
+        app = scope.get("app")
+        path = next(
+            (route.path for route in getattr(app, "routes", ()) if getattr(route, "endpoint", None) is endpoint),
+            "unmatched",
+        )
+        _route_paths[endpoint] = path
+    return path
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware measuring each HTTP request until its body is fully sent,
+    with the SQL statements it executed.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        sql = [0, 0.0]
+        token = _request_sql.set(sql)
+        # Unhandled errors are answered with a 500 by the outer error middleware
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_sql.reset(token)
+            route = route_path(scope)
+            HTTP_REQUEST_DURATION.observe(time.perf_counter() - started, (scope["method"], route))
+            HTTP_REQUESTS.inc((scope["method"], route, str(status[0])))
+            HTTP_REQUEST_STATEMENTS.observe(sql[0], (route,))
+            HTTP_REQUEST_SQL_DURATION.observe(sql[1], (route,))
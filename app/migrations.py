@@ -0,0 +1,97 @@
+from sqlalchemy import func, insert, inspect, select, text
+from sqlalchemy.engine import Engine
+from .crud import CHANGE_LOG_LOCK_KEY
+from .database_model import WeatherLocation, WeatherInfo, ChangeLog
+
+################################################################################
+# In-place upgrades of databases created by older versions of the app.
+# `Base.metadata.create_all` only creates missing tables, so schema changes
+# to existing tables are applied here. Every step is idempotent.
+################################################################################
+def _index_names(engine: Engine, table: str) -> set:
+    """
+    List the names of the indexes of a table.
+
+    Args:
+        engine: Database engine
+        table: Name of the table
+
+    Returns:
+        A set of index names.
+    """
+    return {index["name"] for index in inspect(engine).get_indexes(table)}
+
+
+def add_weather_info_location_date_index(engine: Engine) -> None:
+    """
+    Add the unique (location_id, date) index to an existing weather_info table.
+    Duplicate rows of a location and date are removed first, keeping the oldest,
+    and their deletion is written to the change log. Rows without a location
+    are kept: the index does not compare NULLs, although GROUP BY does.
+
+    Args:
+        engine: Database engine
+    """
+    index = next(i for i in WeatherInfo.__table__.indexes if i.name == "ix_weather_info_location_date")
+    if index.name in _index_names(engine, WeatherInfo.__tablename__):
+        return
+    duplicates = (
+        "FROM weather_info WHERE location_id IS NOT NULL AND id NOT IN "
+        "(SELECT MIN(id) FROM weather_info WHERE location_id IS NOT NULL GROUP BY location_id, date)"
+    )
+    with engine.begin() as conn:
+        removed = conn.execute(text(f"SELECT id, location_id {duplicates}")).all()
+        if removed:
+            if engine.dialect.name == "postgresql":
+                conn.execute(select(func.pg_advisory_xact_lock(CHANGE_LOG_LOCK_KEY)))
+            conn.execute(insert(ChangeLog), [
+                {"table_name": "weather_info", "row_id": row_id, "location_id": location_id, "operation": "delete"}
+                for row_id, location_id in removed
+            ])
+            conn.execute(text(f"DELETE {duplicates}"))
+        index.create(bind=conn, checkfirst=True)
+
+
+def add_updated_at_columns(engine: Engine) -> None:
+    """
+    Add the indexed `updated_at` column to existing locations and weather_info tables.
+
+    Args:
+        engine: Database engine
+    """
+    for model in (WeatherLocation, WeatherInfo):
+        table = model.__table__
+        if "updated_at" in {column["name"] for column in inspect(engine).get_columns(table.name)}:
+            continue
+        column_type = table.c.updated_at.type.compile(dialect=engine.dialect)
+        with engine.begin() as conn:
+            conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN updated_at {column_type}"))
+            for index in table.indexes:
+                if [column.name for column in index.columns] == ["updated_at"]:
+                    index.create(bind=conn, checkfirst=True)
+
+
+def add_change_log_version_indexes(engine: Engine) -> None:
+    """
+    Add the (table_name, id) and (location_id, id) indexes to an existing change_log table.
+
+    Args:
+        engine: Database engine
+    """
+    existing = _index_names(engine, ChangeLog.__tablename__)
+    with engine.begin() as conn:
+        for index in ChangeLog.__table__.indexes:
+            if index.name not in existing:
+                index.create(bind=conn, checkfirst=True)
+
+
+def upgrade(engine: Engine) -> None:
+    """
+    Apply every pending upgrade step to the database.
+
+    Args:
+        engine: Database engine
+    """
+    add_weather_info_location_date_index(engine)
+    add_updated_at_columns(engine)
+    add_change_log_version_indexes(engine)
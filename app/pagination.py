@@ -0,0 +1,61 @@
+import base64
+import json
+from typing import Any, Dict, List, Optional
+
+
+
+
+def encode_cursor(**key: Any) -> str:
+    """
+    Encode the sort key of the last returned row as an opaque cursor.
+
+    Args:
+        **key: The sort key columns and their values
+
+    Returns:
+        A URL-safe cursor string.
+    """
+    raw = json.dumps(key, separators=(",", ":"), sort_keys=True).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> Dict[str, Any]:
+    """
+    Decode a cursor returned by `encode_cursor`.
+
+    Args:
+        cursor: The cursor string, or an empty string / None for the first page
+
+    Raises:
+        ValueError: If the cursor is malformed.
+
+    Returns:
+        The sort key columns and their values, empty for the first page.
+    """
+    if not cursor:
+        return {}
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        key = json.loads(raw)
+    except ValueError:
+        raise ValueError("Invalid cursor")
+    if not isinstance(key, dict):
+        raise ValueError("Invalid cursor")
+    return key
+
+
+def keyset_page(rows: List[Any], limit: int) -> Dict[str, Any]:
+    """
+    Build a page from rows fetched with `limit + 1`, the extra row telling
+    whether a next page exists.
+
+    Args:
+        rows: Up to `limit + 1` rows ordered by ID
+        limit: Page size
+
+    Returns:
+        A dictionary with the page items and the cursor of the next page (None on the last page).
+    """
+    items = rows[:limit]
+    next_cursor = encode_cursor(id=items[-1].id) if len(rows) > limit else None
+    return {"items": items, "next_cursor": next_cursor}
@@ -0,0 +1,223 @@
+import asyncio
+import logging
+import time
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from .config import Setting, flag
+from . import crud, forecast_series, rate_limit
+from .database import SessionLocal
+from .weather_api import call_budget, get_weather_by_city_async, get_forecast_window_async
+
+class _Settings:
+    # Load prefetcher settings. Every worker running the prefetcher walks every
+    # location, so enable it on a single worker only.
+    PREFETCH_ENABLED = Setting("PREFETCH_ENABLED", False, flag)
+    PREFETCH_INTERVAL = Setting("PREFETCH_INTERVAL", 10800.0, float)
+    PREFETCH_CONCURRENCY = Setting("PREFETCH_CONCURRENCY", 4, int)
+    PREFETCH_CALLS_PER_MINUTE = Setting("PREFETCH_CALLS_PER_MINUTE", 30, int)
+
+
+settings = _Settings()
+FORECAST_DAYS = 5
+
+logger = logging.getLogger(__name__)
+_task: Optional["asyncio.Task[None]"] = None
+_stats: Dict[str, Any] = {"runs": 0, "refreshed": 0, "failed": 0, "last_run_started": None, "last_run_seconds": None}
+
+
+
+
+class CallBudget:
+    """
+    A fixed-window budget of upstream calls per minute for the prefetcher.
+
+    Attributes:
+        calls_per_minute: Maximum number of upstream calls started per minute
+    """
+    def __init__(self, calls_per_minute: int):
+        self.calls_per_minute = calls_per_minute
+        self._window_start = time.monotonic()
+        self._used = 0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, calls: int = 1) -> None:
+        """
+        Wait until `calls` upstream calls fit in the current one-minute window.
+
+        Args:
+            calls: Number of calls about to be made
+        """
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now - self._window_start >= 60:
+                    self._window_start, self._used = now, 0
+                if self._used + calls <= self.calls_per_minute:
+                    self._used += calls
+                    return
+                await asyncio.sleep(self._window_start + 60 - now)
+
+
+
+
+def _list_locations() -> List[Tuple[int, str, Optional[str]]]:
+    """
+    List the stored locations to refresh.
+
+    Returns:
+        A list of (ID, city, country) tuples.
+    """
+    db = SessionLocal()
+    try:
+        return [(loc.id, loc.city, loc.country) for loc in crud.list_locations(db, as_rows=True)]
+    finally:
+        db.close()
+
+
+def _store(location_id: int, rows: List[Dict[str, Any]], forecast: Dict[str, Any]) -> int:
+    """
+    Write refreshed weather infos of a location, overwriting stored dates, and
+    its forecast series, in one transaction.
+
+    Args:
+        location_id: ID of the location
+        rows: Dictionaries with the keys 'date', 'temperature' and 'weather_description'
+        forecast: The raw forecast payload
+
+    Returns:
+        The number of weather infos written.
+    """
+    db = SessionLocal()
+    try:
+        forecast_series.store(db, {location_id: forecast}, commit=False)
+        return crud.upsert_infos(db, location_id, rows, update_existing=True)
+    finally:
+        db.close()
+
+
+async def refresh_location(location_id: int, city: str, country: Optional[str], budget: CallBudget) -> int:
+    """
+    Refresh the current weather and the 5-day forecast of a stored location
+    from the API, bypassing and then replacing the cached responses. Only the
+    calls actually made upstream count against the budget: one coalesced
+    onto a call already in flight is not.
+
+    Args:
+        location_id: ID of the location
+        city: The name of the city
+        country: Optional country code
+        budget: The per-minute upstream call budget
+
+    Returns:
+        The number of weather infos written.
+    """
+    with call_budget(budget.acquire):
+        current = await get_weather_by_city_async(city, country, refresh=True)
+        window = await get_forecast_window_async(city, country, refresh=True)
+    today = date.today()
+    rows = [{
+        "date": today,
+        "temperature": current["main"]["temp"],
+        "weather_description": current["weather"][0]["description"],
+    }]
+    for offset in range(1, FORECAST_DAYS + 1):
+        info_data = window.get(today + timedelta(days=offset))
+        if info_data is not None:
+            rows.append({
+                "date": today + timedelta(days=offset),
+                "temperature": info_data["main"]["temp"],
+                "weather_description": info_data["weather"][0]["description"],
+            })
+    return await asyncio.to_thread(_store, location_id, rows, window.forecast)
+
+
+async def refresh_all(interval: Optional[float] = None) -> None:
+    """
+    Refresh every stored location once, spreading the locations evenly over
+    `interval` seconds with at most PREFETCH_CONCURRENCY refreshes in flight.
+
+    Args:
+        interval: Duration over which the refreshes are spread, in seconds. Defaults to PREFETCH_INTERVAL.
+    """
+    if interval is None:
+        interval = settings.PREFETCH_INTERVAL
+    locations = await asyncio.to_thread(_list_locations)
+    if not locations:
+        return
+    budget = CallBudget(settings.PREFETCH_CALLS_PER_MINUTE)
+    semaphore = asyncio.Semaphore(settings.PREFETCH_CONCURRENCY)
+    step = interval / len(locations)
+    started = time.monotonic()
+
+    async def refresh(location: Tuple[int, str, Optional[str]]) -> None:
+        async with semaphore:
+            try:
+                # Queue behind user-facing requests in the shared rate limiter
+                with rate_limit.priority(rate_limit.PREFETCH):
+                    await refresh_location(*location, budget=budget)
+                _stats["refreshed"] += 1
+            except Exception:
+                _stats["failed"] += 1
+                logger.exception("Prefetch of location %s failed", location[0])
+
+    tasks = []
+    for i, location in enumerate(locations):
+        await asyncio.sleep(max(0.0, started + i * step - time.monotonic()))
+        tasks.append(asyncio.create_task(refresh(location)))
+    await asyncio.gather(*tasks)
+
+
+async def run_forever(interval: Optional[float] = None) -> None:
+    """
+    Refresh every stored location once per interval until cancelled.
+
+    Args:
+        interval: The forecast update interval, in seconds. Defaults to PREFETCH_INTERVAL.
+    """
+    if interval is None:
+        interval = settings.PREFETCH_INTERVAL
+    while True:
+        started = time.monotonic()
+        _stats["runs"] += 1
+        _stats["last_run_started"] = time.time()
+        try:
+            await refresh_all(interval)
+        except Exception:
+            logger.exception("Prefetch run failed")
+        _stats["last_run_seconds"] = time.monotonic() - started
+        await asyncio.sleep(max(0.0, interval - (time.monotonic() - started)))
+
+
+
+
+def start() -> None:
+    """
+    Start the background prefetcher if PREFETCH_ENABLED is set.
+    """
+    global _task
+    if settings.PREFETCH_ENABLED and _task is None:
+        _task = asyncio.create_task(run_forever())
+
+
+async def stop() -> None:
+    """
+    Stop the background prefetcher if it is running.
+    """
+    global _task
+    if _task is not None:
+        task, _task = _task, None
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+
+def stats() -> Dict[str, Any]:
+    """
+    Get the prefetcher counters.
+
+    Returns:
+        A dictionary with the number of runs, refreshed and failed locations and the last run timing.
+    """
+    return dict(_stats, enabled=settings.PREFETCH_ENABLED, running=_task is not None)
@@ -0,0 +1,412 @@
+import hmac
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+from .config import Setting
+from .metrics import route_path
+
+################################################################################
+# Opt-in per-request profiling. A profiled request records the ordered list of
+# its SQL statements with their timings, flags statement shapes repeated at
+# least PROFILE_N_PLUS_ONE_THRESHOLD times (N+1 query patterns), and samples
+# the wall-clock stacks of the threads it runs on. Requests are profiled when
+# they carry the 'X-Profile: <PROFILE_TOKEN>' header, or at random with the
+# PROFILE_SAMPLE_RATE probability. Reports are kept in memory for the /debug
+# endpoints and written to PROFILE_DIR when set.
+################################################################################
+class _Settings:
+    PROFILE_SAMPLE_RATE = Setting("PROFILE_SAMPLE_RATE", 0.0, float)
+    PROFILE_TOKEN = Setting("PROFILE_TOKEN")
+    PROFILE_DIR = Setting("PROFILE_DIR")
+    PROFILE_KEEP = Setting("PROFILE_KEEP", 50, int)
+    PROFILE_INTERVAL = Setting("PROFILE_INTERVAL_MS", 0.005, lambda ms: float(ms) / 1000)
+    PROFILE_N_PLUS_ONE_THRESHOLD = Setting("PROFILE_N_PLUS_ONE_THRESHOLD", 5, int)
+
+
+settings = _Settings()
+PROFILE_MAX_STATEMENTS = 1000
+PROFILE_TOP_FUNCTIONS = 25
+PROFILE_TOP_STACKS = 50
+PROFILE_HEADER = b"x-profile"
+
+# Samples without a frame of this package are idle threads (e.g. the event loop waiting)
+_APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+logger = logging.getLogger(__name__)
+
+# Profile of the current request, shared with the threads it runs sync code in
+_current: ContextVar[Optional["RequestProfile"]] = ContextVar("request_profile", default=None)
+
+# Latest reports, newest last, at most PROFILE_KEEP
+_reports: Deque[Dict[str, Any]] = deque()
+_reports_lock = threading.Lock()
+
+# Literals and bound parameter lists removed from statements to get their shape
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PARAMETER_LIST = re.compile(r"\(\s*(?:\?|%s|:\w+)(?:\s*,\s*(?:\?|%s|:\w+))*\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+
+
+def enabled() -> bool:
+    """
+    Tell whether any request can be profiled.
+
+    Returns:
+        True when a sample rate or a header token is configured.
+    """
+    return settings.PROFILE_SAMPLE_RATE > 0 or bool(settings.PROFILE_TOKEN)
+
+
+def authorized(token: Optional[str]) -> bool:
+    """
+    Tell whether a request may read the profile reports, which hold SQL
+    statements and stacks: it must carry the 'X-Profile: <PROFILE_TOKEN>' header.
+
+    Args:
+        token: The value of the X-Profile header, or None
+
+    Returns:
+        True when a token is configured and the header matches it.
+    """
+    if not settings.PROFILE_TOKEN or token is None:
+        return False
+    return hmac.compare_digest(token.encode("latin-1"), settings.PROFILE_TOKEN.encode())
+
+
+def statement_shape(statement: str) -> str:
+    """
+    Normalize a SQL statement so that executions differing only by their
+    literals or by the length of their parameter lists compare equal.
+
+    Args:
+        statement: The SQL statement
+
+    Returns:
+        The statement with literals replaced by '?' and parameter lists by '(...)'.
+    """
+    shape = _STRING_LITERAL.sub("?", statement)
+    shape = _NUMBER_LITERAL.sub("?", shape)
+    shape = _PARAMETER_LIST.sub("(...)", shape)
+    return _WHITESPACE.sub(" ", shape).strip()
+
+
+
+
+class RequestProfile:
+    """
+    The statements and stack samples recorded for one request.
+
+    Attributes:
+        id: Identifier of the report, returned in the X-Profile-Id response header
+        trigger: 'header' or 'sample'
+    """
+    def __init__(self, trigger: str):
+        self.id = uuid.uuid4().hex[:16]
+        self.trigger = trigger
+        self.started_at = datetime.now(timezone.utc)
+        self.started = time.perf_counter()
+        self.statements: List[Tuple[float, float, str, bool]] = []
+        self.statement_count = 0
+        self.statement_seconds = 0.0
+        self.threads: Set[int] = {threading.get_ident()}
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._lock = threading.Lock()
+
+    def add_statement(self, statement: str, seconds: float, executemany: bool) -> None:
+        """
+        Record an executed statement and the thread it ran on.
+
+        Args:
+            statement: The SQL statement
+            seconds: Execution time
+            executemany: Whether it ran for many parameter sets
+        """
+        offset = time.perf_counter() - self.started - seconds
+        with self._lock:
+            self.threads.add(threading.get_ident())
+            self.statement_count += 1
+            self.statement_seconds += seconds
+            if len(self.statements) < PROFILE_MAX_STATEMENTS:
+                self.statements.append((offset, seconds, statement, executemany))
+
+    def add_sample(self, frames: Dict[int, Any]) -> None:
+        """
+        Record the current stacks of the request's threads that are running app code.
+
+        Args:
+            frames: The current frame of every thread, by thread ident
+        """
+        with self._lock:
+            threads = list(self.threads)
+        for ident in threads:
+            frame = frames.get(ident)
+            if frame is None:
+                continue
+            stack = []
+            in_app = False
+            while frame is not None and len(stack) < 64:
+                code = frame.f_code
+                in_app = in_app or code.co_filename.startswith(_APP_DIR)
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if not in_app:
+                continue
+            with self._lock:
+                self.stacks[tuple(reversed(stack))] += 1
+                self.samples += 1
+
+    def report(self, scope: Dict[str, Any], status: int) -> Dict[str, Any]:
+        """
+        Build the report of the finished request.
+
+        Args:
+            scope: The ASGI scope of the request
+            status: The response status code
+
+        Returns:
+            A JSON-serializable dictionary.
+        """
+        with self._lock:
+            statements = list(self.statements)
+            stacks = self.stacks.most_common()
+        shapes: Dict[str, List[float]] = {}
+        for _, seconds, statement, _ in statements:
+            shapes.setdefault(statement_shape(statement), []).append(seconds)
+        n_plus_one = sorted((
+            {"shape": shape, "count": len(times), "total_ms": round(sum(times) * 1000, 3)}
+            for shape, times in shapes.items() if len(times) >= settings.PROFILE_N_PLUS_ONE_THRESHOLD
+        ), key=lambda item: -item["count"])
+
+        # Functions by samples on top of the stack (self) and anywhere in it (total)
+        own: Counter = Counter()
+        total: Counter = Counter()
+        for stack, count in stacks:
+            own[stack[-1]] += count
+            for function in set(stack):
+                total[function] += count
+        return {
+            "id": self.id,
+            "trigger": self.trigger,
+            "method": scope.get("method"),
+            "path": scope.get("path"),
+            "query": scope.get("query_string", b"").decode("latin-1"),
+            "route": route_path(scope),
+            "status": status,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": round((time.perf_counter() - self.started) * 1000, 3),
+            "sql": {
+                "count": self.statement_count,
+                "total_ms": round(self.statement_seconds * 1000, 3),
+                "statements": [
+                    {"offset_ms": round(offset * 1000, 3), "ms": round(seconds * 1000, 3),
+                     "sql": statement, "executemany": executemany}
+                    for offset, seconds, statement, executemany in statements
+                ],
+            },
+            "n_plus_one": n_plus_one,
+            "stacks": {
+                "interval_ms": settings.PROFILE_INTERVAL * 1000,
+                "samples": self.samples,
+                "threads": len(self.threads),
+                "top_self": [{"function": f, "samples": n} for f, n in own.most_common(PROFILE_TOP_FUNCTIONS)],
+                "top_total": [{"function": f, "samples": n} for f, n in total.most_common(PROFILE_TOP_FUNCTIONS)],
+                "folded": [f"{';'.join(stack)} {count}" for stack, count in stacks[:PROFILE_TOP_STACKS]],
+            },
+        }
+
+
+
+
+################################################################################
+# Stack sampler, running only while profiled requests are in flight
+################################################################################
+_active: Set[RequestProfile] = set()
+_active_lock = threading.Lock()
+_sampler: Optional[threading.Thread] = None
+
+
+def _sample() -> None:
+    """
+    Sample the stacks of the profiled requests' threads until none is left.
+    """
+    global _sampler
+    own = threading.get_ident()
+    while True:
+        with _active_lock:
+            if not _active:
+                _sampler = None
+                return
+            profiles = list(_active)
+        frames = sys._current_frames()
+        frames.pop(own, None)
+        for profile in profiles:
+            profile.add_sample(frames)
+        del frames
+        time.sleep(settings.PROFILE_INTERVAL)
+
+
+def _start(profile: RequestProfile) -> None:
+    """
+    Register a profiled request with the sampler, starting it if needed.
+
+    Args:
+        profile: The request profile
+    """
+    global _sampler
+    with _active_lock:
+        _active.add(profile)
+        if _sampler is None:
+            _sampler = threading.Thread(target=_sample, name="request-profiler", daemon=True)
+            _sampler.start()
+
+
+def _stop(profile: RequestProfile) -> None:
+    """
+    Unregister a finished request from the sampler.
+
+    Args:
+        profile: The request profile
+    """
+    with _active_lock:
+        _active.discard(profile)
+
+
+
+
+################################################################################
+# Statement hook, reports and middleware
+################################################################################
+def record_statement(statement: str, seconds: float, executemany: bool = False) -> None:
+    """
+    Record an executed SQL statement in the profile of the current request, if profiled.
+
+    Args:
+        statement: The SQL statement
+        seconds: Execution time
+        executemany: Whether it ran for many parameter sets
+    """
+    profile = _current.get()
+    if profile is not None:
+        profile.add_statement(statement, seconds, executemany)
+
+
+def _save(report: Dict[str, Any]) -> None:
+    """
+    Keep a report in memory and write it to PROFILE_DIR when set.
+
+    Args:
+        report: The request report
+    """
+    with _reports_lock:
+        _reports.append(report)
+        while len(_reports) > settings.PROFILE_KEEP:
+            _reports.popleft()
+    if settings.PROFILE_DIR:
+        try:
+            os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+            name = f"{report['started_at'][:19].replace(':', '')}_{report['id']}.json"
+            with open(os.path.join(settings.PROFILE_DIR, name), "w") as f:
+                json.dump(report, f, indent=2)
+        except OSError:
+            logger.exception("Could not write the profile report %s", report["id"])
+
+
+def list_reports() -> List[Dict[str, Any]]:
+    """
+    Summarize the reports kept in memory.
+
+    Returns:
+        One dictionary per report, newest first, without the statements and stacks.
+    """
+    with _reports_lock:
+        reports = list(_reports)
+    return [
+        {
+            "id": r["id"], "method": r["method"], "path": r["path"], "route": r["route"], "status": r["status"],
+            "started_at": r["started_at"], "duration_ms": r["duration_ms"], "sql_count": r["sql"]["count"],
+            "sql_ms": r["sql"]["total_ms"], "n_plus_one": len(r["n_plus_one"]),
+        }
+        for r in reversed(reports)
+    ]
+
+
+def get_report(report_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Get a report kept in memory.
+
+    Args:
+        report_id: The report ID
+
+    Returns:
+        The report, or None if unknown or already dropped.
+    """
+    with _reports_lock:
+        return next((r for r in _reports if r["id"] == report_id), None)
+
+
+def _trigger(scope: Dict[str, Any]) -> Optional[str]:
+    """
+    Decide whether to profile a request.
+
+    Args:
+        scope: The ASGI scope of the request
+
+    Returns:
+        'header' or 'sample' when the request is profiled, None otherwise.
+    """
+    # Reading the reports with the token must not profile, and push out, them
+    if scope["path"].startswith("/debug/"):
+        return None
+    if settings.PROFILE_TOKEN:
+        # Compared in constant time, like the token of the report endpoints
+        if any(name == PROFILE_HEADER and authorized(value.decode("latin-1")) for name, value in scope["headers"]):
+            return "header"
+    if settings.PROFILE_SAMPLE_RATE > 0 and random.random() < settings.PROFILE_SAMPLE_RATE:
+        return "sample"
+    return None
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware profiling the requests selected by the header or the
+    sample rate, and passing the others through untouched.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        trigger = _trigger(scope) if scope["type"] == "http" and enabled() else None
+        if trigger is None:
+            await self.app(scope, receive, send)
+            return
+        profile = RequestProfile(trigger)
+        token = _current.set(profile)
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", profile.id.encode())]
+            await send(message)
+
+        _start(profile)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _stop(profile)
+            _current.reset(token)
+            _save(profile.report(scope, status[0]))
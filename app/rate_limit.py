@@ -0,0 +1,368 @@
+import asyncio
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, Optional, Tuple
+from .config import env
+
+# Priority classes of upstream callers, most urgent first
+USER = 0
+PREFETCH = 1
+PRIORITY_NAMES = {USER: "user", PREFETCH: "prefetch"}
+
+# Priority of the upstream calls made by the current request or task, and the
+# shared priority of the coalesced call it is running, if any
+_priority: ContextVar[int] = ContextVar("upstream_priority", default=USER)
+_shared: ContextVar[Optional["SharedPriority"]] = ContextVar("shared_upstream_priority", default=None)
+
+# Every bucket created, by name, for reporting
+_buckets: Dict[str, "TokenBucket"] = {}
+
+
+
+
+def worker_count() -> int:
+    """
+    Get the number of worker processes sharing the upstream limits. The
+    buckets live in each process, so every worker takes an equal share of
+    the configured rates and budgets.
+
+    Returns:
+        RATE_LIMIT_WORKERS if set, else WEB_CONCURRENCY (the worker count of
+        uvicorn and gunicorn when set through the environment), else 1.
+    """
+    value = env("RATE_LIMIT_WORKERS") or env("WEB_CONCURRENCY") or "1"
+    return max(1, int(value))
+
+
+
+
+class RateLimitExceeded(Exception):
+    """
+    Raised when an upstream call cannot get a token before its deadline.
+
+    Attributes:
+        name: Name of the rate limiter
+        retry_after: Seconds after which a retry may succeed
+    """
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"Rate limit of '{name}' exceeded, retry after {retry_after:.0f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+
+
+@contextmanager
+def priority(level: int) -> Iterator[None]:
+    """
+    Run the upstream calls of a block with the given priority class.
+
+    Args:
+        level: USER or PREFETCH
+    """
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> int:
+    """
+    Get the priority class of the upstream calls made now.
+
+    Returns:
+        The priority of the coalesced call being run, if any, else the caller's own.
+    """
+    shared = _shared.get()
+    return shared.level if shared is not None else _priority.get()
+
+
+
+
+class SharedPriority:
+    """
+    The priority class of an upstream call shared by several callers through
+    a single-flight. It starts as the priority of the caller that started the
+    call and is raised when a more urgent caller joins, so that a user request
+    coalesced onto a background refresh does not wait behind other users.
+
+    Attributes:
+        level: The most urgent priority class among the callers
+    """
+    __slots__ = ("level",)
+
+    def __init__(self):
+        self.level = current_priority()
+
+    def join(self) -> None:
+        """
+        Raise the priority to the current caller's if it is more urgent.
+        """
+        self.level = min(self.level, current_priority())
+
+    @contextmanager
+    def active(self) -> Iterator[None]:
+        """
+        Run the shared call of a block with this priority, read again by the
+        rate limiters while it waits for tokens.
+        """
+        token = _shared.set(self)
+        try:
+            yield
+        finally:
+            _shared.reset(token)
+
+
+
+
+class TokenBucket:
+    """
+    A thread- and async-safe token bucket with an optional daily budget.
+
+    Tokens refill continuously at `rate` per second up to `burst`. Callers
+    wait for tokens until their deadline, and user-facing callers go first:
+    lower priority callers never take a token while a higher priority caller
+    is waiting, and must leave `reserve` tokens in the bucket. A waiting call
+    promoted by a user joining it (see SharedPriority) moves up at once.
+
+    The bucket lives in the memory of one process. When `workers` processes
+    share the upstream limits, the rate, burst, daily budget and reserve are
+    given for all of them, and each bucket holds its equal share.
+
+    Attributes:
+        name: Name of the limiter, used in errors and statistics
+        rate: Tokens added per second, in this worker
+        burst: Maximum number of tokens in the bucket
+        daily_budget: Maximum number of tokens spent per UTC day in this worker, or None for no limit
+        reserve: Tokens kept for user-facing callers
+        max_wait: Default deadline per priority class, in seconds
+        workers: Number of worker processes sharing the limits
+    """
+    def __init__(
+        self,
+        name: str,
+        rate: float,
+        burst: float,
+        daily_budget: Optional[float] = None,
+        reserve: float = 0.0,
+        max_wait: Optional[Dict[int, float]] = None,
+        workers: int = 1
+    ):
+        if rate <= 0 or burst <= 0:
+            raise ValueError("The 'rate' and 'burst' parameters must be positive.")
+        if workers < 1:
+            raise ValueError("The 'workers' parameter must be a positive integer.")
+        self.name = name
+        self.workers = workers
+        self.rate = rate / workers
+        self.burst = burst / workers
+        self.daily_budget = None if daily_budget is None else daily_budget / workers
+        self.reserve = reserve / workers
+        self.max_wait = max_wait or {USER: 5.0, PREFETCH: 60.0}
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._day = self._today()
+        self._daily_used = 0.0
+        self._waiting = {level: 0 for level in PRIORITY_NAMES}
+        self._counters = {"granted": 0, "rejected": 0, "waited_seconds": 0.0}
+        self._lock = threading.Lock()
+        _buckets[name] = self
+
+    @staticmethod
+    def _today() -> str:
+        """
+        Get the current UTC date, which scopes the daily budget.
+
+        Returns:
+            The date in ISO format.
+        """
+        return datetime.now(timezone.utc).date().isoformat()
+
+    @staticmethod
+    def _seconds_to_midnight() -> float:
+        """
+        Get the time left until the daily budget resets.
+
+        Returns:
+            Seconds until the next UTC midnight.
+        """
+        now = datetime.now(timezone.utc)
+        return 86400 - (now.hour * 3600 + now.minute * 60 + now.second)
+
+    def _refill(self) -> None:
+        """
+        Add the tokens earned since the last update and reset the daily budget
+        at UTC midnight. Must be called with the lock held.
+        """
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        today = self._today()
+        if today != self._day:
+            self._day, self._daily_used = today, 0.0
+
+    def _try_take(self, cost: float, level: int) -> float:
+        """
+        Take tokens if possible. Must be called with the lock held.
+
+        Args:
+            cost: Number of tokens needed
+            level: Priority class of the caller
+
+        Returns:
+            0 if the tokens were taken, otherwise the estimated seconds to wait.
+        """
+        self._refill()
+        if self.daily_budget is not None and self._daily_used + cost > self.daily_budget:
+            return self._seconds_to_midnight()
+        if any(self._waiting[other] for other in self._waiting if other < level):
+            return 1.0 / self.rate
+        floor = 0.0 if level == USER else self.reserve
+        if self._tokens - cost >= floor:
+            self._tokens -= cost
+            self._daily_used += cost
+            self._counters["granted"] += 1
+            return 0.0
+        return (cost + floor - self._tokens) / self.rate
+
+    def _promote(self, level: int, deadline: float, timeout: Optional[float]) -> Tuple[int, float]:
+        """
+        Move a waiting caller to its current priority class if a more urgent
+        caller joined its shared call. Must be called with the lock held.
+
+        Args:
+            level: Priority class the caller waits in
+            deadline: The caller's deadline (monotonic time)
+            timeout: The explicit timeout of the caller, if any
+
+        Returns:
+            The priority class and the deadline to wait with from now on.
+        """
+        promoted = current_priority()
+        if promoted >= level:
+            return level, deadline
+        self._waiting[level] -= 1
+        self._waiting[promoted] += 1
+        if timeout is None:
+            deadline = min(deadline, time.monotonic() + self.max_wait[promoted])
+        return promoted, deadline
+
+    def acquire(self, cost: float = 1.0, timeout: Optional[float] = None) -> None:
+        """
+        Take tokens for an upstream call, sleeping the current thread until
+        they are available or the deadline passes.
+
+        Args:
+            cost: Number of tokens needed
+            timeout: Maximum seconds to wait. Defaults to the caller's priority class deadline.
+
+        Raises:
+            RateLimitExceeded: If the tokens cannot be taken before the deadline.
+        """
+        level = current_priority()
+        deadline = time.monotonic() + (self.max_wait[level] if timeout is None else timeout)
+        started = time.monotonic()
+        with self._lock:
+            wait = self._try_take(cost, level)
+            if not wait:
+                return
+            self._waiting[level] += 1
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if wait > remaining:
+                    self._reject(wait)
+                time.sleep(wait)
+                with self._lock:
+                    level, deadline = self._promote(level, deadline, timeout)
+                    wait = self._try_take(cost, level)
+                    if not wait:
+                        self._counters["waited_seconds"] += time.monotonic() - started
+                        return
+        finally:
+            with self._lock:
+                self._waiting[level] -= 1
+
+    async def acquire_async(self, cost: float = 1.0, timeout: Optional[float] = None) -> None:
+        """
+        Asynchronous version of `acquire`, sleeping the current task instead of the thread.
+
+        Args:
+            cost: Number of tokens needed
+            timeout: Maximum seconds to wait. Defaults to the caller's priority class deadline.
+
+        Raises:
+            RateLimitExceeded: If the tokens cannot be taken before the deadline.
+        """
+        level = current_priority()
+        deadline = time.monotonic() + (self.max_wait[level] if timeout is None else timeout)
+        started = time.monotonic()
+        with self._lock:
+            wait = self._try_take(cost, level)
+            if not wait:
+                return
+            self._waiting[level] += 1
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if wait > remaining:
+                    self._reject(wait)
+                await asyncio.sleep(wait)
+                with self._lock:
+                    level, deadline = self._promote(level, deadline, timeout)
+                    wait = self._try_take(cost, level)
+                    if not wait:
+                        self._counters["waited_seconds"] += time.monotonic() - started
+                        return
+        finally:
+            with self._lock:
+                self._waiting[level] -= 1
+
+    def _reject(self, retry_after: float) -> None:
+        """
+        Count a rejected call and raise RateLimitExceeded.
+
+        Args:
+            retry_after: Seconds after which a retry may succeed
+        """
+        with self._lock:
+            self._counters["rejected"] += 1
+        raise RateLimitExceeded(self.name, retry_after)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the limiter state and counters.
+
+        Returns:
+            A dictionary with the available tokens, the remaining daily budget,
+            the worker count, the waiting callers per priority class and the
+            granted/rejected counts.
+        """
+        with self._lock:
+            self._refill()
+            return {
+                "tokens": round(self._tokens, 3),
+                "burst": self.burst,
+                "rate_per_second": self.rate,
+                "daily_budget": self.daily_budget,
+                "daily_remaining": None if self.daily_budget is None else self.daily_budget - self._daily_used,
+                "workers": self.workers,
+                "waiting": {PRIORITY_NAMES[level]: count for level, count in self._waiting.items()},
+                **self._counters,
+            }
+
+
+
+
+def all_stats() -> Dict[str, Dict[str, Any]]:
+    """
+    Get the state and counters of every rate limiter.
+
+    Returns:
+        A dictionary of limiter statistics keyed by limiter name.
+    """
+    return {name: bucket.stats() for name, bucket in _buckets.items()}
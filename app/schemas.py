@@ -0,0 +1,75 @@
+import datetime as dt
+from typing import Any, Dict, List, Optional, Sequence
+from fastapi import Response
+from pydantic import BaseModel, ConfigDict, TypeAdapter
+
+################################################################################
+# Response models. They are read from ORM objects (`from_attributes`), and
+# document the plain rows that list endpoints serialize without them.
+################################################################################
+class LocationOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    # Attributes of a stored location
+    id: int
+    city: str
+    country: Optional[str] = None
+    lat: Optional[float] = None
+    lon: Optional[float] = None
+    updated_at: Optional[dt.datetime] = None
+
+class WeatherInfoOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    # Attributes of a stored weather info; infos of a deleted location have no location ID
+    id: int
+    location_id: Optional[int] = None
+    date: dt.date
+    temperature: float
+    weather_description: Optional[str] = None
+    updated_at: Optional[dt.datetime] = None
+
+class LocationPage(BaseModel):
+    items: List[LocationOut]
+    next_cursor: Optional[str] = None
+
+class WeatherInfoPage(BaseModel):
+    items: List[WeatherInfoOut]
+    next_cursor: Optional[str] = None
+
+
+
+
+################################################################################
+# Fast serialization of plain rows, bypassing FastAPI's generic encoder
+################################################################################
+# Serializes dictionaries, lists, dates and datetimes in pydantic-core
+_any = TypeAdapter(Any)
+
+
+def records(rows: Sequence[Any]) -> List[Dict[str, Any]]:
+    """
+    Convert plain rows to dictionaries keyed by column name.
+
+    Args:
+        rows: Rows of a column query, e.g. returned by crud functions with `as_rows=True`
+
+    Returns:
+        One dictionary per row.
+    """
+    if not rows:
+        return []
+    keys = rows[0]._fields
+    return [dict(zip(keys, row)) for row in rows]
+
+
+def json_response(content: Any, status_code: int = 200) -> Response:
+    """
+    Serialize a response straight to JSON bytes.
+
+    Args:
+        content: Dictionaries, lists and scalars (including dates and datetimes)
+        status_code: The response status code
+
+    Returns:
+        Response: A JSON response.
+    """
+    return Response(content=_any.dump_json(content), status_code=status_code, media_type="application/json")
@@ -0,0 +1,159 @@
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+from .rate_limit import SharedPriority
+
+
+
+
+class _Call:
+    """
+    An in-flight call shared by every thread asking for the same key.
+    """
+    __slots__ = ("done", "value", "error", "priority")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+        self.priority = SharedPriority()
+
+
+
+
+class SingleFlight:
+    """
+    Coalesce identical concurrent calls made from threads: while a call for a
+    key is in flight, other callers asking for the same key wait for it and
+    share its result (or its error) instead of issuing their own call. The
+    call runs with the most urgent rate limiting priority of its callers.
+    """
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self._counters = {"calls": 0, "coalesced": 0}
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args: Any) -> Any:
+        """
+        Run `fn(*args)` unless a call for the same key is already in flight.
+
+        Args:
+            key: The key identifying identical calls
+            fn: The function to call
+            *args: Positional arguments passed to `fn`
+
+        Returns:
+            The value returned by the shared call.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._counters["calls"] += 1
+            else:
+                call.priority.join()
+                self._counters["coalesced"] += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+        try:
+            with call.priority.active():
+                call.value = fn(*args)
+            return call.value
+        except BaseException as err:
+            call.error = err
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Get the coalescing counters.
+
+        Returns:
+            A dictionary with the number of upstream calls made and of callers coalesced onto them.
+        """
+        with self._lock:
+            return dict(self._counters, in_flight=len(self._calls))
+
+
+
+
+class AsyncSingleFlight:
+    """
+    Coalesce identical concurrent calls made from coroutines. The shared call
+    runs as its own task, so a cancelled caller does not cancel it for the
+    others, and with the most urgent rate limiting priority of its callers.
+    """
+    def __init__(self):
+        self._calls: Dict[Tuple[int, Hashable], Tuple["asyncio.Task[Any]", SharedPriority]] = {}
+        self._counters = {"calls": 0, "coalesced": 0}
+
+    async def do(self, key: Hashable, fn: Callable[..., Awaitable[Any]], *args: Any) -> Any:
+        """
+        Await `fn(*args)` unless a call for the same key is already in flight.
+
+        Args:
+            key: The key identifying identical calls
+            fn: The coroutine function to call
+            *args: Positional arguments passed to `fn`
+
+        Returns:
+            The value returned by the shared call.
+        """
+        # Tasks cannot be awaited across event loops, so calls are scoped per loop
+        flight_key = (id(asyncio.get_running_loop()), key)
+        call = self._calls.get(flight_key)
+        if call is None:
+            priority = SharedPriority()
+            task = asyncio.ensure_future(self._run(priority, fn, *args))
+            self._calls[flight_key] = (task, priority)
+            task.add_done_callback(lambda done: self._forget(flight_key, done))
+            self._counters["calls"] += 1
+        else:
+            task, priority = call
+            priority.join()
+            self._counters["coalesced"] += 1
+        return await asyncio.shield(task)
+
+    @staticmethod
+    async def _run(priority: SharedPriority, fn: Callable[..., Awaitable[Any]], *args: Any) -> Any:
+        """
+        Await the shared call with the shared priority of its callers.
+
+        Args:
+            priority: The shared priority
+            fn: The coroutine function to call
+            *args: Positional arguments passed to `fn`
+
+        Returns:
+            The value returned by `fn`.
+        """
+        with priority.active():
+            return await fn(*args)
+
+    def _forget(self, flight_key: Tuple[int, Hashable], task: "asyncio.Task[Any]") -> None:
+        """
+        Remove a finished call so that the next caller issues a new one.
+
+        Args:
+            flight_key: The key of the call
+            task: The finished task
+        """
+        call = self._calls.get(flight_key)
+        if call is not None and call[0] is task:
+            del self._calls[flight_key]
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Get the coalescing counters.
+
+        Returns:
+            A dictionary with the number of upstream calls made and of callers coalesced onto them.
+        """
+        return dict(self._counters, in_flight=len(self._calls))
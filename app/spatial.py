@@ -0,0 +1,286 @@
+import math
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """
+    Compute the great-circle distance between two points.
+
+    Args:
+        lat1: Latitude of the first point
+        lon1: Longitude of the first point
+        lat2: Latitude of the second point
+        lon2: Longitude of the second point
+
+    Returns:
+        The distance in kilometers.
+    """
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+
+
+class SpatialIndex:
+    """
+    A thread-safe in-memory index of points bucketed in a lat/lon grid.
+
+    Nearest-neighbour and radius queries scan the cells in rings of growing
+    size around the query point and stop as soon as no unscanned cell can hold
+    a closer point, so they only touch the points near the query. Once the
+    rings visited more cells than are occupied, which happens in sparse
+    indexes and near the poles, where the cells narrow, the remaining
+    occupied cells are scanned directly, closest bound first.
+
+    Attributes:
+        cell_degrees: Size of a grid cell in degrees
+    """
+    def __init__(self, cell_degrees: float = 1.0):
+        self.cell_degrees = cell_degrees
+        self._lat_cells = math.ceil(180 / cell_degrees)
+        self._lon_cells = math.ceil(360 / cell_degrees)
+        self._cells: Dict[Tuple[int, int], Dict[int, Tuple[float, float]]] = {}
+        self._cell_of: Dict[int, Tuple[int, int]] = {}
+        # Columns of the occupied cells, by row
+        self._row_cols: Dict[int, Set[int]] = {}
+        self._lock = threading.Lock()
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        """
+        Get the grid cell of a point.
+
+        Args:
+            lat: Latitude
+            lon: Longitude
+
+        Returns:
+            The (row, column) of the cell.
+        """
+        row = min(self._lat_cells - 1, int((lat + 90) // self.cell_degrees))
+        col = int(((lon + 180) % 360) // self.cell_degrees)
+        return row, col
+
+    def add(self, point_id: int, lat: float, lon: float) -> None:
+        """
+        Add a point, replacing any previous position of the same ID.
+
+        Args:
+            point_id: ID of the point
+            lat: Latitude
+            lon: Longitude
+        """
+        cell = self._cell(lat, lon)
+        with self._lock:
+            self._discard(point_id)
+            self._cells.setdefault(cell, {})[point_id] = (lat, lon)
+            self._cell_of[point_id] = cell
+            self._row_cols.setdefault(cell[0], set()).add(cell[1])
+
+    def remove(self, point_id: int) -> None:
+        """
+        Remove a point if present.
+
+        Args:
+            point_id: ID of the point
+        """
+        with self._lock:
+            self._discard(point_id)
+
+    def _discard(self, point_id: int) -> None:
+        """
+        Remove a point if present. Must be called with the lock held.
+
+        Args:
+            point_id: ID of the point
+        """
+        cell = self._cell_of.pop(point_id, None)
+        if cell is not None:
+            points = self._cells[cell]
+            del points[point_id]
+            if not points:
+                del self._cells[cell]
+                cols = self._row_cols[cell[0]]
+                cols.discard(cell[1])
+                if not cols:
+                    del self._row_cols[cell[0]]
+
+    def rebuild(self, points: Iterable[Tuple[int, float, float]]) -> None:
+        """
+        Replace every indexed point.
+
+        Args:
+            points: (ID, latitude, longitude) tuples
+        """
+        cells: Dict[Tuple[int, int], Dict[int, Tuple[float, float]]] = {}
+        cell_of: Dict[int, Tuple[int, int]] = {}
+        for point_id, lat, lon in points:
+            cell = self._cell(lat, lon)
+            cells.setdefault(cell, {})[point_id] = (lat, lon)
+            cell_of[point_id] = cell
+        row_cols: Dict[int, Set[int]] = {}
+        for row, col in cells:
+            row_cols.setdefault(row, set()).add(col)
+        with self._lock:
+            self._cells, self._cell_of, self._row_cols = cells, cell_of, row_cols
+
+    def __len__(self) -> int:
+        return len(self._cell_of)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the index size.
+
+        Returns:
+            A dictionary with the number of points, the number of non-empty cells and the cell size.
+        """
+        with self._lock:
+            return {"points": len(self._cell_of), "cells": len(self._cells), "cell_degrees": self.cell_degrees}
+
+    def _ring(self, row: int, col: int, r: int) -> Iterable[Tuple[int, int]]:
+        """
+        List the cells at ring distance `r` from a cell, wrapping around in longitude.
+
+        Args:
+            row: Row of the center cell
+            col: Column of the center cell
+            r: Ring distance, 0 for the center cell itself
+
+        Returns:
+            An iterable of (row, column) cells.
+        """
+        if r == 0:
+            return [(row, col)]
+        cols = {(col + dc) % self._lon_cells for dc in range(-r, r + 1)}
+        edge_cols = {(col - r) % self._lon_cells, (col + r) % self._lon_cells}
+        cells = set()
+        for dr in range(-r, r + 1):
+            if not 0 <= row + dr < self._lat_cells:
+                continue
+            for c in (cols if abs(dr) == r else edge_cols):
+                cells.add((row + dr, c))
+        return cells
+
+    def _ring_bound_km(self, lat: float, r: int) -> float:
+        """
+        Get a lower bound of the distance from a point to any cell beyond ring `r`.
+        Such a cell is either more than `r` rows away, so at least `span`
+        degrees away in latitude, or within `r` rows but more than `span`
+        degrees away in longitude. The latter only exist until the rings span
+        every column, and lie on meridians at least as far from the point as
+        the one `span` degrees away (or, beyond 90 degrees, as the pole).
+
+        Args:
+            lat: Latitude of the query point
+            r: Last ring scanned
+
+        Returns:
+            The bound in kilometers.
+        """
+        span = math.radians(r * self.cell_degrees)
+        if 2 * r + 1 >= self._lon_cells:
+            return EARTH_RADIUS_KM * span
+        side = math.asin(min(1.0, math.cos(math.radians(lat)) * math.sin(min(span, math.pi / 2))))
+        return EARTH_RADIUS_KM * min(span, side)
+
+    def nearest(
+        self,
+        lat: float,
+        lon: float,
+        k: Optional[int] = 1,
+        radius_km: Optional[float] = None
+    ) -> List[Tuple[int, float]]:
+        """
+        Find the points closest to a position.
+
+        Args:
+            lat: Latitude of the query point
+            lon: Longitude of the query point
+            k: Maximum number of points to return, or None for every point within the radius
+            radius_km: Optional maximum distance in kilometers
+
+        Returns:
+            (ID, distance in km) tuples, closest first.
+        """
+        if k is None and radius_km is None:
+            raise ValueError("Either 'k' or 'radius_km' must be given.")
+        row, col = self._cell(lat, lon)
+        max_rings = max(self._lat_cells, self._lon_cells // 2 + 1)
+        found: List[Tuple[float, int]] = []
+
+        def scan(points: Dict[int, Tuple[float, float]]) -> None:
+            for point_id, (plat, plon) in points.items():
+                distance = haversine_km(lat, lon, plat, plon)
+                if radius_km is None or distance <= radius_km:
+                    found.append((distance, point_id))
+
+        def limit() -> float:
+            # Distance beyond which no point can be part of the result anymore
+            if k is None or len(found) < k:
+                return math.inf if radius_km is None else radius_km
+            found.sort()
+            return found[k - 1][0] if radius_km is None else min(radius_km, found[k - 1][0])
+
+        def scan_rows(r: int) -> None:
+            # Bound each cell by the larger of its latitude gap and the distance
+            # to the nearest meridian it can reach, as in `_ring_bound_km`
+            cos_lat = math.cos(math.radians(lat))
+            gaps = []
+            for cell_row in self._row_cols:
+                low = cell_row * self.cell_degrees - 90
+                gaps.append((math.radians(max(0.0, low - lat, lat - low - self.cell_degrees)), cell_row))
+            gaps.sort()
+            for gap, cell_row in gaps:
+                if EARTH_RADIUS_KM * gap > limit():
+                    break
+                cells = []
+                for cell_col in self._row_cols[cell_row]:
+                    cols = abs(cell_col - col)
+                    cols = min(cols, self._lon_cells - cols)
+                    if max(abs(cell_row - row), cols) > r:
+                        span = math.radians(max(0, cols - 1) * self.cell_degrees)
+                        side = math.asin(min(1.0, cos_lat * math.sin(min(span, math.pi / 2))))
+                        cells.append((EARTH_RADIUS_KM * max(gap, side), cell_col))
+                cells.sort()
+                for bound, cell_col in cells:
+                    if bound > limit():
+                        break
+                    scan(self._cells[(cell_row, cell_col)])
+
+        with self._lock:
+            remaining = len(self._cell_of)
+            visited = 0
+            for r in range(max_rings + 1):
+                ring = self._ring(row, col, r)
+                visited += len(ring)
+                for cell in ring:
+                    points = self._cells.get(cell)
+                    if points:
+                        remaining -= len(points)
+                        scan(points)
+                if remaining == 0 or self._ring_bound_km(lat, r) > limit():
+                    break
+                if visited >= len(self._cells):
+                    # The rings visited more cells than are occupied, e.g. in a
+                    # sparse index or near the poles: scan the other occupied
+                    # cells instead, by row in the order of their latitude gap
+                    scan_rows(r)
+                    break
+        found.sort()
+        if k is not None:
+            found = found[:k]
+        return [(point_id, distance) for distance, point_id in found]
+
+
+
+
+# Index of the stored locations, kept in sync by the crud layer. Each worker
+# process holds its own copy, loaded at startup.
+location_index = SpatialIndex()
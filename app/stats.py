@@ -0,0 +1,71 @@
+from datetime import date
+from typing import Any, Dict, List, Optional, Sequence
+from sqlalchemy.orm import Session
+from . import crud
+
+# Supported grouping periods; None groups the whole date range together
+PERIODS = ("day", "week", "month")
+
+
+
+
+def temperature_stats(
+    db: Session,
+    period: Optional[str] = "week",
+    by_location: bool = True,
+    location_ids: Optional[List[int]] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    percentiles: Sequence[float] = ()
+) -> List[Dict[str, Any]]:
+    """
+    Compute temperature statistics per location and period. Count, min, max
+    and mean are aggregated by the database; percentiles, which SQLite cannot
+    compute, are computed with NumPy over the temperatures of each group and
+    only when requested.
+
+    Args:
+        db: Database session
+        period: 'day', 'week' (starting on Monday), 'month', or None for a single period
+        by_location: Whether to group by location
+        location_ids: Optional IDs of the locations to include
+        start_date: Optional first date to include
+        end_date: Optional last date to include
+        percentiles: Percentiles to compute, between 0 and 100
+
+    Raises:
+        ValueError: If the period or a percentile is invalid.
+
+    Returns:
+        A list of group dictionaries with the location ID, the first day of the
+        period, the count, min, max, mean and the requested percentiles, ordered
+        by location and period.
+    """
+    if period is not None and period not in PERIODS:
+        raise ValueError(f"Unsupported period '{period}'.")
+    if any(not 0 <= q <= 100 for q in percentiles):
+        raise ValueError("Percentiles must be between 0 and 100.")
+    args = (db, period, by_location, location_ids, start_date, end_date)
+    groups = {
+        (row.location_id, row.period_start): {
+            "location_id": row.location_id,
+            "period_start": row.period_start,
+            "count": row.count,
+            "min": row.min,
+            "max": row.max,
+            "mean": row.mean,
+        }
+        for row in crud.get_temperature_aggregates(*args)
+    }
+    if percentiles and groups:
+        # Imported on first use, as NumPy adds noticeably to the app startup time
+        import numpy as np
+        series = crud.get_temperature_series(*args)
+        temperatures = np.fromiter((row.temperature for row in series), dtype=float, count=len(series))
+        keys = [(row.location_id, row.period_start) for row in series]
+        bounds = [0] + [i for i in range(1, len(keys)) if keys[i] != keys[i - 1]] + [len(keys)]
+        names = [f"p{q:g}" for q in percentiles]
+        for start, end in zip(bounds, bounds[1:]):
+            values = np.percentile(temperatures[start:end], percentiles)
+            groups[keys[start]]["percentiles"] = dict(zip(names, values.tolist()))
+    return list(groups.values())
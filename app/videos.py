@@ -0,0 +1,103 @@
+import logging
+from typing import Any, Dict, List
+from .config import Lazy, Setting
+from . import crud
+from .cache import TTLCache, FRESH
+from .database import run_in_session
+from .database_model import WeatherLocation, utcnow
+from .youtube_api import search_youtube_videos_async, is_quota_error
+
+class _Settings:
+    # Load video cache settings. Searches are stored in the video_cache table, so
+    # every worker shares them and they survive restarts; each worker also keeps
+    # the fresh ones in memory.
+    VIDEO_CACHE_TTL = Setting("VIDEO_CACHE_TTL", 86400.0, float)
+    VIDEO_CACHE_MAX_ENTRIES = Setting("VIDEO_CACHE_MAX_ENTRIES", 1024, int)
+
+
+settings = _Settings()
+logger = logging.getLogger(__name__)
+_cache = Lazy(lambda: TTLCache(max_entries=settings.VIDEO_CACHE_MAX_ENTRIES))
+_stats = {"db_hits": 0, "searches": 0, "stale_fallbacks": 0}
+
+
+
+
+def _query(loc: WeatherLocation) -> str:
+    """
+    Build the YouTube search query of a location.
+
+    Args:
+        loc: The location
+
+    Returns:
+        The search query string.
+    """
+    return f"weather in {loc.city}" + (f", {loc.country}" if loc.country else "")
+
+
+async def get_location_videos(loc: WeatherLocation, max_results: int = 3) -> List[Dict[str, Any]]:
+    """
+    Get the weather videos of a location from memory or the database, and
+    search YouTube only once the cached search is older than VIDEO_CACHE_TTL.
+    When the search fails because the quota is used up, the last stored
+    search is returned however old it is. The database lookups run in the
+    threadpool.
+
+    Args:
+        loc: The location
+        max_results: The maximum number of results to return
+
+    Raises:
+        RateLimitExceeded: If the quota is used up and nothing is stored yet.
+        httpx.HTTPError: If the search fails and nothing is stored yet, or for non-quota errors.
+
+    Returns:
+        A list of dictionaries containing video IDs, titles, descriptions, and watch URLs.
+    """
+    key = (loc.id, max_results)
+    state, entry = _cache.lookup(key)
+    if state == FRESH:
+        return entry.value
+
+    cached = await run_in_session(crud.get_cached_videos, loc.id, max_results)
+    if cached is not None:
+        age = (utcnow() - cached.fetched_at).total_seconds()
+        if age < settings.VIDEO_CACHE_TTL:
+            _stats["db_hits"] += 1
+            _cache.set(key, cached.videos, settings.VIDEO_CACHE_TTL - age)
+            return cached.videos
+
+    try:
+        _stats["searches"] += 1
+        videos = await search_youtube_videos_async(_query(loc), max_results=max_results)
+    except Exception as error:
+        if cached is None or not is_quota_error(error):
+            raise
+        _stats["stale_fallbacks"] += 1
+        logger.warning("YouTube quota exhausted, serving videos of location %s fetched at %s", loc.id, cached.fetched_at)
+        return cached.videos
+    await run_in_session(crud.save_cached_videos, loc.id, max_results, videos)
+    _cache.set(key, videos, settings.VIDEO_CACHE_TTL)
+    return videos
+
+
+def invalidate(location_id: int) -> None:
+    """
+    Drop the in-memory searches of a deleted location.
+
+    Args:
+        location_id: ID of the location
+    """
+    _cache.invalidate_matching(lambda key: key[0] == location_id)
+
+
+def stats() -> Dict[str, Any]:
+    """
+    Get the video cache counters.
+
+    Returns:
+        A dictionary with the in-memory cache statistics and the database hits,
+        YouTube searches and stale fallbacks.
+    """
+    return dict(_stats, memory=_cache.stats(), ttl=settings.VIDEO_CACHE_TTL)
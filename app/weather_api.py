@@ -1,21 +1,199 @@
-import os
+import asyncio
+import json
+import threading
 import httpx
-from typing import Optional, Dict, Any
-from dotenv import load_dotenv
-from datetime import date, datetime
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional, Dict, Any, Awaitable, Callable, Iterator, List, Tuple
+from .config import Lazy, Setting, env
+from datetime import date
+from .cache import TTLCache, FRESH, STALE
+from .http_client import get_client, get_async_client
+from .singleflight import SingleFlight, AsyncSingleFlight
+from . import metrics, rate_limit
 
-# Load API key and basic variables
-load_dotenv()
-WEATHER_API_KEY = os.getenv("OPENWEATHER_API_KEY")
-BASE_URL = "https://api.openweathermap.org/data/2.5"
-UNITS = "metric" 
+UNITS = "metric"
 
 
+class _Settings:
+    # Load API key and basic variables
+    WEATHER_API_KEY = Setting("OPENWEATHER_API_KEY")
+    BASE_URL = Setting("OPENWEATHER_BASE_URL", "https://api.openweathermap.org/data/2.5")
+
+    # Response cache: current weather changes every ~10 minutes, forecasts every ~3 hours.
+    # Entries hold the raw response bodies, which every caller parses into its own
+    # dictionary, so that a caller modifying its response cannot alter the cache.
+    CACHE_MAX_ENTRIES = Setting("WEATHER_CACHE_MAX_ENTRIES", 1024, int)
+    WEATHER_CACHE_TTL = Setting("WEATHER_CACHE_TTL", 600.0, float)
+    FORECAST_CACHE_TTL = Setting("FORECAST_CACHE_TTL", 10800.0, float)
+    CACHE_GRACE = Setting("WEATHER_CACHE_GRACE", 300.0, float)
+    NEGATIVE_CACHE_TTL = Setting("WEATHER_NEGATIVE_CACHE_TTL", 300.0, float)
+
+
+settings = _Settings()
+
+
+def _create_limiter() -> rate_limit.TokenBucket:
+    """
+    Create this worker's share of the upstream call budget; the free tier
+    allows 60 calls per minute.
+
+    Returns:
+        The token bucket of the OpenWeather calls.
+    """
+    daily_budget = env("OPENWEATHER_DAILY_BUDGET")
+    return rate_limit.TokenBucket(
+        "openweather",
+        rate=float(env("OPENWEATHER_CALLS_PER_MINUTE", "60")) / 60,
+        burst=float(env("OPENWEATHER_BURST", "10")),
+        daily_budget=float(daily_budget) if daily_budget else None,
+        reserve=float(env("OPENWEATHER_USER_RESERVE", "2")),
+        max_wait={
+            rate_limit.USER: float(env("RATE_LIMIT_USER_MAX_WAIT", "5")),
+            rate_limit.PREFETCH: float(env("RATE_LIMIT_PREFETCH_MAX_WAIT", "60")),
+        },
+        workers=rate_limit.worker_count(),
+    )
+
+
+_cache = Lazy(lambda: TTLCache(max_entries=settings.CACHE_MAX_ENTRIES, grace_seconds=settings.CACHE_GRACE))
+_limiter = Lazy(_create_limiter)
+# Strong references to running background refresh tasks
+_refresh_tasks = set()
+# Identical concurrent cache misses share one upstream call
+_flight = SingleFlight()
+# Awaited before each upstream call started in a context, e.g. the prefetcher's call budget
+_call_budget: ContextVar[Optional[Callable[[], Awaitable[None]]]] = ContextVar("upstream_call_budget", default=None)
+_async_flight = AsyncSingleFlight()
+
+
+
+
+def _normalize_param(value: Any) -> Any:
+    """
+    Normalize a query parameter value for use in a cache key.
+    
+    Args:
+        value: The parameter value
+        
+    Returns:
+        The lower-cased, whitespace-stripped string, or the coordinate rounded to ~10 m.
+    """
+    if isinstance(value, float):
+        return round(value, 4)
+    if isinstance(value, str):
+        return ",".join(part.strip() for part in value.lower().split(","))
+    return value
+
+
+def _cache_key(endpoint: str, params: Dict[str, Any]) -> Tuple[Any, ...]:
+    """
+    Build the cache key of an API call from the endpoint and its parameters.
+    
+    Args:
+        endpoint: The API endpoint to call
+        params: A dictionary of parameters to include in the API call
+        
+    Returns:
+        A hashable cache key.
+    """
+    return (endpoint.strip("/").lower(),) + tuple(
+        sorted((name, _normalize_param(value)) for name, value in params.items())
+    )
+
+
+def _fetch(endpoint: str, params: Dict[str, Any]) -> bytes:
+    """
+    Call the OpenWeather API without going through the cache.
+    
+    Args:
+        endpoint: The API endpoint to call 
+        params: A dictionary of parameters to include in the API call
+        
+    Returns: 
+        The JSON body of the API response.
+    """
+    _limiter.acquire()
+    params = dict(params, appid=settings.WEATHER_API_KEY, units=UNITS)
+    url = f"{settings.BASE_URL}/{endpoint}"
+    with metrics.track_upstream(endpoint) as call:
+        resp = get_client().get(url, params=params)
+        call["status"] = resp.status_code
+    resp.raise_for_status()
+    return resp.content
+
+
+def _store(endpoint: str, key: Tuple[Any, ...], data: Optional[bytes], error: Optional[httpx.HTTPStatusError] = None) -> None:
+    """
+    Store an API response in the cache. Unknown locations (404) are negatively
+    cached; other errors are not cached.
+    
+    Args:
+        endpoint: The API endpoint that was called
+        key: The cache key of the call
+        data: The JSON body returned by the API, if the call succeeded
+        error: The HTTP status error raised by the call, if it failed
+    """
+    if error is not None:
+        if error.response.status_code == 404:
+            # Keep the message and response only, not the exception and its traceback
+            message, request, response = str(error), error.request, error.response
+            _cache.set(
+                key, None, settings.NEGATIVE_CACHE_TTL,
+                error=lambda: httpx.HTTPStatusError(message, request=request, response=response),
+            )
+        return
+    _cache.set(key, data, settings.FORECAST_CACHE_TTL if endpoint == "forecast" else settings.WEATHER_CACHE_TTL)
+
+
+def _fetch_and_store(endpoint: str, params: Dict[str, Any], key: Tuple[Any, ...]) -> bytes:
+    """
+    Call the OpenWeather API and store the response in the cache.
+    
+    Args:
+        endpoint: The API endpoint to call 
+        params: A dictionary of parameters to include in the API call
+        key: The cache key of the call
+        
+    Returns: 
+        The JSON body of the API response.
+    """
+    try:
+        data = _fetch(endpoint, params)
+    except httpx.HTTPStatusError as err:
+        _store(endpoint, key, None, error=err)
+        raise
+    _store(endpoint, key, data)
+    return data
+
+
+def _refresh(endpoint: str, params: Dict[str, Any], key: Tuple[Any, ...]) -> None:
+    """
+    Refresh a stale cache entry in the background, behind user-facing calls
+    in the rate limiter. On failure the stale entry keeps being served until
+    its grace window ends.
+    
+    Args:
+        endpoint: The API endpoint to call 
+        params: A dictionary of parameters to include in the API call
+        key: The cache key of the call
+    """
+    try:
+        with rate_limit.priority(rate_limit.PREFETCH):
+            _fetch_and_store(endpoint, params, key)
+    except (httpx.HTTPError, rate_limit.RateLimitExceeded):
+        pass
+    finally:
+        _cache.end_refresh(key)
 
 
 def _call_api(endpoint: str, params: Dict[str, Any]) -> Dict[str, Any]:
     """
     Call the OpenWeather API and return the weather report as a JSON dictionary.
+    Responses are cached per endpoint; an expired response is still served
+    during its grace window while one background refresh runs, and concurrent
+    misses for the same query share a single upstream call. Every caller gets
+    its own dictionary, parsed from the cached response body.
     
     Args:
         endpoint: The API endpoint to call 
@@ -24,14 +202,37 @@ def _call_api(endpoint: str, params: Dict[str, Any]) -> Dict[str, Any]:
     Returns: 
         A JSON dictionary containing the API response.
     """
-    params.update({
-        "appid": WEATHER_API_KEY,
-        "units": UNITS,
-    })
-    url = f"{BASE_URL}/{endpoint}"
-    resp = httpx.get(url, params=params, timeout=10.0)
-    resp.raise_for_status()
-    return resp.json()
+    key = _cache_key(endpoint, params)
+    state, entry = _cache.lookup(key)
+    if state == FRESH:
+        return json.loads(entry.result())
+    if state == STALE:
+        if _cache.begin_refresh(key):
+            threading.Thread(target=_refresh, args=(endpoint, dict(params), key), daemon=True).start()
+        return json.loads(entry.result())
+    return json.loads(_flight.do(key, _fetch_and_store, endpoint, params, key))
+
+
+
+
+def cache_stats() -> Dict[str, Any]:
+    """
+    Get the counters of the OpenWeather response cache.
+    
+    Returns:
+        A dictionary with hit/miss/eviction counters, the current size and the hit ratio.
+    """
+    return _cache.stats()
+
+
+def coalescing_stats() -> Dict[str, Any]:
+    """
+    Get the counters of OpenWeather request coalescing.
+    
+    Returns:
+        A dictionary with upstream call and coalesced caller counts, per client flavour.
+    """
+    return {"sync": _flight.stats(), "async": _async_flight.stats()}
 
 
 
@@ -105,6 +306,75 @@ def get_forecast_by_city(city: str, country: Optional[str] = None) -> Dict[str,
 
 
 
+class ForecastWindow:
+    """
+    A 5-day forecast fetched once and indexed by date, so that every day of a
+    date range can be served without another upstream call.
+    
+    Attributes:
+        forecast: The raw forecast payload returned by the OpenWeather API
+    """
+    def __init__(self, forecast: Dict[str, Any]):
+        self.forecast = forecast
+        self._slots_by_date: Dict[date, List[Dict[str, Any]]] = {}
+        for slot in forecast.get("list", []):
+            slot_date = date.fromisoformat(slot["dt_txt"][:10])
+            self._slots_by_date.setdefault(slot_date, []).append(slot)
+
+    def dates(self) -> List[date]:
+        """
+        List the dates covered by the forecast, in chronological order.
+        
+        Returns:
+            A list of dates that have at least one 3-hour slot.
+        """
+        return sorted(self._slots_by_date)
+
+    def slots(self, day: date) -> List[Dict[str, Any]]:
+        """
+        Get all 3-hour forecast slots of a date.
+        
+        Args:
+            day: The date to look up
+            
+        Returns:
+            A list of JSON dictionaries, empty if the date is not covered.
+        """
+        return self._slots_by_date.get(day, [])
+
+    def get(self, day: date) -> Optional[Dict[str, Any]]:
+        """
+        Get the first 3-hour forecast slot of a date.
+        
+        Args:
+            day: The date to look up
+            
+        Returns:
+            A JSON dictionary containing the forecast data for the date,
+            or None if no forecast is available for that date.
+        """
+        slots = self._slots_by_date.get(day)
+        return slots[0] if slots else None
+
+
+
+
+def get_forecast_window(city: str, country: Optional[str] = None) -> ForecastWindow:
+    """
+    Fetch the weather forecast of a city once and index it by date.
+    
+    Args:
+        city: The name of the city to look up
+        country: Optional country code
+        
+    Returns:
+        A ForecastWindow serving every date covered by the forecast.
+    """
+    return ForecastWindow(get_forecast_by_city(city, country))
+
+
+
+
 def get_forecast_by_date_and_city(date: date, city: str, country: Optional[str] = None) -> Optional[Dict[str, Any]]:
     """
     Lookup weather forecast for a specific date by city name.
@@ -118,15 +388,192 @@ def get_forecast_by_date_and_city(date: date, city: str, country: Optional[str]
         A JSON dictionary containing the weather forecast data for the specific date,
         or None if no forecast is available for that date.
     """
-    forecast = get_forecast_by_city(city, country)
-    for info in forecast.get("list", []):
-        if info["dt_txt"].startswith(date.strftime("%Y-%m-%d")):
-            return info
-    return None
+    return get_forecast_window(city, country).get(date)
 
 
 
 
+################################################################################
+# Async variants, sharing the cache and the lifespan-managed pooled client
+################################################################################
+async def _fetch_async(endpoint: str, params: Dict[str, Any]) -> bytes:
+    """
+    Call the OpenWeather API asynchronously without going through the cache.
+    
+    Args:
+        endpoint: The API endpoint to call 
+        params: A dictionary of parameters to include in the API call
+        
+    Returns: 
+        The JSON body of the API response.
+    """
+    budget = _call_budget.get()
+    if budget is not None:
+        await budget()
+    await _limiter.acquire_async()
+    params = dict(params, appid=settings.WEATHER_API_KEY, units=UNITS)
+    url = f"{settings.BASE_URL}/{endpoint}"
+    with metrics.track_upstream(endpoint) as call:
+        resp = await get_async_client().get(url, params=params)
+        call["status"] = resp.status_code
+    resp.raise_for_status()
+    return resp.content
+
+
+async def _fetch_and_store_async(endpoint: str, params: Dict[str, Any], key: Tuple[Any, ...]) -> bytes:
+    """
+    Call the OpenWeather API asynchronously and store the response in the cache.
+    
+    Args:
+        endpoint: The API endpoint to call 
+        params: A dictionary of parameters to include in the API call
+        key: The cache key of the call
+        
+    Returns: 
+        The JSON body of the API response.
+    """
+    try:
+        data = await _fetch_async(endpoint, params)
+    except httpx.HTTPStatusError as err:
+        _store(endpoint, key, None, error=err)
+        raise
+    _store(endpoint, key, data)
+    return data
+
+
+async def _refresh_async(endpoint: str, params: Dict[str, Any], key: Tuple[Any, ...]) -> None:
+    """
+    Refresh a stale cache entry in a background task.
+    
+    Args:
+        endpoint: The API endpoint to call 
+        params: A dictionary of parameters to include in the API call
+        key: The cache key of the call
+    """
+    try:
+        with rate_limit.priority(rate_limit.PREFETCH):
+            await _fetch_and_store_async(endpoint, params, key)
+    except (httpx.HTTPError, rate_limit.RateLimitExceeded):
+        pass
+    finally:
+        _cache.end_refresh(key)
+
+
+@contextmanager
+def call_budget(acquire: Callable[[], Awaitable[None]]) -> Iterator[None]:
+    """
+    Await `acquire()` before each asynchronous upstream call started in a block.
+    Calls served from the cache or coalesced onto a call started elsewhere are
+    not counted.
+
+    Args:
+        acquire: Coroutine function waiting until one more call fits the budget
+    """
+    token = _call_budget.set(acquire)
+    try:
+        yield
+    finally:
+        _call_budget.reset(token)
+
+
+async def _call_api_async(endpoint: str, params: Dict[str, Any], refresh: bool = False) -> Dict[str, Any]:
+    """
+    Asynchronous version of `_call_api`.
+    
+    Args:
+        endpoint: The API endpoint to call 
+        params: A dictionary of parameters to include in the API call
+        refresh: Whether to call the API even if the response is cached, replacing the cached response
+        
+    Returns: 
+        A JSON dictionary containing the API response.
+    """
+    key = _cache_key(endpoint, params)
+    if not refresh:
+        state, entry = _cache.lookup(key)
+        if state == FRESH:
+            return json.loads(entry.result())
+        if state == STALE:
+            if _cache.begin_refresh(key):
+                task = asyncio.create_task(_refresh_async(endpoint, dict(params), key))
+                _refresh_tasks.add(task)
+                task.add_done_callback(_refresh_tasks.discard)
+            return json.loads(entry.result())
+    return json.loads(await _async_flight.do(key, _fetch_and_store_async, endpoint, params, key))
+
+
+
+
+async def get_weather_by_city_async(city: str, country: Optional[str] = None, refresh: bool = False) -> Dict[str, Any]:
+    """
+    Asynchronous version of `get_weather_by_city`.
+
+    Args:
+        city: The name of the city to look up
+        country: Optional country code 
+        refresh: Whether to call the API even if the weather is cached, replacing the cached response
+        
+    Returns: 
+        A JSON dictionary containing the current weather data.
+    """
+    q = f"{city},{country}" if country else city
+    return await _call_api_async("weather", {"q": q}, refresh)
+
+
+async def get_weather_by_zip_async(zip: str, country: str = "us") -> Dict[str, Any]:
+    """
+    Asynchronous version of `get_weather_by_zip`.
+    
+    Args:
+        zip: The postal code to look up
+        country: Optional country code (default is "us")
+        
+    Returns:
+        A JSON dictionary containing the current weather data.
+    """
+    return await _call_api_async("weather", {"zip": f"{zip},{country}"})
+
+
+async def get_weather_by_coords_async(lat: float, lon: float) -> Dict[str, Any]:
+    """
+    Asynchronous version of `get_weather_by_coords`.
+    
+    Args:
+        lat: Latitude
+        lon: Longitude
+    
+    Returns:
+        A JSON dictionary containing the current weather data.
+    """
+    return await _call_api_async("weather", {"lat": lat, "lon": lon})
+
 
+async def get_forecast_by_city_async(city: str, country: Optional[str] = None, refresh: bool = False) -> Dict[str, Any]:
+    """
+    Asynchronous version of `get_forecast_by_city`.
+    
+    Args:
+        city: The name of the city to look up
+        country: Optional country code
+        refresh: Whether to call the API even if the forecast is cached, replacing the cached response
+        
+    Returns:
+        A JSON dictionary containing the weather forecast data.
+    """
+    q = f"{city},{country}" if country else city
+    return await _call_api_async("forecast", {"q": q}, refresh)
 
 
+async def get_forecast_window_async(city: str, country: Optional[str] = None, refresh: bool = False) -> ForecastWindow:
+    """
+    Asynchronous version of `get_forecast_window`.
+    
+    Args:
+        city: The name of the city to look up
+        country: Optional country code
+        refresh: Whether to call the API even if the forecast is cached, replacing the cached response
+        
+    Returns:
+        A ForecastWindow serving every date covered by the forecast.
+    """
+    return ForecastWindow(await get_forecast_by_city_async(city, country, refresh))
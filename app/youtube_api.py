@@ -1,38 +1,81 @@
 # youtube_api.py
-import os
 import httpx
-from typing import List, Dict, Any
-from dotenv import load_dotenv
+from typing import List, Dict, Any, Tuple
+from .config import Lazy, Setting, env
+from .http_client import get_client, get_async_client
+from .singleflight import SingleFlight, AsyncSingleFlight
+from . import metrics, rate_limit
 
-load_dotenv()
-YOUTUBE_KEY = os.getenv("YOUTUBE_API_KEY")
-YOUTUBE_SEARCH_URL = "https://www.googleapis.com/youtube/v3/search"
+class _Settings:
+    YOUTUBE_KEY = Setting("YOUTUBE_API_KEY")
+    YOUTUBE_SEARCH_URL = Setting("YOUTUBE_SEARCH_URL", "https://www.googleapis.com/youtube/v3/search")
 
-def search_youtube_videos(
-    query: str,
-    max_results: int = 3
-) -> List[Dict[str, Any]]:
+    # Quota accounting: a search costs 100 units of the 10,000 units granted per day
+    YOUTUBE_SEARCH_COST = Setting("YOUTUBE_SEARCH_COST", 100.0, float)
+
+
+settings = _Settings()
+
+
+def _create_limiter() -> rate_limit.TokenBucket:
     """
-    Search YouTube for a given query, return a list of video titles and IDs.
+    Create this worker's share of the quota budget of the searches, in quota units.
+
+    Returns:
+        The token bucket of the YouTube calls.
+    """
+    return rate_limit.TokenBucket(
+        "youtube",
+        rate=float(env("YOUTUBE_UNITS_PER_MINUTE", "1000")) / 60,
+        burst=float(env("YOUTUBE_BURST_UNITS", "1000")),
+        daily_budget=float(env("YOUTUBE_DAILY_UNITS", "10000")),
+        max_wait={
+            rate_limit.USER: float(env("RATE_LIMIT_USER_MAX_WAIT", "5")),
+            rate_limit.PREFETCH: float(env("RATE_LIMIT_PREFETCH_MAX_WAIT", "60")),
+        },
+        workers=rate_limit.worker_count(),
+    )
+
+
+_limiter = Lazy(_create_limiter)
+
+# Identical concurrent searches share one upstream call
+_flight = SingleFlight()
+_async_flight = AsyncSingleFlight()
+
+# Error reasons returned by the API when the quota is used up
+QUOTA_ERROR_REASONS = {"quotaExceeded", "dailyLimitExceeded", "rateLimitExceeded", "userRateLimitExceeded"}
+
+def _search_params(query: str, max_results: int) -> Dict[str, Any]:
+    """
+    Build the query parameters of a YouTube search call.
     
     Args:
         query: The search query string
-        max_results: The maximum number of results to return (default is 3)
+        max_results: The maximum number of results to return
         
     Returns:
-        A list of dictionaries containing video IDs, titles, descriptions, and thumbnail URLs.
+        A dictionary of query parameters.
     """
-    params = {
+    return {
         "part": "snippet",
         "q": query,
         "type": "video",
         "maxResults": max_results,
-        "key": YOUTUBE_KEY
+        "key": settings.YOUTUBE_KEY
     }
-    resp = httpx.get(YOUTUBE_SEARCH_URL, params=params, timeout=10.0)
-    resp.raise_for_status()
-    data = resp.json()
 
+
+def _parse_search_results(data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Extract the videos from a YouTube search response.
+    
+    Args:
+        data: The JSON dictionary returned by the search API
+        
+    Returns:
+        A list of dictionaries containing video IDs, titles, descriptions, and watch URLs.
+    """
     results: List[Dict[str, Any]] = []
     for item in data.get("items", []):
         vid_id = item["id"]["videoId"]
@@ -43,4 +86,123 @@ def search_youtube_videos(
             "description": snippet["description"],
             "watch_url": f"https://www.youtube.com/watch?v={vid_id}"
         })
-    return results
\ No newline at end of file
+    return results
+
+
+def _flight_key(query: str, max_results: int) -> Tuple[str, int]:
+    """
+    Build the key identifying identical searches.
+    
+    Args:
+        query: The search query string
+        max_results: The maximum number of results to return
+        
+    Returns:
+        The normalized query and the result count.
+    """
+    return (" ".join(query.lower().split()), max_results)
+
+
+def _search(query: str, max_results: int) -> List[Dict[str, Any]]:
+    """
+    Call the YouTube search API.
+    
+    Args:
+        query: The search query string
+        max_results: The maximum number of results to return
+        
+    Returns:
+        A list of dictionaries containing video IDs, titles, descriptions, and watch URLs.
+    """
+    _limiter.acquire(settings.YOUTUBE_SEARCH_COST)
+    with metrics.track_upstream("youtube") as call:
+        resp = get_client().get(settings.YOUTUBE_SEARCH_URL, params=_search_params(query, max_results))
+        call["status"] = resp.status_code
+    resp.raise_for_status()
+    return _parse_search_results(resp.json())
+
+
+async def _search_async(query: str, max_results: int) -> List[Dict[str, Any]]:
+    """
+    Call the YouTube search API asynchronously.
+    
+    Args:
+        query: The search query string
+        max_results: The maximum number of results to return
+        
+    Returns:
+        A list of dictionaries containing video IDs, titles, descriptions, and watch URLs.
+    """
+    await _limiter.acquire_async(settings.YOUTUBE_SEARCH_COST)
+    with metrics.track_upstream("youtube") as call:
+        resp = await get_async_client().get(settings.YOUTUBE_SEARCH_URL, params=_search_params(query, max_results))
+        call["status"] = resp.status_code
+    resp.raise_for_status()
+    return _parse_search_results(resp.json())
+
+
+def is_quota_error(error: BaseException) -> bool:
+    """
+    Tell whether a search failed because the quota is used up, either
+    locally (rate limiter) or as reported by the API.
+    
+    Args:
+        error: The exception raised by a search
+        
+    Returns:
+        True for quota errors, False otherwise.
+    """
+    if isinstance(error, rate_limit.RateLimitExceeded):
+        return True
+    if not isinstance(error, httpx.HTTPStatusError) or error.response.status_code not in (403, 429):
+        return False
+    try:
+        errors = error.response.json()["error"]["errors"]
+        return any(e.get("reason") in QUOTA_ERROR_REASONS for e in errors)
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return error.response.status_code == 429
+
+
+def search_youtube_videos(
+    query: str,
+    max_results: int = 3
+) -> List[Dict[str, Any]]:
+    """
+    Search YouTube for a given query, return a list of video titles and IDs.
+    
+    Args:
+        query: The search query string
+        max_results: The maximum number of results to return (default is 3)
+        
+    Returns:
+        A list of dictionaries containing video IDs, titles, descriptions, and thumbnail URLs.
+    """
+    return _flight.do(_flight_key(query, max_results), _search, query, max_results)
+
+
+async def search_youtube_videos_async(
+    query: str,
+    max_results: int = 3
+) -> List[Dict[str, Any]]:
+    """
+    Asynchronous version of `search_youtube_videos`, using the shared pooled client.
+    Concurrent identical searches share one upstream call.
+    
+    Args:
+        query: The search query string
+        max_results: The maximum number of results to return (default is 3)
+        
+    Returns:
+        A list of dictionaries containing video IDs, titles, descriptions, and thumbnail URLs.
+    """
+    return await _async_flight.do(_flight_key(query, max_results), _search_async, query, max_results)
+
+
+def coalescing_stats() -> Dict[str, Any]:
+    """
+    Get the counters of YouTube search coalescing.
+    
+    Returns:
+        A dictionary with upstream call and coalesced caller counts, per client flavour.
+    """
+    return {"sync": _flight.stats(), "async": _async_flight.stats()}
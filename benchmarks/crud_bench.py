@@ -0,0 +1,183 @@
+"""
+Benchmarks of the `app.crud` functions against a SQLite database seeded with
+a given number of weather infos (365 consecutive days per location).
+"""
+import math
+import os
+import random
+import shutil
+from datetime import date, datetime, timedelta
+from itertools import islice
+from typing import Dict, Iterator, Tuple
+
+import harness  # noqa: F401  (puts the repository root on sys.path)
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import sessionmaker
+
+from app import crud, database
+from app.database import Base
+from harness import bench
+
+DAYS_PER_LOCATION = 365
+FIRST_DATE = date(2000, 1, 1)
+SEED_CHUNK_SIZE = 100_000
+
+
+
+
+def open_database(path: str) -> Engine:
+    """
+    Open a SQLite database with the app's engine profile and create the schema.
+
+    Args:
+        path: Database file
+
+    Returns:
+        The engine.
+    """
+    url = f"sqlite:///{path}"
+    engine = create_engine(url, **database._engine_options(url))
+    event.listen(engine, "connect", database._set_sqlite_pragmas)
+    Base.metadata.create_all(bind=engine)
+    return engine
+
+
+def _info_rows(rows: int) -> Iterator[Tuple]:
+    """
+    Generate the seeded weather info rows.
+
+    Args:
+        rows: Number of rows
+
+    Returns:
+        An iterator of (location_id, date, temperature, description, updated_at) tuples.
+    """
+    rng = random.Random(0)
+    updated_at = datetime(2024, 1, 1).isoformat(sep=" ")
+    for k in range(rows):
+        day = (FIRST_DATE + timedelta(days=k % DAYS_PER_LOCATION)).isoformat()
+        yield (k // DAYS_PER_LOCATION + 1, day, round(rng.uniform(-20, 35), 1), "clear sky", updated_at)
+
+
+def seed(engine: Engine, rows: int) -> int:
+    """
+    Fill an empty database with `rows` weather infos, skipped when already seeded.
+
+    Args:
+        engine: Database engine
+        rows: Number of weather infos
+
+    Returns:
+        The number of locations.
+    """
+    locations = max(1, math.ceil(rows / DAYS_PER_LOCATION))
+    with engine.begin() as conn:
+        if conn.execute(text("SELECT COUNT(*) FROM locations")).scalar():
+            return locations
+        rng = random.Random(1)
+        conn.exec_driver_sql(
+            "INSERT INTO locations (id, city, country, lat, lon, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+            [(i, f"city{i}", "XX", rng.uniform(-60, 60), rng.uniform(-180, 180), "2024-01-01 00:00:00")
+             for i in range(1, locations + 1)],
+        )
+        infos = _info_rows(rows)
+        while True:
+            chunk = list(islice(infos, SEED_CHUNK_SIZE))
+            if not chunk:
+                break
+            conn.exec_driver_sql(
+                "INSERT INTO weather_info (location_id, date, temperature, weather_description, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                chunk,
+            )
+    return locations
+
+
+def run(db_dir: str, rows: int, repeat: int = 200) -> Dict[str, Dict[str, float]]:
+    """
+    Time every crud function on a database of `rows` weather infos.
+
+    Args:
+        db_dir: Directory of the seeded database file, reused across runs of the same size
+        rows: Number of seeded weather infos
+        repeat: Number of timed calls per fast function; offset pagination gets a tenth
+
+    Returns:
+        Summaries keyed by 'crud.<function>@<rows>'.
+    """
+    # Seed once, then benchmark a copy so that every run starts from the same data
+    template = os.path.join(db_dir, f"crud_{rows}.seed.db")
+    engine = open_database(template)
+    locations = seed(engine, rows)
+    engine.dispose()
+    working = os.path.join(db_dir, f"crud_{rows}.run.db")
+    shutil.copyfile(template, working)
+    engine = open_database(working)
+    db = sessionmaker(bind=engine, autoflush=False)()
+    rng = random.Random(2)
+    last_day = FIRST_DATE + timedelta(days=DAYS_PER_LOCATION - 1)
+    # Dates after the seeded range, 10 days apart, so that writes never conflict with stored rows
+    future = (last_day + timedelta(days=10 * i) for i in range(1, 10 ** 5))
+
+    def loc() -> int:
+        return rng.randint(1, locations)
+
+    def info() -> int:
+        return rng.randint(1, rows)
+
+    def day() -> date:
+        return FIRST_DATE + timedelta(days=rng.randrange(DAYS_PER_LOCATION))
+
+    slow = max(5, repeat // 10)
+    results: Dict[str, Dict[str, float]] = {}
+
+    def record(name: str, fn, args) -> None:
+        results[f"crud.{name}@{rows}"] = bench(fn, list(args))
+        db.expunge_all()
+
+    # Reads
+    record("get_location", crud.get_location, ((db, loc()) for _ in range(repeat)))
+    record("get_location_by_city", crud.get_location_by_city, ((db, f"city{loc()}") for _ in range(repeat)))
+    record("get_locations", crud.get_locations, ((db, [loc() for _ in range(50)]) for _ in range(repeat)))
+    record("list_locations", crud.list_locations, ((db, rng.randrange(locations), 100) for _ in range(slow)))
+    record("list_locations_after", crud.list_locations_after, ((db, rng.randrange(locations), 100) for _ in range(repeat)))
+    record("get_info", crud.get_info, ((db, info()) for _ in range(repeat)))
+    record("list_infos", crud.list_infos, ((db, rng.randrange(rows), 100) for _ in range(slow)))
+    record("list_infos_after", crud.list_infos_after, ((db, rng.randrange(rows), 100) for _ in range(repeat)))
+    record("get_info_by_loc_date", crud.get_info_by_loc_date, ((db, loc(), day()) for _ in range(repeat)))
+    record("get_infos_by_loc_date_range", crud.get_infos_by_loc_date_range, (
+        (db, loc(), start, start + timedelta(days=29)) for start in (day() for _ in range(repeat))
+    ))
+    record("get_infos_by_locs_date_range", crud.get_infos_by_locs_date_range, (
+        (db, [loc() for _ in range(20)], start, start + timedelta(days=6)) for start in (day() for _ in range(repeat))
+    ))
+    record("get_temperature_aggregates", crud.get_temperature_aggregates, (
+        (db, "week", True, [loc() for _ in range(10)], FIRST_DATE, last_day) for _ in range(slow)
+    ))
+
+    # Writes, each committing its own transaction
+    record("create_location", crud.create_location, (
+        (db, f"bench-{i}", "XX", rng.uniform(-60, 60), rng.uniform(-180, 180)) for i in range(repeat)
+    ))
+    record("create_locations", crud.create_locations, (
+        (db, [{"city": f"bench-batch{i}-{j}", "country": "XX"} for j in range(100)]) for i in range(slow)
+    ))
+    record("create_info", crud.create_info, ((db, loc(), next(future), 20.0, "clear sky") for _ in range(repeat)))
+    record("upsert_infos", crud.upsert_infos, (
+        (db, loc(), [{"date": start + timedelta(days=d), "temperature": 20.0, "weather_description": "clear sky"}
+                     for d in range(7)])
+        for start in (next(future) for _ in range(repeat))
+    ))
+    record("update_info", crud.update_info, ((db, info(), {"temperature": 21.5}) for _ in range(repeat)))
+    doomed = [crud.create_info(db, loc(), next(future), 0.0, "to delete").id for _ in range(repeat)]
+    record("delete_info", crud.delete_info, ((db, info_id) for info_id in doomed))
+    doomed = [crud.create_location(db, f"bench-doomed{i}").id for i in range(repeat)]
+    record("delete_location", crud.delete_location, ((db, loc_id) for loc_id in doomed))
+
+    db.close()
+    engine.dispose()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(working + suffix):
+            os.remove(working + suffix)
+    return results
@@ -0,0 +1,205 @@
+"""
+An offline stand-in for the OpenWeather and YouTube APIs, answering canned
+responses after an injectable latency and failing an injectable share of the
+calls. It can be plugged into the app's HTTP clients as httpx transports, or
+served over HTTP with uvicorn:
+
+    python benchmarks/fake_upstream.py --port 9100 --latency-ms 50 --error-rate 0.01
+
+and then pointed at with OPENWEATHER_BASE_URL=http://127.0.0.1:9100/data/2.5 and
+YOUTUBE_SEARCH_URL=http://127.0.0.1:9100/youtube/v3/search. GET /_stats returns
+the call counters, and POST /_config?latency_ms=..&error_rate=.. changes the
+injected latency and errors.
+"""
+import argparse
+import asyncio
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Tuple
+
+import httpx
+
+# Canned upstream responses
+WEATHER = {
+    "coord": {"lat": 43.65, "lon": -79.38},
+    "main": {"temp": 21.3, "humidity": 52, "pressure": 1012},
+    "weather": [{"description": "clear sky"}],
+    "wind": {"speed": 3.1},
+}
+
+
+
+
+def forecast() -> Dict[str, Any]:
+    """
+    Build a 5-day / 3-hour forecast response starting now.
+
+    Returns:
+        A forecast JSON dictionary with 40 slots.
+    """
+    start = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    slots = []
+    for i in range(40):
+        at = start + timedelta(hours=3 * i)
+        slots.append({
+            "dt": int(at.timestamp()),
+            "dt_txt": at.strftime("%Y-%m-%d %H:%M:%S"),
+            "main": {"temp": 15.0 + i % 8, "humidity": 60, "pressure": 1010},
+            "weather": [{"description": "scattered clouds"}],
+            "wind": {"speed": 4.2},
+        })
+    return {"list": slots, "city": {"coord": WEATHER["coord"]}}
+
+
+def youtube(max_results: int) -> Dict[str, Any]:
+    """
+    Build a YouTube search response.
+
+    Args:
+        max_results: Number of videos
+
+    Returns:
+        A search JSON dictionary.
+    """
+    return {"items": [
+        {"id": {"videoId": f"video{i}"}, "snippet": {"title": f"Weather {i}", "description": "Forecast"}}
+        for i in range(max_results)
+    ]}
+
+
+
+
+class FakeUpstream:
+    """
+    The stand-in server logic, with per-endpoint call counters.
+
+    Attributes:
+        latency: Seconds waited before each response
+        error_rate: Share of calls answered with a 500 error, between 0 and 1
+    """
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._counts = {"weather": 0, "forecast": 0, "youtube": 0, "other": 0, "errors": 0}
+        self._lock = threading.Lock()
+
+    def respond(self, path: str, params: Dict[str, str]) -> Tuple[int, Dict[str, Any]]:
+        """
+        Answer a call.
+
+        Args:
+            path: The URL path
+            params: The query parameters
+
+        Returns:
+            The status code and the JSON body.
+        """
+        if path.endswith("/search"):
+            endpoint, body = "youtube", youtube(int(params.get("maxResults", 3)))
+        elif path.endswith("/forecast"):
+            endpoint, body = "forecast", forecast()
+        elif path.endswith("/weather"):
+            endpoint, body = "weather", WEATHER
+        else:
+            endpoint, body = "other", None
+        with self._lock:
+            self._counts[endpoint] += 1
+            failed = self._random.random() < self.error_rate
+            if failed:
+                self._counts["errors"] += 1
+        if body is None:
+            return 404, {"message": "not found"}
+        if failed:
+            return 500, {"message": "injected error"}
+        return 200, body
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Get the call counters.
+
+        Returns:
+            A dictionary of call counts per endpoint, and the injected errors.
+        """
+        with self._lock:
+            return dict(self._counts)
+
+    def transport(self) -> httpx.MockTransport:
+        """
+        Build a transport for synchronous httpx clients.
+
+        Returns:
+            An httpx.MockTransport sleeping the calling thread.
+        """
+        def handler(request: httpx.Request) -> httpx.Response:
+            time.sleep(self.latency)
+            status, body = self.respond(request.url.path, dict(request.url.params))
+            return httpx.Response(status, json=body)
+        return httpx.MockTransport(handler)
+
+    def async_transport(self) -> httpx.MockTransport:
+        """
+        Build a transport for asynchronous httpx clients.
+
+        Returns:
+            An httpx.MockTransport sleeping the calling task.
+        """
+        async def handler(request: httpx.Request) -> httpx.Response:
+            await asyncio.sleep(self.latency)
+            status, body = self.respond(request.url.path, dict(request.url.params))
+            return httpx.Response(status, json=body)
+        return httpx.MockTransport(handler)
+
+    def asgi_app(self):
+        """
+        Build an ASGI application serving the stand-in over HTTP.
+
+        Returns:
+            A Starlette application.
+        """
+        from starlette.applications import Starlette
+        from starlette.requests import Request
+        from starlette.responses import JSONResponse
+        from starlette.routing import Route
+
+        async def stats(request: Request) -> JSONResponse:
+            return JSONResponse(self.stats())
+
+        async def configure(request: Request) -> JSONResponse:
+            if "latency_ms" in request.query_params:
+                self.latency = float(request.query_params["latency_ms"]) / 1000
+            if "error_rate" in request.query_params:
+                self.error_rate = float(request.query_params["error_rate"])
+            return JSONResponse({"latency_ms": self.latency * 1000, "error_rate": self.error_rate})
+
+        async def call(request: Request) -> JSONResponse:
+            await asyncio.sleep(self.latency)
+            status, body = self.respond(request.url.path, dict(request.query_params))
+            return JSONResponse(body, status_code=status)
+
+        return Starlette(routes=[
+            Route("/_stats", stats),
+            Route("/_config", configure, methods=["POST"]),
+            Route("/{path:path}", call),
+        ])
+
+
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Delay before each response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of calls failing with a 500 error")
+    args = parser.parse_args()
+
+    import uvicorn
+    upstream = FakeUpstream(args.latency_ms / 1000, args.error_rate)
+    uvicorn.run(upstream.asgi_app(), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+Timing, reporting and baseline comparison helpers shared by the benchmark suites.
+"""
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+
+
+def summarize(samples: Sequence[float]) -> Dict[str, float]:
+    """
+    Summarize timings.
+
+    Args:
+        samples: Durations in seconds
+
+    Returns:
+        A dictionary with the count and the min, median, p95 and mean in microseconds.
+    """
+    ordered = sorted(samples)
+    p95 = ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+    return {
+        "n": len(ordered),
+        "min_us": round(ordered[0] * 1e6, 1),
+        "median_us": round(statistics.median(ordered) * 1e6, 1),
+        "p95_us": round(p95 * 1e6, 1),
+        "mean_us": round(statistics.fmean(ordered) * 1e6, 1),
+    }
+
+
+def bench(fn: Callable[..., Any], args: Iterable[Sequence[Any]], warmup: int = 3) -> Dict[str, float]:
+    """
+    Time a function once per argument tuple. Arguments are prepared by the
+    caller so that only the call itself is timed.
+
+    Args:
+        fn: The function to time
+        args: One argument tuple per timed call
+        warmup: Number of leading calls not counted
+
+    Returns:
+        The summary of the timed calls (see `summarize`).
+    """
+    samples: List[float] = []
+    for i, call_args in enumerate(args):
+        started = time.perf_counter()
+        fn(*call_args)
+        elapsed = time.perf_counter() - started
+        if i >= warmup:
+            samples.append(elapsed)
+    return summarize(samples)
+
+
+async def bench_async(fn: Callable[..., Any], args: Iterable[Sequence[Any]], warmup: int = 3) -> Dict[str, float]:
+    """
+    Asynchronous version of `bench`, awaiting each call.
+
+    Args:
+        fn: The coroutine function to time
+        args: One argument tuple per timed call
+        warmup: Number of leading calls not counted
+
+    Returns:
+        The summary of the timed calls (see `summarize`).
+    """
+    samples: List[float] = []
+    for i, call_args in enumerate(args):
+        started = time.perf_counter()
+        await fn(*call_args)
+        elapsed = time.perf_counter() - started
+        if i >= warmup:
+            samples.append(elapsed)
+    return summarize(samples)
+
+
+def environment() -> Dict[str, str]:
+    """
+    Describe the machine and library versions, stored with the results.
+
+    Returns:
+        A dictionary of versions and platform details.
+    """
+    import sqlalchemy
+    import httpx
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "sqlalchemy": sqlalchemy.__version__,
+        "httpx": httpx.__version__,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+
+
+def write_results(path: str, results: Dict[str, Dict[str, float]]) -> None:
+    """
+    Write benchmark results as a JSON baseline.
+
+    Args:
+        path: Output file
+        results: Summaries keyed by benchmark name
+    """
+    with open(path, "w") as f:
+        json.dump({"environment": environment(), "results": results}, f, indent=2, sort_keys=True)
+
+
+def compare(
+    results: Dict[str, Dict[str, float]],
+    baseline_path: str,
+    tolerance: float,
+    metric: str = "median_us"
+) -> List[Dict[str, Any]]:
+    """
+    Compare results against a baseline file.
+
+    Args:
+        results: Summaries keyed by benchmark name
+        baseline_path: JSON file written by `write_results`
+        tolerance: Allowed slowdown ratio, e.g. 0.25 for 25%
+        metric: Summary field compared
+
+    Returns:
+        One dictionary per benchmark present in both, with the baseline and
+        current values, the ratio and whether it regressed.
+    """
+    with open(baseline_path) as f:
+        baseline = json.load(f)["results"]
+    rows = []
+    for name in sorted(results.keys() & baseline.keys()):
+        before, after = baseline[name][metric], results[name][metric]
+        ratio = after / before if before else float("inf")
+        rows.append({
+            "name": name,
+            "baseline": before,
+            "current": after,
+            "ratio": round(ratio, 3),
+            "regressed": ratio > 1 + tolerance,
+        })
+    return rows
+
+
+def print_table(results: Dict[str, Dict[str, float]], comparison: Optional[List[Dict[str, Any]]] = None) -> None:
+    """
+    Print results, and the comparison with a baseline if given, as a table.
+
+    Args:
+        results: Summaries keyed by benchmark name
+        comparison: Rows returned by `compare`
+    """
+    ratios = {row["name"]: row for row in comparison or []}
+    width = max((len(name) for name in results), default=10)
+    print(f"{'benchmark':<{width}}  {'median_us':>12}  {'p95_us':>12}  {'n':>6}  {'vs baseline':>12}")
+    for name, summary in sorted(results.items()):
+        row = ratios.get(name)
+        versus = "" if row is None else f"{row['ratio']:.2f}x" + (" !" if row["regressed"] else "")
+        print(f"{name:<{width}}  {summary['median_us']:>12.1f}  {summary['p95_us']:>12.1f}  {summary['n']:>6}  {versus:>12}")
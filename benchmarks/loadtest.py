@@ -0,0 +1,460 @@
+"""
+Load-test the whole app with a mix of concurrent requests against the offline
+upstream stand-in (see fake_upstream.py), and check latency SLOs.
+
+The app runs either in this process (served through httpx.ASGITransport, so
+the client shares the app's event loop) or under uvicorn with real sockets and
+optionally several workers. Requests are sent open-loop at the target rate,
+and latencies are measured from the time each request was scheduled, so a
+saturated app shows up as growing latency rather than a lower request rate.
+
+Usage:
+    python benchmarks/loadtest.py [--mode inprocess|uvicorn] [--rps 50] [--duration 30]
+        [--mix create=1,range=4,list=2,export=0.2,videos=2,stats=1] [--latency-ms 50] [--error-rate 0]
+        [--max-p95-ms 500] [--max-p99-ms 1000] [--max-error-rate 0.01] [--output report.json]
+
+Exits with status 1 when a threshold is exceeded.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from datetime import date, timedelta
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import harness  # noqa: F401  (puts the repository root on sys.path)
+import httpx
+
+from fake_upstream import FakeUpstream
+from harness import ROOT
+
+DEFAULT_MIX = "create=1,range=4,list=2,export=0.2,videos=2,stats=1"
+FORECAST_DAYS = 4
+
+
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    """
+    Parse a traffic mix such as 'create=1,range=4'.
+
+    Args:
+        mix: Comma-separated operation=weight pairs
+
+    Returns:
+        The weight of each operation.
+    """
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in OPERATIONS:
+            raise SystemExit(f"Unknown operation '{name.strip()}', expected one of {', '.join(OPERATIONS)}")
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+
+def percentile(ordered: List[float], q: float) -> float:
+    """
+    Get a percentile of sorted values, by nearest rank.
+
+    Args:
+        ordered: Sorted values
+        q: Percentile between 0 and 100
+
+    Returns:
+        The percentile value.
+    """
+    return ordered[min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered) + 0.5)) - 1))]
+
+
+def free_port() -> int:
+    """
+    Find a free local TCP port.
+
+    Returns:
+        The port number.
+    """
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+
+
+class Traffic:
+    """
+    Builds the requests of each operation from the seeded locations.
+
+    Attributes:
+        cities: Number of seeded cities
+        new_city_share: Share of create requests for a city not stored yet (one upstream fetch)
+    """
+    def __init__(self, cities: int, new_city_share: float, seed: int = 0):
+        self.cities = cities
+        self.new_city_share = new_city_share
+        self.location_ids: List[int] = []
+        self._random = random.Random(seed)
+        self._new_cities = 0
+        self._today = date.today()
+
+    def _location(self) -> int:
+        return self._random.choice(self.location_ids)
+
+    def create(self) -> Tuple[str, str, Dict[str, Any]]:
+        if self._random.random() < self.new_city_share:
+            self._new_cities += 1
+            city = f"Load{self._new_cities}"
+        else:
+            city = f"City{self._random.randrange(self.cities)}"
+        end = self._today + timedelta(days=self._random.randint(0, FORECAST_DAYS))
+        body = {"city": city, "country": "XX", "start_date": self._today.isoformat(), "end_date": end.isoformat()}
+        return "POST", "/weather_infos/", {"json": body}
+
+    def range(self) -> Tuple[str, str, Dict[str, Any]]:
+        params = {"start_date": self._today.isoformat(),
+                  "end_date": (self._today + timedelta(days=FORECAST_DAYS)).isoformat()}
+        return "GET", f"/weather_infos/by_loc_date_range/{self._location()}", {"params": params}
+
+    def list(self) -> Tuple[str, str, Dict[str, Any]]:
+        return "GET", "/weather_infos/", {"params": {"cursor": "", "limit": 100}}
+
+    def export(self) -> Tuple[str, str, Dict[str, Any]]:
+        return "GET", "/export/json", {"params": {"format": "ndjson"}}
+
+    def videos(self) -> Tuple[str, str, Dict[str, Any]]:
+        return "GET", f"/videos/{self._location()}", {}
+
+    def stats(self) -> Tuple[str, str, Dict[str, Any]]:
+        ids = ",".join(str(self._location()) for _ in range(5))
+        return "GET", "/stats", {"params": {"period": "day", "location_ids": ids, "percentiles": "50,90"}}
+
+
+OPERATIONS = ("create", "range", "list", "export", "videos", "stats")
+
+
+
+
+async def seed(client: httpx.AsyncClient, traffic: Traffic) -> None:
+    """
+    Store the cities used by the traffic mix, with their weather infos.
+
+    Args:
+        client: Client of the app
+        traffic: The traffic builder, receiving the location IDs
+    """
+    rng = random.Random(1)
+    today = date.today()
+    for i in range(traffic.cities):
+        location = {"city": f"City{i}", "country": "XX", "lat": rng.uniform(-60, 60), "lon": rng.uniform(-180, 180)}
+        resp = await client.post("/locations/", json=location)
+        resp.raise_for_status()
+        traffic.location_ids.append(resp.json()["id"])
+        resp = await client.post("/weather_infos/", json={
+            "city": f"City{i}", "country": "XX", "start_date": today.isoformat(),
+            "end_date": (today + timedelta(days=FORECAST_DAYS)).isoformat(),
+        })
+        resp.raise_for_status()
+
+
+async def drive(
+    client: httpx.AsyncClient,
+    traffic: Traffic,
+    weights: Dict[str, float],
+    rps: float,
+    duration: float,
+    max_inflight: int
+) -> Tuple[Dict[str, List[Tuple[float, int]]], int, float]:
+    """
+    Send requests open-loop at `rps` for `duration` seconds.
+
+    Args:
+        client: Client of the app
+        traffic: The traffic builder
+        weights: Weight of each operation
+        rps: Target requests per second
+        duration: Seconds of traffic
+        max_inflight: Requests in flight above which new ones are dropped (client saturated)
+
+    Returns:
+        The (latency in seconds, status code) samples per operation, the number
+        of dropped requests and the elapsed time.
+    """
+    names, cumulative = list(weights), []
+    total = 0.0
+    for name in names:
+        total += weights[name]
+        cumulative.append(total)
+    rng = random.Random(2)
+    samples: Dict[str, List[Tuple[float, int]]] = {name: [] for name in names}
+    inflight = set()
+    dropped = 0
+
+    async def send(name: str, scheduled: float) -> None:
+        method, url, kwargs = getattr(traffic, name)()
+        try:
+            resp = await client.request(method, url, **kwargs)
+            status = resp.status_code
+        except httpx.HTTPError:
+            status = 0
+        samples[name].append((time.perf_counter() - scheduled, status))
+
+    started = time.perf_counter()
+    for i in range(int(rps * duration)):
+        scheduled = started + i / rps
+        await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+        if len(inflight) >= max_inflight:
+            dropped += 1
+            continue
+        pick = rng.random() * total
+        name = next(name for name, bound in zip(names, cumulative) if pick < bound)
+        task = asyncio.create_task(send(name, scheduled))
+        inflight.add(task)
+        task.add_done_callback(inflight.discard)
+    if inflight:
+        await asyncio.gather(*inflight)
+    return samples, dropped, time.perf_counter() - started
+
+
+
+
+@asynccontextmanager
+async def inprocess_app(upstream: FakeUpstream) -> AsyncIterator[Tuple[httpx.AsyncClient, httpx.AsyncClient]]:
+    """
+    Start the app in this process, with its upstream clients on the stand-in.
+
+    Args:
+        upstream: The upstream stand-in
+
+    Returns:
+        A client of the app and a client of the stand-in's control routes.
+    """
+    from app import http_client
+    from app.main import app
+
+    async with app.router.lifespan_context(app):
+        http_client.open_client(upstream.transport())
+        await http_client.open_async_client(upstream.async_transport())
+        transport = httpx.ASGITransport(app=app)
+        control = httpx.ASGITransport(app=upstream.asgi_app())
+        async with httpx.AsyncClient(transport=transport, base_url="http://app", timeout=60) as client, \
+                httpx.AsyncClient(transport=control, base_url="http://upstream") as upstream_control:
+            yield client, upstream_control
+
+
+@asynccontextmanager
+async def uvicorn_app(args: argparse.Namespace) -> AsyncIterator[Tuple[httpx.AsyncClient, httpx.AsyncClient]]:
+    """
+    Start the upstream stand-in and the app as uvicorn processes.
+
+    Args:
+        args: The command line arguments
+
+    Returns:
+        A client of the app and a client of the stand-in's control routes.
+    """
+    upstream_port, app_port = free_port(), free_port()
+    upstream_url = f"http://127.0.0.1:{upstream_port}"
+    env = dict(
+        os.environ,
+        OPENWEATHER_BASE_URL=f"{upstream_url}/data/2.5",
+        YOUTUBE_SEARCH_URL=f"{upstream_url}/youtube/v3/search",
+    )
+    processes = [
+        subprocess.Popen([
+            sys.executable, os.path.join(ROOT, "benchmarks", "fake_upstream.py"), "--port", str(upstream_port),
+            "--latency-ms", str(args.latency_ms), "--error-rate", str(args.error_rate),
+        ]),
+        subprocess.Popen([
+            sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(app_port),
+            "--workers", str(args.workers), "--log-level", "warning",
+        ], cwd=ROOT, env=env),
+    ]
+    limits = httpx.Limits(max_connections=args.max_inflight, max_keepalive_connections=args.max_inflight)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{app_port}", timeout=60, limits=limits) as client, \
+                httpx.AsyncClient(base_url=upstream_url) as upstream:
+            deadline = time.monotonic() + 30
+            while True:
+                try:
+                    if (await client.get("/ops/stats")).status_code == 200 and \
+                            (await upstream.get("/_stats")).status_code == 200:
+                        break
+                except httpx.HTTPError:
+                    pass
+                if time.monotonic() > deadline:
+                    raise SystemExit("The app or the upstream stand-in did not start within 30 s")
+                await asyncio.sleep(0.2)
+            yield client, upstream
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait(timeout=10)
+
+
+async def db_statements(client: httpx.AsyncClient) -> Optional[int]:
+    """
+    Get the number of SQL statements executed by the app.
+
+    Args:
+        client: Client of the app
+
+    Returns:
+        The statement count of the worker answering.
+    """
+    return (await client.get("/ops/stats")).json()["db_pool"].get("statements")
+
+
+def report(
+    args: argparse.Namespace,
+    samples: Dict[str, List[Tuple[float, int]]],
+    dropped: int,
+    elapsed: float,
+    upstream_calls: Dict[str, int],
+    statements: Optional[int]
+) -> Dict[str, Any]:
+    """
+    Summarize a run and check it against the thresholds.
+
+    Args:
+        args: The command line arguments
+        samples: The (latency, status) samples per operation
+        dropped: Number of requests not sent because too many were in flight
+        elapsed: Duration of the run in seconds
+        upstream_calls: Upstream calls made during the run, per endpoint
+        statements: SQL statements executed during the run, if known
+
+    Returns:
+        The report, including the list of threshold violations.
+    """
+    endpoints, violations = {}, []
+    completed = errors = 0
+    for name, runs in samples.items():
+        if not runs:
+            continue
+        latencies = sorted(latency * 1000 for latency, _ in runs)
+        failed = sum(1 for _, status in runs if status == 0 or status >= 500)
+        rejected = sum(1 for _, status in runs if 400 <= status < 500)
+        completed += len(runs)
+        errors += failed
+        endpoints[name] = {
+            "count": len(runs),
+            "errors": failed,
+            "rejected": rejected,
+            "p50_ms": round(percentile(latencies, 50), 1),
+            "p95_ms": round(percentile(latencies, 95), 1),
+            "p99_ms": round(percentile(latencies, 99), 1),
+            "max_ms": round(latencies[-1], 1),
+        }
+        if endpoints[name]["p95_ms"] > args.max_p95_ms:
+            violations.append(f"{name}: p95 {endpoints[name]['p95_ms']} ms > {args.max_p95_ms} ms")
+        if endpoints[name]["p99_ms"] > args.max_p99_ms:
+            violations.append(f"{name}: p99 {endpoints[name]['p99_ms']} ms > {args.max_p99_ms} ms")
+    error_rate = errors / completed if completed else 0.0
+    throughput = completed / elapsed if elapsed else 0.0
+    if error_rate > args.max_error_rate:
+        violations.append(f"error rate {error_rate:.3f} > {args.max_error_rate}")
+    if throughput < args.min_throughput * args.rps:
+        violations.append(f"throughput {throughput:.1f} rps < {args.min_throughput:.0%} of {args.rps} rps")
+    return {
+        "mode": args.mode,
+        "target_rps": args.rps,
+        "elapsed_s": round(elapsed, 2),
+        "requests": completed,
+        "dropped": dropped,
+        "throughput_rps": round(throughput, 1),
+        "error_rate": round(error_rate, 4),
+        "endpoints": endpoints,
+        "upstream_calls": upstream_calls,
+        "db_statements": statements,
+        "db_statements_per_request": round(statements / completed, 2) if statements is not None and completed else None,
+        "violations": violations,
+    }
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    """
+    Start the app, seed it, drive the traffic mix and build the report.
+
+    Args:
+        args: The command line arguments
+
+    Returns:
+        The report.
+    """
+    weights = parse_mix(args.mix)
+    traffic = Traffic(args.cities, args.new_city_share)
+    if args.mode == "inprocess":
+        started = inprocess_app(FakeUpstream(args.latency_ms / 1000, args.error_rate))
+    else:
+        started = uvicorn_app(args)
+    async with started as (client, upstream):
+        # Seed without injected errors, which the app would cache for WEATHER_NEGATIVE_CACHE_TTL
+        await upstream.post("/_config", params={"error_rate": 0})
+        await seed(client, traffic)
+        await upstream.post("/_config", params={"error_rate": args.error_rate})
+        upstream_before, statements_before = (await upstream.get("/_stats")).json(), await db_statements(client)
+        samples, dropped, elapsed = await drive(client, traffic, weights, args.rps, args.duration, args.max_inflight)
+        upstream_after, statements_after = (await upstream.get("/_stats")).json(), await db_statements(client)
+    upstream_calls = {key: upstream_after[key] - upstream_before.get(key, 0) for key in upstream_after}
+    # With several uvicorn workers the counter of one worker only is known
+    statements = None
+    if args.mode == "inprocess" or args.workers == 1:
+        # /ops/stats runs no SQL, so the difference is the traffic's alone
+        statements = statements_after - statements_before
+    return report(args, samples, dropped, elapsed, upstream_calls, statements)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=("inprocess", "uvicorn"), default="inprocess")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers (uvicorn mode)")
+    parser.add_argument("--rps", type=float, default=50.0, help="Target requests per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds of traffic")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Comma-separated operation=weight pairs")
+    parser.add_argument("--cities", type=int, default=50, help="Cities stored before the run")
+    parser.add_argument("--new-city-share", type=float, default=0.1,
+                        help="Share of create requests for new cities, each fetching from upstream")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Upstream stand-in latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of upstream calls failing")
+    parser.add_argument("--max-inflight", type=int, default=256, help="Requests in flight before dropping new ones")
+    parser.add_argument("--max-p95-ms", type=float, default=500.0, help="p95 latency threshold per operation")
+    parser.add_argument("--max-p99-ms", type=float, default=1000.0, help="p99 latency threshold per operation")
+    parser.add_argument("--max-error-rate", type=float, default=0.01, help="Share of 5xx/failed requests allowed")
+    parser.add_argument("--min-throughput", type=float, default=0.9, help="Minimum share of the target rate served")
+    parser.add_argument("--output", default=None, help="Write the report as JSON to this file")
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    # Settings of the app under test, applied before it reads them
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{tmp.name}/loadtest.db",
+        "OPENWEATHER_API_KEY": "loadtest",
+        "YOUTUBE_API_KEY": "loadtest",
+        "PREFETCH_ENABLED": "false",
+        "OPENWEATHER_CALLS_PER_MINUTE": "1e12",
+        "OPENWEATHER_BURST": "1e12",
+        "YOUTUBE_UNITS_PER_MINUTE": "1e12",
+        "YOUTUBE_BURST_UNITS": "1e12",
+        "YOUTUBE_DAILY_UNITS": "1e12",
+    })
+    try:
+        result = asyncio.run(run(args))
+    finally:
+        tmp.cleanup()
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+    return 1 if result["violations"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
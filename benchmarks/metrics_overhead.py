@@ -0,0 +1,167 @@
+"""
+Measure the overhead of the request, SQL and upstream metrics on typical read
+requests, served in-process by calling the ASGI app directly. Blocks of
+requests alternate between metrics turned on and off, and the exit status is
+1 when the median request time with metrics exceeds the one without by more
+than --max-overhead.
+
+Usage:
+    python benchmarks/metrics_overhead.py [--rows 10000] [--rounds 20] [--block 50]
+                                          [--max-overhead 0.02] [--output overhead.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from typing import Any, Dict, List, Tuple
+
+import harness  # noqa: F401  (puts the repository root on sys.path)
+
+from harness import summarize
+
+
+
+
+async def call(app: Any, path: str, query: str = "") -> int:
+    """
+    Send a GET request straight to an ASGI app.
+
+    Args:
+        app: The ASGI app
+        path: The URL path
+        query: The query string
+
+    Returns:
+        The response status code.
+    """
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": path, "raw_path": path.encode(), "query_string": query.encode(), "root_path": "",
+        "headers": [(b"host", b"bench")], "client": ("127.0.0.1", 1), "server": ("bench", 80),
+    }
+    status = []
+
+    async def receive() -> Dict[str, Any]:
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message: Dict[str, Any]) -> None:
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+
+    await app(scope, receive, send)
+    return status[0]
+
+
+async def measure(rows: int, rounds: int, block: int) -> Dict[str, Dict[str, Dict[str, float]]]:
+    """
+    Time read requests with metrics on and off, on a seeded database.
+
+    Args:
+        rows: Number of seeded weather infos
+        rounds: Number of on/off block pairs
+        block: Requests per route and block
+
+    Returns:
+        Timing summaries per route, for 'on' and 'off'.
+    """
+    import crud_bench
+    from app import metrics
+    from app.database import DATABASE_URL
+    from app.main import app
+
+    engine = crud_bench.open_database(DATABASE_URL[len("sqlite:///"):])
+    crud_bench.seed(engine, rows)
+    engine.dispose()
+    # Locations with every day of the year stored
+    locations = max(1, rows // crud_bench.DAYS_PER_LOCATION)
+    rng = random.Random(0)
+
+    def range_query() -> str:
+        start = crud_bench.FIRST_DATE + timedelta(days=rng.randrange(crud_bench.DAYS_PER_LOCATION - 30))
+        return f"start_date={start}&end_date={start + timedelta(days=29)}"
+
+    routes: Dict[str, Any] = {
+        "get_info": lambda: (f"/weather_infos/{rng.randint(1, rows)}", ""),
+        "by_loc_date_range": lambda: (f"/weather_infos/by_loc_date_range/{rng.randint(1, locations)}", range_query()),
+        "list_infos": lambda: ("/weather_infos/", "cursor=&limit=100"),
+        "list_locations": lambda: ("/locations/", "limit=20"),
+        "stats": lambda: ("/stats", f"period=month&location_ids={rng.randint(1, locations)}"),
+    }
+    samples: Dict[str, Dict[str, List[float]]] = {mode: {name: [] for name in routes} for mode in ("on", "off")}
+    initial = metrics.enabled()
+    async with app.router.lifespan_context(app):
+        try:
+            for i in range(rounds + 1):
+                # Alternate which mode runs first, and discard the first round as warmup
+                for mode in (("on", "off") if i % 2 else ("off", "on")):
+                    metrics.set_enabled(mode == "on")
+                    for name, request in routes.items():
+                        for _ in range(block):
+                            path, query = request()
+                            started = time.perf_counter()
+                            status = await call(app, path, query)
+                            elapsed = time.perf_counter() - started
+                            if status != 200:
+                                raise SystemExit(f"{path}?{query} answered {status}")
+                            if i:
+                                samples[mode][name].append(elapsed)
+        finally:
+            metrics.set_enabled(initial)
+    return {mode: {name: summarize(times) for name, times in by_route.items()} for mode, by_route in samples.items()}
+
+
+def overhead(results: Dict[str, Dict[str, Dict[str, float]]]) -> Tuple[Dict[str, float], float]:
+    """
+    Compute the relative overhead of the metrics from the median request times.
+
+    Args:
+        results: Timing summaries per route, for 'on' and 'off'
+
+    Returns:
+        The overhead per route, and over all routes (total of the medians).
+    """
+    per_route = {
+        name: results["on"][name]["median_us"] / results["off"][name]["median_us"] - 1
+        for name in results["off"]
+    }
+    on = sum(summary["median_us"] for summary in results["on"].values())
+    off = sum(summary["median_us"] for summary in results["off"].values())
+    return per_route, on / off - 1
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000, help="Seeded weather infos")
+    parser.add_argument("--rounds", type=int, default=20, help="On/off block pairs")
+    parser.add_argument("--block", type=int, default=50, help="Requests per route and block")
+    parser.add_argument("--max-overhead", type=float, default=0.02, help="Allowed overhead, e.g. 0.02 for 2%%")
+    parser.add_argument("--output", default=None, help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_URL"] = f"sqlite:///{tmp}/metrics.db"
+        os.environ["PREFETCH_ENABLED"] = "false"
+        results = asyncio.run(measure(args.rows, args.rounds, args.block))
+    per_route, total = overhead(results)
+
+    print(f"{'route':<20} {'off median us':>14} {'on median us':>14} {'overhead':>9}")
+    for name, ratio in per_route.items():
+        print(f"{name:<20} {results['off'][name]['median_us']:>14.1f} "
+              f"{results['on'][name]['median_us']:>14.1f} {ratio:>+9.1%}")
+    print(f"{'total':<20} {'':>14} {'':>14} {total:>+9.1%}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"results": results, "overhead": per_route, "total_overhead": total}, f, indent=2)
+    if total > args.max_overhead:
+        print(f"\nMetrics overhead {total:.1%} exceeds {args.max_overhead:.0%}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
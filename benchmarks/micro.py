@@ -0,0 +1,81 @@
+"""
+Run the micro-benchmarks of the crud functions, the upstream call paths and
+the serialization of list results, fully offline, and write the results as a JSON baseline. With --baseline, the
+results are compared against a previous run and the exit status is 1 when a
+benchmark got slower than the tolerance allows.
+
+Usage:
+    python benchmarks/micro.py [--suite crud,upstream,serialization] [--rows 10000,1000000,10000000]
+                               [--repeat 200] [--latency-ms 20] [--serialize-rows 10000] [--db-dir DIR]
+                               [--output results.json] [--baseline previous.json] [--tolerance 0.25]
+
+Seeding 10M rows takes a few minutes and about 1 GB of disk; pass --db-dir to
+keep the seeded databases between runs.
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+# Offline settings, applied before the app modules read them
+os.environ.setdefault("OPENWEATHER_API_KEY", "benchmark")
+os.environ.setdefault("YOUTUBE_API_KEY", "benchmark")
+for name in ("OPENWEATHER_CALLS_PER_MINUTE", "OPENWEATHER_BURST", "YOUTUBE_UNITS_PER_MINUTE",
+             "YOUTUBE_BURST_UNITS", "YOUTUBE_DAILY_UNITS"):
+    os.environ[name] = "1e12"
+os.environ.pop("OPENWEATHER_DAILY_BUDGET", None)
+
+import harness  # noqa: E402
+
+
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--suite", default="crud,upstream,serialization", help="Comma-separated suites to run")
+    parser.add_argument("--rows", default="10000", help="Comma-separated weather info counts of the crud suite")
+    parser.add_argument("--repeat", type=int, default=200, help="Timed calls per crud function")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="Upstream stand-in latency")
+    parser.add_argument("--upstream-repeat", type=int, default=50, help="Timed calls per upstream path")
+    parser.add_argument("--serialize-rows", type=int, default=10000, help="Rows per list of the serialization suite")
+    parser.add_argument("--db-dir", default=None, help="Directory keeping the seeded databases between runs")
+    parser.add_argument("--output", default="benchmark-results.json", help="Results file")
+    parser.add_argument("--baseline", default=None, help="Previous results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed median slowdown, e.g. 0.25 for 25%%")
+    args = parser.parse_args()
+    suites = {suite.strip() for suite in args.suite.split(",") if suite.strip()}
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.setdefault("DATABASE_URL", f"sqlite:///{tmp}/app.db")
+        if "crud" in suites:
+            import crud_bench
+            db_dir = args.db_dir or tmp
+            os.makedirs(db_dir, exist_ok=True)
+            for rows in (int(r) for r in args.rows.split(",") if r.strip()):
+                print(f"crud suite, {rows} rows...", file=sys.stderr)
+                results.update(crud_bench.run(db_dir, rows, repeat=args.repeat))
+        if "upstream" in suites:
+            import upstream_bench
+            print(f"upstream suite, {args.latency_ms:g} ms latency...", file=sys.stderr)
+            results.update(upstream_bench.run(args.latency_ms, repeat=args.upstream_repeat))
+        if "serialization" in suites:
+            import serialization_bench
+            db_dir = args.db_dir or tmp
+            os.makedirs(db_dir, exist_ok=True)
+            print(f"serialization suite, {args.serialize_rows} rows...", file=sys.stderr)
+            results.update(serialization_bench.run(db_dir, args.serialize_rows))
+
+    harness.write_results(args.output, results)
+    comparison = harness.compare(results, args.baseline, args.tolerance) if args.baseline else None
+    harness.print_table(results, comparison)
+    regressed = [row["name"] for row in comparison or [] if row["regressed"]]
+    if regressed:
+        print(f"\n{len(regressed)} benchmark(s) slower than the baseline by more than "
+              f"{args.tolerance:.0%}: {', '.join(regressed)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
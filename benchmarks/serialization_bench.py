@@ -0,0 +1,60 @@
+"""
+Benchmarks of the JSON serialization of list endpoint results: ORM objects
+through FastAPI's generic encoder (the former path), ORM objects through the
+response models, and plain rows dumped by pydantic-core (the list endpoints'
+path). Each call queries the rows in a new session, then serializes them.
+"""
+import json
+import os
+from typing import Dict, List
+
+import harness  # noqa: F401  (puts the repository root on sys.path)
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from sqlalchemy.orm import sessionmaker
+
+from app import crud, schemas
+from crud_bench import open_database, seed
+from harness import bench
+
+_info_models = TypeAdapter(List[schemas.WeatherInfoOut])
+
+
+
+
+def run(db_dir: str, rows: int = 10000, repeat: int = 20) -> Dict[str, Dict[str, float]]:
+    """
+    Time the serialization paths of a list of `rows` weather infos.
+
+    Args:
+        db_dir: Directory of the seeded database file, reused across runs of the same size
+        rows: Number of weather infos listed
+        repeat: Number of timed calls per path
+
+    Returns:
+        Summaries keyed by 'serialize.<path>@<rows>'.
+    """
+    engine = open_database(os.path.join(db_dir, f"serialize_{rows}.db"))
+    seed(engine, rows)
+    session = sessionmaker(bind=engine, autoflush=False)
+
+    def orm_jsonable() -> bytes:
+        with session() as db:
+            content = jsonable_encoder(crud.list_infos(db, limit=rows))
+        return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+
+    def orm_response_model() -> bytes:
+        with session() as db:
+            return _info_models.dump_json(_info_models.validate_python(crud.list_infos(db, limit=rows)))
+
+    def rows_dump_json() -> bytes:
+        with session() as db:
+            return schemas.json_response(schemas.records(crud.list_infos(db, limit=rows, as_rows=True))).body
+
+    assert json.loads(orm_jsonable()) == json.loads(rows_dump_json())
+    results = {
+        f"serialize.{fn.__name__}@{rows}": bench(fn, [()] * (repeat + 3))
+        for fn in (orm_jsonable, orm_response_model, rows_dump_json)
+    }
+    engine.dispose()
+    return results
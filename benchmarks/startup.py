@@ -0,0 +1,97 @@
+"""
+Measure the cold start of the app: the time to import `app.main` and the time
+to run its startup (lifespan) in a fresh interpreter, as every new worker or
+container does. The median of several runs is compared against a budget.
+Importing must not read the settings: the child also reports whether `.env`
+was loaded during the import.
+
+Usage:
+    python benchmarks/startup.py [--runs 5] [--budget-ms 1500] [--database-url URL]
+
+Exits with status 1 when the median cold start exceeds the budget or when
+importing the app loads `.env`.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Run in a child interpreter so that nothing is imported or cached yet
+CHILD = """
+import asyncio, json, time
+started = time.perf_counter()
+from app.main import app
+imported = time.perf_counter()
+from app import config
+env_on_import = config.load.cache_info().misses > 0
+
+async def run_lifespan():
+    async with app.router.lifespan_context(app):
+        return time.perf_counter()
+
+ready = asyncio.run(run_lifespan())
+print(json.dumps({
+    "import_ms": (imported - started) * 1000, "startup_ms": (ready - imported) * 1000,
+    "env_on_import": env_on_import,
+}))
+"""
+
+
+
+
+def measure(database_url: str) -> dict:
+    """
+    Cold start the app once in a new interpreter.
+
+    Args:
+        database_url: Database URL used by the child process
+
+    Returns:
+        A dictionary with the import and startup times in milliseconds, and
+        whether importing loaded `.env`.
+    """
+    env = dict(os.environ, DATABASE_URL=database_url, PREFETCH_ENABLED="false")
+    out = subprocess.run(
+        [sys.executable, "-c", CHILD], cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    timings = json.loads(out.strip().splitlines()[-1])
+    timings["total_ms"] = timings["import_ms"] + timings["startup_ms"]
+    return timings
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Number of cold starts to measure")
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("STARTUP_BUDGET_MS", "1500")),
+                        help="Maximum median import + startup time, in milliseconds")
+    parser.add_argument("--database-url", default=None,
+                        help="Database to start against. Defaults to a new SQLite file, reused across runs")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = args.database_url or f"sqlite:///{tmp}/startup.db"
+        # The first run creates the schema; measure the following warm-schema runs
+        first = measure(database_url)
+        runs = [measure(database_url) for _ in range(args.runs)]
+
+    report = {
+        key: round(statistics.median(run[key] for run in runs), 1)
+        for key in ("import_ms", "startup_ms", "total_ms")
+    }
+    report["first_run_ms"] = round(first["total_ms"], 1)
+    report["budget_ms"] = args.budget_ms
+    report["within_budget"] = report["total_ms"] <= args.budget_ms
+    report["env_on_import"] = any(run["env_on_import"] for run in [first, *runs])
+    print(json.dumps(report, indent=2))
+    if report["env_on_import"]:
+        print("Importing app.main loaded .env; settings must be read on first use", file=sys.stderr)
+    return 0 if report["within_budget"] and not report["env_on_import"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
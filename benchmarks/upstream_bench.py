@@ -0,0 +1,88 @@
+"""
+Benchmarks of the `weather_api` and `youtube_api` call paths against an
+offline `httpx.MockTransport` stand-in answering after a configurable latency.
+"""
+import asyncio
+import time
+from typing import Dict
+
+import harness  # noqa: F401  (puts the repository root on sys.path)
+
+from fake_upstream import FakeUpstream
+from harness import bench, bench_async, summarize
+
+
+def run(latency_ms: float = 20.0, repeat: int = 50, concurrency: int = 50) -> Dict[str, Dict[str, float]]:
+    """
+    Time the upstream call paths: cache misses (one stand-in call each), cache
+    hits, and bursts of concurrent identical misses sharing one call.
+
+    Args:
+        latency_ms: Stand-in latency in milliseconds
+        repeat: Number of timed calls per path
+        concurrency: Number of concurrent callers per burst
+
+    Returns:
+        Summaries keyed by 'upstream.<path>@<latency>ms'.
+    """
+    from app import http_client, weather_api, youtube_api
+
+    upstream = FakeUpstream(latency_ms / 1000)
+    http_client.open_client(upstream.transport())
+    suffix = f"@{latency_ms:g}ms"
+    results: Dict[str, Dict[str, float]] = {}
+    cities = [f"City{i}" for i in range(repeat + 3)]
+
+    def uncached(fn):
+        def call(*args):
+            weather_api._cache.clear()
+            return fn(*args)
+        return call
+
+    def async_uncached(fn):
+        async def call(*args):
+            weather_api._cache.clear()
+            return await fn(*args)
+        return call
+
+    results["upstream.get_weather_by_city.miss" + suffix] = bench(
+        uncached(weather_api.get_weather_by_city), [(city,) for city in cities]
+    )
+    results["upstream.get_weather_by_city.hit" + suffix] = bench(
+        weather_api.get_weather_by_city, [(cities[0],)] * (repeat + 3)
+    )
+    results["upstream.get_forecast_by_city.miss" + suffix] = bench(
+        uncached(weather_api.get_forecast_by_city), [(city,) for city in cities]
+    )
+    results["upstream.search_youtube_videos" + suffix] = bench(
+        youtube_api.search_youtube_videos, [(f"weather in {city}", 3) for city in cities]
+    )
+
+    async def run_async() -> None:
+        await http_client.open_async_client(upstream.async_transport())
+        try:
+            results["upstream.get_weather_by_city_async.miss" + suffix] = await bench_async(
+                async_uncached(weather_api.get_weather_by_city_async), [(city,) for city in cities]
+            )
+            results["upstream.get_weather_by_city_async.hit" + suffix] = await bench_async(
+                weather_api.get_weather_by_city_async, [(cities[0],)] * (repeat + 3)
+            )
+            results["upstream.get_forecast_window_async.miss" + suffix] = await bench_async(
+                async_uncached(weather_api.get_forecast_window_async), [(city,) for city in cities]
+            )
+            results["upstream.search_youtube_videos_async" + suffix] = await bench_async(
+                youtube_api.search_youtube_videos_async, [(f"weather in {city}", 3) for city in cities]
+            )
+            samples = []
+            for city in cities:
+                weather_api._cache.clear()
+                started = time.perf_counter()
+                await asyncio.gather(*(weather_api.get_weather_by_city_async(city) for _ in range(concurrency)))
+                samples.append(time.perf_counter() - started)
+            results[f"upstream.get_weather_by_city_async.burst{concurrency}" + suffix] = summarize(samples[3:])
+        finally:
+            await http_client.close_async_client()
+
+    asyncio.run(run_async())
+    http_client.close_client()
+    return results
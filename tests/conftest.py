@@ -0,0 +1,139 @@
+"""
+Shared fixtures. The tests run against a new SQLite database, and the
+OpenWeather and YouTube APIs are answered in process by `FakeUpstream`
+through httpx.MockTransport, so no network access or API key is needed.
+
+Usage:
+    python -m pytest tests
+"""
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta, timezone
+from typing import List, Set
+
+import httpx
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# Settings are read on first use, so they can still be set here
+_tmp = tempfile.mkdtemp(prefix="weather-tests-")
+os.environ.update(
+    DATABASE_URL=f"sqlite:///{_tmp}/test.db",
+    PREFETCH_ENABLED="false",
+    OPENWEATHER_API_KEY="test",
+    YOUTUBE_API_KEY="test",
+    OPENWEATHER_CALLS_PER_MINUTE="100000",
+    OPENWEATHER_BURST="1000",
+)
+
+from app import http_client, migrations, weather_api  # noqa: E402
+from app.database import Base, SessionLocal, get_engine  # noqa: E402
+from app.info_cache import info_cache  # noqa: E402
+
+
+
+
+class FakeUpstream:
+    """
+    Answers the OpenWeather and YouTube calls of the app.
+
+    Attributes:
+        calls: URLs of the calls received, in order
+        missing: Lower-cased city names answered with 404
+        temperature: Current temperature answered, the forecast starting from it
+    """
+    def __init__(self):
+        self.calls: List[str] = []
+        self.missing: Set[str] = set()
+        self.temperature = 20.0
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        """
+        Answer a call.
+
+        Args:
+            request: The upstream request
+
+        Returns:
+            The fake response.
+        """
+        self.calls.append(str(request.url))
+        params = dict(request.url.params)
+        if request.url.host.endswith("googleapis.com"):
+            items = [
+                {"id": {"videoId": f"v{i}"}, "snippet": {"title": f"Video {i}", "description": ""}}
+                for i in range(int(params.get("maxResults", 3)))
+            ]
+            return httpx.Response(200, json={"items": items})
+        if params.get("q", "").split(",")[0].lower() in self.missing:
+            return httpx.Response(404, json={"cod": "404", "message": "city not found"})
+        if request.url.path.endswith("/weather"):
+            return httpx.Response(200, json={
+                "coord": {"lat": 43.7, "lon": -79.4},
+                "main": {"temp": self.temperature, "humidity": 50, "pressure": 1000},
+                "weather": [{"description": "clear sky"}],
+                "wind": {"speed": 3.0},
+            })
+        start = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+        start -= timedelta(hours=start.hour % 3)
+        slots = []
+        for i in range(40):
+            moment = start + timedelta(hours=3 * i)
+            slots.append({
+                "dt": int(moment.timestamp()),
+                "dt_txt": moment.strftime("%Y-%m-%d %H:%M:%S"),
+                "main": {"temp": self.temperature + i / 4, "humidity": 40 + i, "pressure": 1000 + i},
+                "weather": [{"description": "light rain"}],
+                "wind": {"speed": 1.0 + i / 10},
+            })
+        return httpx.Response(200, json={"list": slots, "city": {"coord": {"lat": 43.7, "lon": -79.4}}})
+
+
+@pytest.fixture(scope="session", autouse=True)
+def schema():
+    """
+    Create the schema of the test database once.
+    """
+    engine = get_engine()
+    Base.metadata.create_all(bind=engine)
+    migrations.upgrade(engine)
+
+
+@pytest.fixture
+def upstream():
+    """
+    Route the shared HTTP clients to a new fake upstream, with empty caches.
+    """
+    fake = FakeUpstream()
+    http_client.open_client(transport=httpx.MockTransport(fake.handler))
+    http_client._async_client = httpx.AsyncClient(transport=httpx.MockTransport(fake.handler))
+    weather_api._cache.clear()
+    info_cache.clear()
+    yield fake
+    http_client.close_client()
+    http_client._async_client = None
+
+
+@pytest.fixture
+def client(upstream):
+    """
+    A test client of the app, run through its lifespan.
+    """
+    from fastapi.testclient import TestClient
+    from app.main import app
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def db():
+    """
+    A database session, closed after the test.
+    """
+    session = SessionLocal()
+    yield session
+    session.close()
@@ -0,0 +1,66 @@
+from datetime import date, timedelta
+
+
+def _range(offset: int = 1) -> dict:
+    today = date.today()
+    return {"start_date": today.isoformat(), "end_date": (today + timedelta(days=offset)).isoformat()}
+
+
+def test_locations_etag_round_trip(client):
+    response = client.get("/locations/")
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+
+    response = client.get("/locations/", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+
+    assert client.post("/locations/", json={"city": "Etag City", "country": "XX", "lat": 1.0, "lon": 2.0}).status_code == 200
+    response = client.get("/locations/", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert "Etag City" in [location["city"] for location in response.json()]
+
+
+def test_infos_etag_round_trip(client):
+    infos = client.post("/weather_infos/", json={"city": "Etag Infos", "country": "XX", **_range()}).json()
+    assert len(infos) == 2
+    location_id = infos[0]["location_id"]
+    url = f"/weather_infos/by_loc_date_range/{location_id}"
+
+    response = client.get(url, params=_range())
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+    assert client.get(url, params=_range(), headers={"If-None-Match": etag}).status_code == 304
+
+    assert client.put(f"/weather_infos/{infos[0]['id']}", json={"temperature": -5.0}).status_code == 200
+    response = client.get(url, params=_range(), headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()[0]["temperature"] == -5.0
+    assert client.get(url, params=_range(), headers={"If-None-Match": response.headers["ETag"]}).status_code == 304
+
+
+def test_create_info_stores_the_forecast_with_the_infos(client, upstream):
+    infos = client.post("/weather_infos/", json={"city": "Forecast Infos", "country": "XX", **_range()}).json()
+    location_id = infos[0]["location_id"]
+    assert client.get(f"/forecasts/{location_id}").status_code == 200
+
+    # The stored dates are served without calling upstream again
+    calls = len(upstream.calls)
+    assert client.post("/weather_infos/", json={"city": "Forecast Infos", "country": "XX", **_range()}).json() == infos
+    assert len(upstream.calls) == calls
+
+
+def test_batch_stores_the_forecast_with_the_infos(client, upstream):
+    upstream.missing.add("batch missing")
+    results = client.post("/weather_infos/batch", json=[
+        {"city": "Batch One", "country": "XX", **_range()},
+        {"city": "Batch Missing", "country": "XX", **_range()},
+        {"city": "Batch Two", "country": "XX", **_range(0)},
+    ]).json()
+    assert [result["status"] for result in results] == ["ok", "error", "ok"]
+    assert results[1]["status_code"] == 404
+    assert [len(results[0]["infos"]), len(results[2]["infos"])] == [2, 1]
+    assert client.get(f"/forecasts/{results[0]['location_id']}").status_code == 200
+    # Today is answered with the current weather, so no forecast is fetched
+    assert client.get(f"/forecasts/{results[2]['location_id']}").status_code == 404
@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+from starlette.requests import Request
+
+from app import conditional
+
+
+def _request(**headers) -> Request:
+    raw = [(name.replace("_", "-").lower().encode(), value.encode()) for name, value in headers.items()]
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": raw})
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def test_last_modified_is_left_out_during_the_second_of_the_change():
+    headers = conditional.validators("locations", (7, _utcnow()))
+    assert headers["ETag"] == '"locations-7"'
+    assert "Last-Modified" not in headers
+
+
+def test_last_modified_of_an_older_change():
+    changed_at = _utcnow() - timedelta(seconds=5)
+    headers = conditional.validators("locations", (7, changed_at))
+    assert headers["Last-Modified"] == format_datetime(changed_at.replace(tzinfo=timezone.utc), usegmt=True)
+    assert conditional.is_not_modified(_request(If_Modified_Since=headers["Last-Modified"]), headers)
+
+
+def test_change_in_the_same_second_is_not_hidden_by_if_modified_since():
+    # A client got Last-Modified for a change older than a second, then two
+    # changes were made within one second
+    first = _utcnow() - timedelta(seconds=3)
+    since = conditional.validators("locations", (1, first))["Last-Modified"]
+    headers = conditional.validators("locations", (3, _utcnow()))
+    assert not conditional.is_not_modified(_request(If_Modified_Since=since), headers)
+
+
+def test_if_none_match_takes_precedence():
+    headers = conditional.validators("location-3", (5, _utcnow() - timedelta(seconds=5)))
+    stale = _request(If_None_Match='"location-3-4"', If_Modified_Since=headers["Last-Modified"])
+    assert not conditional.is_not_modified(stale, headers)
+    assert conditional.is_not_modified(_request(If_None_Match='W/"location-3-5"'), headers)
+    assert conditional.is_not_modified(_request(If_None_Match="*"), headers)
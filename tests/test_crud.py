@@ -0,0 +1,128 @@
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+from app import crud, forecast_series
+from app.database import SessionLocal
+from app.database_model import ChangeLog
+from app.info_cache import info_cache
+
+DAY = date(2030, 1, 1)
+
+
+def _location(db, city: str) -> int:
+    return crud.create_location(db, city=city, country="XX", lat=1.0, lon=2.0).id
+
+
+def _temperatures(db, location_id: int, days: int = 7):
+    rows = crud.get_infos_by_loc_date_range(db, location_id, DAY, DAY + timedelta(days=days - 1), as_rows=True)
+    return {row.date: row.temperature for row in rows}
+
+
+def _logged(db, location_id: int):
+    return db.scalars(select(ChangeLog.row_id).where(
+        ChangeLog.table_name == "weather_info", ChangeLog.location_id == location_id)).all()
+
+
+def _forecast(temperature: float) -> dict:
+    return {"list": [
+        {"dt": 1893456000 + i * 10800, "main": {"temp": temperature, "humidity": 50, "pressure": 1000}, "wind": {"speed": 2.0}}
+        for i in range(8)
+    ]}
+
+
+def test_upsert_inserts_missing_dates_and_skips_stored_ones(db):
+    location_id = _location(db, "Upsert Insert")
+    rows = [{"date": DAY, "temperature": 1.0, "weather_description": "a"}, {"date": DAY + timedelta(1), "temperature": 2.0}]
+    assert crud.upsert_infos(db, location_id, rows) == 2
+
+    rows = [{"date": DAY, "temperature": 9.0}, {"date": DAY + timedelta(2), "temperature": 3.0}]
+    assert crud.upsert_infos(db, location_id, rows) == 1
+    assert _temperatures(db, location_id) == {DAY: 1.0, DAY + timedelta(1): 2.0, DAY + timedelta(2): 3.0}
+    # Only the written rows are logged
+    assert len(_logged(db, location_id)) == 3
+
+
+def test_upsert_updates_stored_dates(db):
+    location_id = _location(db, "Upsert Update")
+    crud.upsert_infos(db, location_id, [{"date": DAY, "temperature": 1.0}])
+    rows = [{"date": DAY, "temperature": 5.0}, {"date": DAY + timedelta(1), "temperature": 6.0}]
+    assert crud.upsert_infos(db, location_id, rows, update_existing=True) == 2
+    assert _temperatures(db, location_id) == {DAY: 5.0, DAY + timedelta(1): 6.0}
+    assert len(_logged(db, location_id)) == 3
+
+
+def test_upsert_writes_a_repeated_date_once_with_its_last_row(db):
+    location_id = _location(db, "Upsert Repeated")
+    rows = [{"date": DAY, "temperature": 1.0}, {"date": DAY, "temperature": 2.0}]
+    assert crud.upsert_infos(db, location_id, rows) == 1
+    assert _temperatures(db, location_id) == {DAY: 2.0}
+    assert crud.upsert_infos(db, location_id, []) == 0
+
+
+def test_bulk_upsert_spans_locations(db):
+    first, second = _location(db, "Bulk One"), _location(db, "Bulk Two")
+    written = crud.bulk_upsert_infos(db, {
+        first: [{"date": DAY, "temperature": 1.0}],
+        second: [{"date": DAY, "temperature": 2.0}, {"date": DAY + timedelta(1), "temperature": 3.0}],
+    })
+    assert written == 3
+    assert _temperatures(db, first) == {DAY: 1.0}
+    assert _temperatures(db, second) == {DAY: 2.0, DAY + timedelta(1): 3.0}
+
+
+def test_info_cache_is_invalidated_after_writes(db):
+    location_id = _location(db, "Cache Invalidation")
+    info_cache.clear()
+    crud.upsert_infos(db, location_id, [{"date": DAY, "temperature": 1.0}])
+    assert _temperatures(db, location_id, days=2) == {DAY: 1.0}
+    hits = info_cache.stats()["hits"]
+    assert _temperatures(db, location_id, days=2) == {DAY: 1.0}
+    assert info_cache.stats()["hits"] == hits + 1
+
+    crud.upsert_infos(db, location_id, [{"date": DAY, "temperature": 2.0}], update_existing=True)
+    assert _temperatures(db, location_id, days=2) == {DAY: 2.0}
+
+    crud.upsert_infos(db, location_id, [{"date": DAY + timedelta(1), "temperature": 3.0}])
+    assert _temperatures(db, location_id, days=2) == {DAY: 2.0, DAY + timedelta(1): 3.0}
+
+    info = crud.get_info_by_loc_date(db, location_id, DAY)
+    crud.update_info(db, info.id, {"temperature": 4.0})
+    assert _temperatures(db, location_id, days=2) == {DAY: 4.0, DAY + timedelta(1): 3.0}
+
+    crud.delete_info(db, info.id)
+    assert _temperatures(db, location_id, days=2) == {DAY + timedelta(1): 3.0}
+
+
+def test_info_cache_ignores_entries_older_than_the_version(db):
+    location_id = _location(db, "Cache Version")
+    info_cache.clear()
+    crud.upsert_infos(db, location_id, [{"date": DAY, "temperature": 1.0}])
+    version = crud.get_version(db, location_id=location_id)[0]
+    assert _temperatures(db, location_id, days=1) == {DAY: 1.0}
+    misses = info_cache.stats()["misses"]
+    rows = crud.get_infos_by_loc_date_range(db, location_id, DAY, DAY, as_rows=True, min_version=version + 1)
+    assert [row.temperature for row in rows] == [1.0]
+    assert info_cache.stats()["misses"] == misses + 1
+
+
+def test_forecast_series_commits_with_the_infos(db):
+    location_id = _location(db, "Forecast Transaction")
+    forecast_series.store(db, {location_id: _forecast(5.0)}, commit=False)
+    crud.upsert_infos(db, location_id, [{"date": DAY, "temperature": 5.0}])
+    with SessionLocal() as other:
+        assert forecast_series.get_series(other, location_id).values["temperature"][0] == 5.0
+        assert _temperatures(other, location_id, days=1) == {DAY: 5.0}
+
+
+def test_forecast_series_rolls_back_with_the_infos(db):
+    location_id = _location(db, "Forecast Rollback")
+    forecast_series.store(db, {location_id: _forecast(5.0)}, commit=False)
+    with pytest.raises(IntegrityError):
+        crud.upsert_infos(db, location_id, [{"date": DAY, "temperature": None}])
+    db.rollback()
+    with SessionLocal() as other:
+        assert forecast_series.get_series(other, location_id) is None
+        assert _temperatures(other, location_id, days=1) == {}
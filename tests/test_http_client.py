@@ -0,0 +1,24 @@
+import asyncio
+
+from app import http_client
+
+
+def test_http2_is_enabled_by_default():
+    assert http_client.settings.HTTP2_ENABLED
+    assert http_client._http2()
+
+
+def test_pooled_clients_negotiate_http2():
+    async def build():
+        http_client._async_client = None
+        client = http_client.get_async_client()
+        await http_client.close_async_client()
+        return client
+
+    client = asyncio.run(build())
+    assert client._transport._pool._http2
+
+
+def test_http2_can_be_disabled(monkeypatch):
+    monkeypatch.setattr(http_client.settings, "HTTP2_ENABLED", False)
+    assert not http_client._http2()
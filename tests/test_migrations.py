@@ -0,0 +1,47 @@
+from datetime import date
+
+from sqlalchemy import create_engine, inspect, select, text
+
+from app import migrations
+from app.database_model import Base, ChangeLog, WeatherInfo, WeatherLocation
+
+
+def _old_database(tmp_path):
+    """
+    Create a database without the unique (location_id, date) index.
+    """
+    engine = create_engine(f"sqlite:///{tmp_path}/old.db")
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(text("DROP INDEX ix_weather_info_location_date"))
+        conn.execute(WeatherLocation.__table__.insert(), [{"id": 1, "city": "Oslo", "country": "NO", "lat": 59.9, "lon": 10.7}])
+        conn.execute(WeatherInfo.__table__.insert(), [
+            {"id": 1, "location_id": 1, "date": date(2025, 1, 1), "temperature": 1.0},
+            {"id": 2, "location_id": 1, "date": date(2025, 1, 1), "temperature": 2.0},
+            {"id": 3, "location_id": None, "date": date(2025, 1, 2), "temperature": 3.0},
+            {"id": 4, "location_id": None, "date": date(2025, 1, 2), "temperature": 4.0},
+            {"id": 5, "location_id": 1, "date": date(2025, 1, 2), "temperature": 5.0},
+        ])
+    return engine
+
+
+def test_location_date_index_keeps_rows_without_location(tmp_path):
+    engine = _old_database(tmp_path)
+    migrations.add_weather_info_location_date_index(engine)
+
+    with engine.connect() as conn:
+        ids = conn.execute(select(WeatherInfo.id).order_by(WeatherInfo.id)).scalars().all()
+        changes = conn.execute(select(ChangeLog.row_id, ChangeLog.location_id, ChangeLog.operation)).all()
+    assert ids == [1, 3, 4, 5]
+    assert changes == [(2, 1, "delete")]
+    assert "ix_weather_info_location_date" in {index["name"] for index in inspect(engine).get_indexes("weather_info")}
+
+
+def test_upgrade_is_idempotent(tmp_path):
+    engine = _old_database(tmp_path)
+    migrations.upgrade(engine)
+    migrations.upgrade(engine)
+
+    with engine.connect() as conn:
+        assert conn.execute(select(WeatherInfo.id).order_by(WeatherInfo.id)).scalars().all() == [1, 3, 4, 5]
+        assert len(conn.execute(select(ChangeLog.id)).all()) == 1
@@ -0,0 +1,44 @@
+import asyncio
+from datetime import date
+
+from app import crud, prefetch, weather_api
+
+
+def test_refresh_bypasses_the_cache_and_counts_upstream_calls(upstream, db):
+    location_id = crud.create_location(db, city="Bergen", country="NO", lat=60.4, lon=5.3).id
+
+    async def run():
+        # Users cached both responses just before the refresh
+        await weather_api.get_weather_by_city_async("Bergen", "NO")
+        await weather_api.get_forecast_by_city_async("Bergen", "NO")
+        upstream.temperature = 7.5
+        budget = prefetch.CallBudget(calls_per_minute=10)
+        written = await prefetch.refresh_location(location_id, "Bergen", "NO", budget)
+        return written, budget
+
+    written, budget = asyncio.run(run())
+
+    assert len(upstream.calls) == 4
+    assert budget._used == 2
+    assert written >= 1
+    assert crud.get_info_by_loc_date(db, location_id, date.today()).temperature == 7.5
+    # The refreshed responses replaced the cached ones
+    assert weather_api.get_weather_by_city("Bergen", "NO")["main"]["temp"] == 7.5
+    assert len(upstream.calls) == 4
+
+
+def test_call_budget_skips_cached_and_coalesced_calls(upstream):
+    used = []
+
+    async def acquire():
+        used.append(1)
+
+    async def run():
+        await weather_api.get_weather_by_city_async("Lima")
+        with weather_api.call_budget(acquire):
+            await weather_api.get_weather_by_city_async("Lima")
+            await asyncio.gather(*(weather_api.get_weather_by_city_async("Quito", refresh=True) for _ in range(3)))
+
+    asyncio.run(run())
+    assert len(used) == 1
+    assert len(upstream.calls) == 2
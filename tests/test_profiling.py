@@ -0,0 +1,45 @@
+import pytest
+
+from app import profiling
+
+
+def _scope(path="/locations/", **headers):
+    return {
+        "type": "http",
+        "path": path,
+        "headers": [(name.encode(), value.encode("latin-1")) for name, value in headers.items()],
+    }
+
+
+@pytest.fixture
+def token(monkeypatch):
+    monkeypatch.setattr(profiling.settings, "PROFILE_TOKEN", "s3cret")
+    monkeypatch.setattr(profiling.settings, "PROFILE_SAMPLE_RATE", 0.0)
+    return "s3cret"
+
+
+def test_trigger_compares_the_token_in_constant_time(token, monkeypatch):
+    compared = []
+
+    def compare_digest(a, b):
+        compared.append((a, b))
+        return a == b
+
+    monkeypatch.setattr(profiling.hmac, "compare_digest", compare_digest)
+    assert profiling._trigger(_scope(**{"x-profile": token})) == "header"
+    assert compared == [(b"s3cret", b"s3cret")]
+
+
+@pytest.mark.parametrize("value", ["", "s3cre", "s3cret2", "S3CRET", "s3crét"])
+def test_trigger_ignores_wrong_tokens(token, value):
+    assert profiling._trigger(_scope(**{"x-profile": value})) is None
+
+
+def test_trigger_skips_the_report_endpoints(token):
+    assert profiling._trigger(_scope("/debug/profiles", **{"x-profile": token})) is None
+
+
+def test_trigger_without_token(monkeypatch):
+    monkeypatch.setattr(profiling.settings, "PROFILE_TOKEN", None)
+    monkeypatch.setattr(profiling.settings, "PROFILE_SAMPLE_RATE", 0.0)
+    assert profiling._trigger(_scope(**{"x-profile": ""})) is None
@@ -0,0 +1,31 @@
+import pytest
+
+from app import rate_limit
+
+
+def test_worker_count(monkeypatch):
+    monkeypatch.delenv("RATE_LIMIT_WORKERS", raising=False)
+    monkeypatch.delenv("WEB_CONCURRENCY", raising=False)
+    assert rate_limit.worker_count() == 1
+    monkeypatch.setenv("WEB_CONCURRENCY", "4")
+    assert rate_limit.worker_count() == 4
+    monkeypatch.setenv("RATE_LIMIT_WORKERS", "6")
+    assert rate_limit.worker_count() == 6
+
+
+def test_workers_share_the_configured_limits():
+    bucket = rate_limit.TokenBucket("shared-test", rate=1.0, burst=10, daily_budget=1000, reserve=2, workers=4)
+    assert (bucket.rate, bucket.burst, bucket.daily_budget, bucket.reserve) == (0.25, 2.5, 250, 0.5)
+    stats = bucket.stats()
+    assert stats["workers"] == 4 and stats["burst"] == 2.5
+
+    # Two calls fit in this worker's share of the burst, the third must wait
+    bucket.acquire()
+    bucket.acquire()
+    with pytest.raises(rate_limit.RateLimitExceeded):
+        bucket.acquire(timeout=0.1)
+
+
+def test_workers_must_be_positive():
+    with pytest.raises(ValueError):
+        rate_limit.TokenBucket("invalid-test", rate=1.0, burst=1.0, workers=0)
@@ -0,0 +1,88 @@
+import random
+
+import pytest
+
+from app import spatial
+from app.spatial import SpatialIndex, haversine_km
+
+
+def _brute_force(points, lat, lon, k=None, radius_km=None):
+    found = sorted((haversine_km(lat, lon, plat, plon), point_id) for point_id, plat, plon in points)
+    if radius_km is not None:
+        found = [(distance, point_id) for distance, point_id in found if distance <= radius_km]
+    return found[:k] if k is not None else found
+
+
+def _distances(results):
+    return [round(distance, 6) for _, distance in results]
+
+
+@pytest.fixture
+def distance_calls(monkeypatch):
+    calls = []
+
+    def counted(*args):
+        calls.append(args)
+        return haversine_km(*args)
+
+    monkeypatch.setattr(spatial, "haversine_km", counted)
+    return calls
+
+
+@pytest.mark.parametrize("cell_degrees", [0.5, 1.0, 5.0])
+def test_high_latitudes_match_brute_force(cell_degrees):
+    rng = random.Random(cell_degrees)
+    points = [(i, rng.choice([1, -1]) * rng.uniform(60, 90), rng.uniform(-180, 180)) for i in range(500)]
+    index = SpatialIndex(cell_degrees)
+    index.rebuild(points)
+    for _ in range(50):
+        lat, lon = rng.choice([1, -1]) * rng.uniform(75, 90), rng.uniform(-180, 180)
+        k = rng.randint(1, 10)
+        assert _distances(index.nearest(lat, lon, k=k)) == [round(d, 6) for d, _ in _brute_force(points, lat, lon, k)]
+        radius = rng.uniform(10, 3000)
+        assert sorted(i for i, _ in index.nearest(lat, lon, k=None, radius_km=radius)) == sorted(
+            i for _, i in _brute_force(points, lat, lon, radius_km=radius)
+        )
+
+
+@pytest.mark.parametrize("size", [1, 5, 50])
+def test_sparse_index_matches_brute_force(size):
+    rng = random.Random(size)
+    points = [(i, rng.uniform(-90, 90), rng.uniform(-180, 180)) for i in range(size)]
+    index = SpatialIndex()
+    index.rebuild(points)
+    for _ in range(50):
+        lat, lon = rng.uniform(-90, 90), rng.uniform(-180, 180)
+        k = rng.randint(1, size + 2)
+        assert _distances(index.nearest(lat, lon, k=k)) == [round(d, 6) for d, _ in _brute_force(points, lat, lon, k)]
+
+
+def test_sparse_index_does_not_walk_empty_rings(monkeypatch):
+    index = SpatialIndex()
+    index.rebuild([(1, 10, 10), (2, -20, 100), (3, 50, -70), (4, 80, 0), (5, -85, 170)])
+    rings = []
+    ring = index._ring
+    monkeypatch.setattr(index, "_ring", lambda *args: rings.append(args) or ring(*args))
+
+    assert [point_id for point_id, _ in index.nearest(89.9, 0, k=2)] == [4, 3]
+    assert len(rings) <= 3
+
+
+def test_polar_query_only_measures_nearby_points(distance_calls):
+    rng = random.Random(7)
+    index = SpatialIndex()
+    index.rebuild((i, rng.uniform(-90, 90), rng.uniform(-180, 180)) for i in range(1000))
+    for lat in (89.9, 85.0, -88.0):
+        distance_calls.clear()
+        assert len(index.nearest(lat, 10.0, k=5)) == 5
+        assert len(distance_calls) < 100
+
+
+def test_updates_keep_rows_in_sync():
+    index = SpatialIndex()
+    index.add(1, 89.5, 0)
+    index.add(2, 89.5, 179)
+    index.add(1, -10, 20)
+    index.remove(2)
+    assert index.nearest(89.9, 0, k=3) == [(1, pytest.approx(haversine_km(89.9, 0, -10, 20)))]
+    assert index.stats()["cells"] == 1
@@ -0,0 +1,42 @@
+import asyncio
+import traceback
+
+import httpx
+import pytest
+
+from app import weather_api
+
+
+def test_negative_cache_raises_a_new_error_per_hit(upstream):
+    upstream.missing.add("nowhere")
+    errors, depths = [], []
+    for _ in range(5):
+        with pytest.raises(httpx.HTTPStatusError) as raised:
+            weather_api.get_weather_by_city("Nowhere")
+        errors.append(raised.value)
+        depths.append(len(traceback.extract_tb(raised.value.__traceback__)))
+
+    assert len(upstream.calls) == 1
+    assert all(error.response.status_code == 404 for error in errors)
+    assert len({id(error) for error in errors}) == len(errors)
+    # Cache hits must not extend the traceback of a shared exception
+    assert depths[1:] == [depths[1]] * (len(depths) - 1)
+
+
+def test_negative_cache_async(upstream):
+    upstream.missing.add("nowhere")
+
+    async def lookups():
+        errors = []
+        for _ in range(4):
+            try:
+                await weather_api.get_weather_by_city_async("Nowhere")
+            except httpx.HTTPStatusError as error:
+                errors.append(error)
+        return errors
+
+    errors = asyncio.run(lookups())
+    assert len(errors) == 4 and len(upstream.calls) == 1
+    assert len({id(error) for error in errors}) == len(errors)
+    depths = [len(traceback.extract_tb(error.__traceback__)) for error in errors[1:]]
+    assert depths == [depths[0]] * len(depths)